@@ -1,13 +1,14 @@
 # mongo_setup.py
-import pandas as pd
-from pymongo import MongoClient
 from datetime import datetime
 
+from ingest_transactions import ingest_csv, TIME_FORMAT
+from db_indexes import ensure_indexes
+from database import get_db
+
 # --------------------------
 # MongoDB Connection
 # --------------------------
-client = MongoClient("mongodb://localhost:27017/")
-db = client["upi_fraud_db"]
+db = get_db()
 
 # --------------------------
 # 1️⃣ Create collections
@@ -21,32 +22,58 @@ for col_name in collections:
         print(f"ℹ️ Collection '{col_name}' already exists.")
 
 # --------------------------
-# 2️⃣ Create indexes (if needed)
+# 2️⃣ Create indexes (declared in db_indexes.py; the app also applies them at startup)
 # --------------------------
-# Ensure blocked_senders has unique index on upi_id
-db.blocked_senders.create_index("upi_id", unique=True)
-print("✅ Index created on 'blocked_senders.upi_id'")
-
-# Optional: add indexes for transactions
-db.transactions.create_index("sender")
-db.transactions.create_index("receiver")
-db.transactions.create_index("time")
+for col_name, names in ensure_indexes(db).items():
+    print(f"✅ Indexes on '{col_name}': {', '.join(names)}")
 
 # --------------------------
 # 3️⃣ Insert sample data (optional)
 # --------------------------
+# Chunked, typed, resumable load; re-running it skips transactions already stored (unique txn_id)
 csv_file = "upi_transactions.csv"  # Your CSV file path
 try:
-    df = pd.read_csv(csv_file)
-    if not df.empty:
-        records = df.to_dict(orient="records")
-        db.transactions.insert_many(records)
-        print(f"✅ {len(records)} records inserted into 'transactions'")
-    else:
-        print("⚠️ CSV file is empty. No data inserted.")
+    totals = ingest_csv(csv_file, db.transactions)
+    print(f"✅ {totals['inserted']} records inserted into 'transactions' "
+          f"({totals['duplicates']} already present, {totals['rejected']} rejected)")
 except FileNotFoundError:
     print(f"⚠️ CSV file '{csv_file}' not found. Skipping data insert.")
 
+# --------------------------
+# Backfill lowercase search fields on flagged docs written before they existed
+# --------------------------
+result = db.flagged_transactions.update_many(
+    {"sender_lc": {"$exists": False}},
+    [{"$set": {
+        "sender_lc": {"$toLower": {"$ifNull": ["$sender", ""]}},
+        "receiver_lc": {"$toLower": {"$ifNull": ["$receiver", ""]}},
+    }}]
+)
+print(f"✅ Search fields backfilled on {result.modified_count} flagged transactions")
+
+# --------------------------
+# Give every document a `time` date, so listings and exports (which page and sort on
+# time) see one type: flagged docs written by the original API only carry the request's
+# ISO `timestamp` (or nothing, when it defaulted to the check time), and older API
+# versions and loads stored `time` as a string
+# --------------------------
+result = db.flagged_transactions.update_many(
+    {"time": {"$exists": False}},
+    [{"$set": {"time": {"$dateFromString": {
+        "dateString": "$timestamp", "onError": "$checked_at", "onNull": "$checked_at",
+    }}}}]
+)
+print(f"✅ Time backfilled from timestamp on {result.modified_count} flagged transactions")
+
+for col_name in ["flagged_transactions", "transactions"]:
+    result = db[col_name].update_many(
+        {"time": {"$type": "string"}},
+        [{"$set": {"time": {"$dateFromString": {
+            "dateString": "$time", "format": TIME_FORMAT, "onError": "$time",
+        }}}}]
+    )
+    print(f"✅ Time converted to a date on {result.modified_count} documents in '{col_name}'")
+
 # --------------------------
 # 4️⃣ Sample blocked_senders data (optional)
 # --------------------------
@@ -1,18 +1,33 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+import time
+_import_started = time.perf_counter()  # reported as the "import" startup phase
+
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response, g, stream_with_context
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from pymongo import MongoClient
-import pandas as pd
+import numpy as np
 from bson.json_util import dumps
 from bson.regex import Regex
+from pymongo.errors import PyMongoError
 from datetime import datetime, timezone
 import os
 from functools import wraps
 
 from flask_bcrypt import Bcrypt
-from block_sender_db import is_sender_blocked, block_sender
-from retrain_model import retrain_model
-from ml_predictor import predict_fraud_ml
+from block_sender_db import is_sender_blocked, block_sender, get_blocked_senders, block_senders, blocked_cache, blocked_senders
+from ml_predictor import predict_fraud_ml, predict_fraud_ml_batch
+from fraud_rules import RuleEngine, load_rules
+from velocity import VelocityTracker, SharedVelocityTracker, VELOCITY_FEATURES
+from flag_writer import FlaggedWriter
+from retrain_scheduler import RetrainScheduler
+from dashboard_stats import DashboardStats
+from pagination import keyset_page, prefix_search, CountCache
+from db_indexes import ensure_indexes
+from database import get_db, DASHBOARD_READ_PREFERENCE
+from auth import ApiKeyStore, RoleAuthorizer
+from shared_state import get_state
+import export
+import metrics
+from metrics import stage, timed
 
 
 import logging
@@ -29,16 +44,33 @@ logging.basicConfig(
 logger = logging.getLogger("UPIFraudDetection")
 
 
-# Simple blacklist
-BLACKLIST = {"scam@upi", "fraud123@okaxis", "spam@okhdfc"}
+# Upper bound on transactions accepted by /api/check_fraud/batch
+MAX_BATCH_SIZE = 10000
+
+# Per-client rate limit on the fraud-check endpoints (also applied by asgi.py)
+CHECK_FRAUD_LIMIT = os.environ.get("CHECK_FRAUD_LIMIT", "10/minute")
+
+# What a client is for the rate limit, first match wins: "api_key" (a X-API-Key header found in
+# `api_keys`), "sender" (the request's sender UPI ID, counted per verified API key), "ip" (remote
+# address, always available). Requests without a verified key are always counted by address,
+# since headers and payloads are the client's to choose.
+RATE_LIMIT_KEY = tuple(os.environ.get("RATE_LIMIT_KEY", "api_key,ip").split(","))
 
-# Counter for periodic retraining
-NEW_FLAGGED_COUNTER = 0
+# Periodic retraining
 N_RETRAIN = 500  # retrain after every 500 flagged transactions
 
+# Create missing indexes at startup (idempotent); set to 0 when a deploy step handles it
+ENSURE_INDEXES = os.environ.get("ENSURE_INDEXES", "1") == "1"
+
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 
 app = Flask(__name__)
-app.secret_key = "upi_fraud_detection"  # Replace with a strong secret in production!
+# Signs the session cookie, and with it the role claim admin routes trust without a user lookup
+app.secret_key = os.environ.get("SECRET_KEY")
+if not app.secret_key:
+    raise RuntimeError("SECRET_KEY is not set; generate one with: python -c 'import secrets; print(secrets.token_hex(32))'")
 bcrypt = Bcrypt(app)
 
 def login_required(f):
@@ -52,12 +84,73 @@ def login_required(f):
 
 
 # MongoDB setup
-client = MongoClient("mongodb://localhost:27017/")
-db = client["upi_fraud_db"]
+db = get_db()
 transactions_collection = db["transactions"]
 flagged = db["flagged_transactions"]
 
-limiter = Limiter(get_remote_address, app=app)
+# Dashboard listings and counts may be served by a secondary (MONGO_DASHBOARD_READ_PREFERENCE)
+reporting_db = get_db(read_preference=DASHBOARD_READ_PREFERENCE)
+
+if ENSURE_INDEXES:
+    try:
+        ensure_indexes(db)
+    except PyMongoError as e:
+        # MongoDB briefly unreachable: boot anyway (requests retry the connection); the next
+        # start, or `python adding_data_to_db.py`, creates the indexes
+        logger.error(f"⚠️ Could not ensure indexes at startup: {e}")
+
+# Admin routes trust the signed role claim in the session; users are re-read only when it expires
+authorizer = RoleAuthorizer(db["users"])
+
+# Rules are loaded and compiled once; evaluation needs no further DB round trips
+rule_engine = RuleEngine(load_rules(db), scope="online")
+
+# Rate limits, velocity windows and the retrain counter live here (STATE_URL);
+# with the default memory:// each worker keeps its own
+state = get_state()
+
+# Per-sender/receiver counts over 1m/5m/1d windows, in memory or in the shared state
+velocity_tracker = SharedVelocityTracker(state) if state.shared else VelocityTracker()
+
+# Listing totals: metadata counts when unfiltered, cached capped counts for searches
+count_cache = CountCache()
+
+# Fraud counts by day/hour/device, kept up to date as flagged documents are written
+dashboard_stats = DashboardStats(db["fraud_stats"], flagged)
+
+# Flagged inserts and block upserts are batched off the request path
+flag_writer = FlaggedWriter(flagged, blocked_senders, on_flagged=[dashboard_stats.record_flagged])
+
+# Flagged counter shared by all workers (Mongo, or the shared state); retrains run in a separate process
+retrain_scheduler = RetrainScheduler(db["counters"], threshold=N_RETRAIN, state=state if state.shared else None)
+
+
+# X-API-Key values the rate limit may count by
+api_keys = ApiKeyStore(db["api_keys"])
+
+
+def rate_limit_key_for(api_key, payload, remote_addr) -> str:
+    """The rate-limit identity of a request under RATE_LIMIT_KEY (also used by asgi.py)."""
+    # No key lookup when the address always wins
+    client = api_keys.verify(api_key) if api_key and RATE_LIMIT_KEY[0] != "ip" else None
+    if client is not None:
+        for source in RATE_LIMIT_KEY:
+            if source == "api_key":
+                return f"key:{client}"
+            if source == "sender" and isinstance(payload, dict) and payload.get("sender"):
+                return f"key:{client}:sender:{str(payload['sender']).lower()}"
+            if source == "ip":
+                break
+    return f"ip:{remote_addr}"
+
+
+def rate_limit_key() -> str:
+    payload = request.get_json(silent=True) if "sender" in RATE_LIMIT_KEY else None
+    return rate_limit_key_for(request.headers.get("X-API-Key"), payload, get_remote_address())
+
+
+# Counted in the shared state's storage, so the limit holds across workers when it is Redis
+limiter = Limiter(rate_limit_key, app=app, storage_uri=state.storage_uri)
 
 def role_required(required_role):
     def decorator(f):
@@ -65,8 +158,12 @@ def role_required(required_role):
         def decorated_function(*args, **kwargs):
             if not session.get("username"):
                 return redirect(url_for("login", next=request.path))
-            user = db["users"].find_one({"username": session["username"]})
-            if not user or user.get("role") != required_role:
+            role = authorizer.role(session)
+            if role is None:
+                # Revoked or deleted user: drop the session and ask for a fresh login
+                session.clear()
+                return redirect(url_for("login", next=request.path))
+            if role != required_role:
                 return redirect(url_for("test_fraud_check"))
             return f(*args, **kwargs)
         return decorated_function
@@ -118,9 +215,7 @@ def login():
 
         if user and bcrypt.check_password_hash(user["password"], password):
             # ✅ store login state
-            session["logged_in"] = True
-            session["username"] = username
-            session["role"] = user.get("role", "user")
+            authorizer.login(session, user)
             return redirect(next_url)
         else:
             return render_template("login.html", error="Invalid credentials", next=next_url)
@@ -136,146 +231,158 @@ def logout():
 
 
 
-def prepare_chart_data(df):
-    # Convert 'time' to datetime
-    df['time'] = pd.to_datetime(df['time'], errors='coerce')
-
-    # Fraud by Day
-    day_counts = df['time'].dt.date.value_counts().sort_index()
-    day_labels = [str(d) for d in day_counts.index]
-    day_data = day_counts.values.tolist()
-
-    # Fraud by Hour
-    hour_counts = df['time'].dt.hour.value_counts().sort_index()
-    hour_labels = [str(h) for h in hour_counts.index]
-    hour_data = hour_counts.values.tolist()
-
-    # Fraud by Device
-    device_counts = df['device'].value_counts()
-    device_labels = device_counts.index.tolist()
-    device_data = device_counts.values.tolist()
-
-    return {
-        'day_labels': day_labels,
-        'day_data': day_data,
-        'hour_labels': hour_labels,
-        'hour_data': hour_data,
-        'device_labels': device_labels,
-        'device_data': device_data
-    }
-
 @app.route("/", methods=["GET", "POST"])
 @role_required("admin")
 def index():
     query_upi = request.form.get("upi_id") or request.args.get("upi_id")
     page = int(request.args.get("page", 1))
     per_page = 25
-    skip = (page - 1) * per_page
-
-    query = {}
-    if query_upi:
 
-        if query_upi:
-            query["$or"] = [
-                {"sender": {"$regex": query_upi, "$options": "i"}},
-                {"receiver": {"$regex": query_upi, "$options": "i"}}
-            ]
+    # Prefix search on the lowercase sender/receiver copies, which is index-backed
+    query = prefix_search(query_upi) if query_upi else {}
 
-    total = flagged.count_documents(query)
-    results = list(flagged.find(query).skip(skip).limit(per_page))
-    df = pd.DataFrame(results)
-    charts = prepare_chart_data(df) if not df.empty else {}
+    total = count_cache.count(reporting_db["flagged_transactions"], query)
+    results, next_cursor, prev_cursor = keyset_page(
+        reporting_db["flagged_transactions"], query, per_page,
+        after=request.args.get("after"), before=request.args.get("before")
+    )
+    charts = dashboard_stats.chart_data()
 
 
     return render_template("index.html", transactions=results, charts=charts, query_upi=query_upi,
-                           page=page, total=total, per_page=per_page)
-
-
-@app.route('/api/check_fraud', methods=['POST'])
-@limiter.limit("10/minute")
-def check_fraud():
-    global NEW_FLAGGED_COUNTER
-
-    data = request.get_json()
-
-    # Extract transaction fields
-    sender = data.get("sender", "").lower()
-    receiver = data.get("receiver", "").lower()
-    amount = float(data.get("amount", 0))
-    device = data.get("device", "Unknown")
+                           page=page, total=total, per_page=per_page,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+# ------------------------
+# Single fraud check
+# ------------------------
+# Shared with the async endpoint in asgi.py, which runs the same steps
+# but overlaps the ML call with the blocked-sender lookup.
+def parse_check(data):
+    """
+    (sender, receiver, amount, device, dt) from a check request. Any body the
+    checks cannot use (not an object, a field of the wrong type, a bad amount
+    or timestamp) raises ValueError, which the routes answer with 400.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    fields = {"sender": "", "receiver": "", "device": "Unknown"}
+    for field, default in fields.items():
+        fields[field] = data.get(field, default)
+        if not isinstance(fields[field], str):
+            raise ValueError(f"{field} must be a string")
+    amount = data.get("amount", 0)
+    if isinstance(amount, bool) or not isinstance(amount, (int, float, str)):
+        raise ValueError("amount must be a number")
+    try:
+        amount = float(amount)
+    except ValueError:
+        raise ValueError("amount must be a number")
     timestamp = data.get("timestamp", datetime.utcnow().isoformat())
-
     try:
         dt = datetime.fromisoformat(timestamp)
-    except:
-        return jsonify({"error": "Invalid timestamp format"}), 400
+    except (TypeError, ValueError):
+        raise ValueError("Invalid timestamp format")
+    return fields["sender"].lower(), fields["receiver"].lower(), amount, fields["device"], dt
 
-    hour = dt.hour
-    reasons = []
 
-    # ------------------------
-    # ML prediction
-    # ------------------------
+def stored_time(dt):
+    """`time` as stored on flagged documents: a naive datetime to the second, like the offline jobs write."""
+    return dt.replace(tzinfo=None, microsecond=0)
+
+
+def ml_verdict(data, velocity) -> bool:
+    """ML prediction for one transaction; failures are logged and count as not fraud."""
     try:
-        ml_fraud = predict_fraud_ml(data)
+        with stage("ml_predict"):
+            ml_fraud = predict_fraud_ml(data, velocity)
         if ml_fraud:
-            reasons.append("Detected as fraud by ML model")
+            metrics.ML_FRAUD.inc()
+        return ml_fraud
     except Exception as e:
-        logger.error("⚠️ ML prediction failed:", e)
-
-    # ------------------------
-    # Rule-based checks
-    # ------------------------
-    BLACKLIST = {"scam@upi", "fraud123@okaxis", "spam@okhdfc"}
-
-    if sender in BLACKLIST or receiver in BLACKLIST:
-        reasons.append("Blacklisted UPI ID")
-
-    if is_sender_blocked(sender):
-        reasons.append(f"Sender {sender} already blocked")
-
-    if amount > 10000:
-        reasons.append("High transaction amount")
+        metrics.ERRORS.inc("ml_predict")
+        logger.error(f"⚠️ ML prediction failed: {e}")
+        return False
 
-    if hour < 5:
-        reasons.append("Transaction during suspicious hours")
 
-    allowed_devices = ["Android", "iOS", "Windows", "Linux"]
-    if device not in allowed_devices:
-        reasons.append("Unknown device")
+def finish_check(data, txn, velocity, ml_fraud, sender_blocked):
+    """Run the rules, queue the flagged document and block the sender if needed. Returns (is_fraud, reasons)."""
+    sender, receiver, amount, device, dt = txn
+    reasons = ["Detected as fraud by ML model"] if ml_fraud else []
 
+    # ------------------------
+    # Rule-based checks (per-rule timings are kept by the rule engine)
+    # ------------------------
+    with stage("rules"):
+        reasons += rule_engine.evaluate({
+            "sender": sender,
+            "receiver": receiver,
+            "amount": amount,
+            "device": device,
+            "hour": dt.hour,
+            "day_of_week": dt.weekday(),
+            "sender_blocked": sender_blocked,
+            **velocity,
+        })
 
     is_fraud = len(reasons) > 0
+    metrics.CHECKS.inc("check_fraud", "fraud" if is_fraud else "legit")
 
     # ------------------------
-    # Log flagged transaction
+    # Log flagged transaction (queued, written in batches)
     # ------------------------
     data["checked_at"] = datetime.now(timezone.utc)
+    data["time"] = stored_time(dt)
+    data["sender_lc"] = sender
+    data["receiver_lc"] = receiver
     data["is_fraud"] = is_fraud
     data["fraud_reasons"] = reasons
-    flagged.insert_one(data)
+    with stage("flag_submit"):
+        flag_writer.submit_flagged(data)
 
     # ------------------------
-    # Auto-block sender if fraud
+    # Auto-block sender if fraud (velocity rules only flag, see fraud_rules.DEFAULT_RULES)
     # ------------------------
-    if is_fraud and not is_sender_blocked(sender):
+    if is_fraud and not sender_blocked and rule_engine.blocks(reasons):
         reason_str = "; ".join(reasons)
-        block_sender(sender, reason=reason_str)
+        with stage("block_sender"):
+            block_sender(sender, reason=reason_str, writer=flag_writer)
         logger.info(f"🚫 Sender {sender} blocked for reasons: {reason_str}")
 
+    return is_fraud, reasons
+
+
+@app.route('/api/check_fraud', methods=['POST'])
+@limiter.limit(CHECK_FRAUD_LIMIT)
+@timed("check_fraud")
+def check_fraud():
+    # Undecodable JSON reaches parse_check as None, so it gets the same JSON 400 as the async route
+    data = request.get_json(silent=True)
+    with stage("parse"):
+        try:
+            txn = parse_check(data)
+        except ValueError as e:
+            metrics.ERRORS.inc("parse")
+            return jsonify({"error": str(e)}), 400
+    sender, receiver, amount, device, dt = txn
+
     # ------------------------
-    # Increment counter & retrain ML model after # of transactions
+    # Velocity features (includes this transaction)
     # ------------------------
-    if is_fraud:
-        NEW_FLAGGED_COUNTER += 1
+    with stage("velocity"):
+        velocity = velocity_tracker.record(sender, receiver, amount, dt)
 
-    if NEW_FLAGGED_COUNTER >= N_RETRAIN:
-        logger.info(f"🔄 Retraining ML model after {NEW_FLAGGED_COUNTER} flagged transactions...")
-        try:
-            retrain_model()
-        except Exception as e:
-            logger.error("⚠️ Retraining failed:", e)
-        NEW_FLAGGED_COUNTER = 0  # reset counter
+    ml_fraud = ml_verdict(data, velocity)
+    with stage("blocked_lookup"):
+        sender_blocked = is_sender_blocked(sender)
+    is_fraud, reasons = finish_check(data, txn, velocity, ml_fraud, sender_blocked)
+
+    # ------------------------
+    # Increment counter & retrain ML model after # of transactions
+    # ------------------------
+    with stage("retrain_trigger"):
+        retrain_scheduler.record(1 if is_fraud else 0)
 
     # ------------------------
     # Response
@@ -286,6 +393,252 @@ def check_fraud():
     })
 
 
+@app.route('/api/check_fraud/batch', methods=['POST'])
+@limiter.limit(CHECK_FRAUD_LIMIT)
+@timed("check_fraud_batch")
+def check_fraud_batch():
+    payload = request.get_json(silent=True)
+    items = payload.get("transactions") if isinstance(payload, dict) else payload
+
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a list of transactions"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE})"}), 413
+    metrics.BATCH_ROWS.observe(len(items))
+
+    # ------------------------
+    # Parse the batch, keeping invalid entries in place
+    # ------------------------
+    results = [None] * len(items)
+    parsed = []  # (index, data, dt, amount)
+    senders, receivers, devices = [], [], []
+    for i, data in enumerate(items):
+        # Same validation as a single check; a bad entry gets its own error and the rest go on
+        try:
+            sender, receiver, amount, device, dt = parse_check(data)
+        except ValueError as e:
+            results[i] = {"error": f"Invalid transaction: {e}"}
+            continue
+        parsed.append((i, data, dt, amount))
+        senders.append(sender)
+        receivers.append(receiver)
+        devices.append(device)
+
+    # ------------------------
+    # Velocity features, counted in input order
+    # ------------------------
+    with stage("batch_velocity"):
+        velocity = velocity_tracker.record_many(
+            (sender, receiver, amount, dt)
+            for (_, _, dt, amount), sender, receiver in zip(parsed, senders, receivers)
+        )
+
+    # ------------------------
+    # ML prediction, one model call for the whole batch
+    # ------------------------
+    try:
+        with stage("batch_ml_predict"):
+            ml_preds = predict_fraud_ml_batch([p[1] for p in parsed], velocity)
+    except Exception as e:
+        metrics.ERRORS.inc("batch_ml_predict")
+        logger.error(f"⚠️ Batch ML prediction failed: {e}")
+        ml_preds = [False] * len(parsed)
+    metrics.ML_FRAUD.inc(amount=sum(1 for p in ml_preds if p))
+
+    # ------------------------
+    # Rule-based checks over the whole batch as columns
+    # ------------------------
+    with stage("batch_blocked_lookup"):
+        blocked = get_blocked_senders(senders)
+    columns = {
+        "sender": senders,
+        "receiver": receivers,
+        "amount": np.array([p[3] for p in parsed], dtype=np.float64),
+        "device": devices,
+        "hour": np.array([p[2].hour for p in parsed], dtype=np.int8),
+        "day_of_week": np.array([p[2].weekday() for p in parsed], dtype=np.int8),
+        "sender_blocked": np.array([s in blocked for s in senders], dtype=bool),
+    }
+    for feature in VELOCITY_FEATURES:
+        columns[feature] = np.array([v[feature] for v in velocity])
+    with stage("batch_rules"):
+        rule_hits = rule_engine.evaluate_batch(columns, len(parsed))
+
+    checked_at = datetime.now(timezone.utc)
+    docs = []
+    to_block = {}
+    for (i, data, dt, _), sender, receiver, ml_fraud, rule_reasons in zip(parsed, senders, receivers, ml_preds, rule_hits):
+        reasons = ["Detected as fraud by ML model"] if ml_fraud else []
+        reasons += rule_reasons
+        is_fraud = len(reasons) > 0
+
+        docs.append(dict(data, checked_at=checked_at, time=stored_time(dt),
+                         sender_lc=sender, receiver_lc=receiver,
+                         is_fraud=is_fraud, fraud_reasons=reasons))
+        if is_fraud and sender not in blocked and sender not in to_block and rule_engine.blocks(reasons):
+            to_block[sender] = "; ".join(reasons)
+
+        results[i] = {
+            "is_fraud": is_fraud,
+            "reasons": reasons if reasons else ["Legit transaction"]
+        }
+
+    # ------------------------
+    # Log flagged transactions & auto-block senders in bulk
+    # ------------------------
+    n_fraud = sum(1 for d in docs if d["is_fraud"])
+    metrics.CHECKS.inc("check_fraud_batch", "fraud", amount=n_fraud)
+    metrics.CHECKS.inc("check_fraud_batch", "legit", amount=len(docs) - n_fraud)
+
+    with stage("batch_flag_submit"):
+        flag_writer.submit_flagged_many(docs)
+    if to_block:
+        with stage("batch_block_senders"):
+            block_senders(to_block, writer=flag_writer)
+        logger.info(f"🚫 {len(to_block)} senders blocked from batch of {len(items)}")
+
+    with stage("batch_retrain_trigger"):
+        retrain_scheduler.record(n_fraud)
+
+    return jsonify({"results": results})
+
+
+@app.route("/api/stats/blocked-cache")
+@role_required("admin")
+def blocked_cache_stats():
+    return jsonify(blocked_cache.stats())
+
+
+@app.route("/api/stats/rules")
+@role_required("admin")
+def rule_stats():
+    return jsonify(rule_engine.stats())
+
+
+@app.route("/api/stats/velocity")
+@role_required("admin")
+def velocity_stats():
+    return jsonify(velocity_tracker.stats())
+
+
+@app.route("/api/stats/flag-writer")
+@role_required("admin")
+def flag_writer_stats():
+    return jsonify(flag_writer.stats())
+
+
+@app.route("/api/stats/retrain")
+@role_required("admin")
+def retrain_status():
+    return jsonify(retrain_scheduler.status())
+
+
+# ------------------------
+# Export
+# ------------------------
+def _export_query():
+    """Filters shared by /export and /export/summary; ValueError on a bad date."""
+    return export.build_query(
+        since=export.parse_day(request.args.get("since")),
+        until=export.parse_day(request.args.get("until"), end=True),
+        reasons=request.args.getlist("reason"),
+        fraud_only=request.args.get("all") != "1",
+    )
+
+
+@app.route("/export")
+@role_required("admin")
+def export_flagged():
+    fmt = request.args.get("format", "csv")
+    compress = request.args.get("gzip", "1") == "1"
+    if fmt not in export.FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(export.FORMATS)}"}), 400
+    try:
+        query = _export_query()
+    except ValueError:
+        return jsonify({"error": "Invalid since/until date"}), 400
+
+    # Streamed from the cursor as it is read; nothing is buffered beyond one chunk
+    body = export.stream_export(reporting_db["flagged_transactions"], fmt, query, compress)
+    headers = {"Content-Disposition": f"attachment; filename={export.filename(fmt, compress)}"}
+    mimetype = "application/gzip" if compress and fmt != "parquet" else export.FORMATS[fmt]
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
+@app.route("/export/summary")
+@role_required("admin")
+def export_summary():
+    try:
+        query = _export_query()
+    except ValueError:
+        return jsonify({"error": "Invalid since/until date"}), 400
+    return jsonify(export.breakdowns(reporting_db["flagged_transactions"], query))
+
+
+# ------------------------
+# Prometheus metrics & profiling
+# ------------------------
+def _component_metrics():
+    rules = rule_engine.stats()
+    writer = flag_writer.stats()
+    cache = blocked_cache.stats()
+    auth = authorizer.stats()
+    return [
+        ("upi_rule_evaluations_total", "counter", "Rows evaluated by each rule",
+         [({"rule": r["rule"]}, r["calls"]) for r in rules]),
+        ("upi_rule_matches_total", "counter", "Rows matched by each rule (fraud reasons)",
+         [({"rule": r["rule"]}, r["matches"]) for r in rules]),
+        ("upi_rule_seconds_total", "counter", "Time spent evaluating each rule",
+         [({"rule": r["rule"]}, r["total_ms"] / 1000) for r in rules]),
+        ("upi_flag_writer_queued", "gauge", "Writes waiting in the flagged writer queue",
+         [({}, writer["queued"])]),
+        ("upi_flag_writer_failures_total", "counter", "Flagged writer writes given up after retries",
+         [({}, writer["failures"])]),
+        ("upi_flag_writer_dropped_total", "counter", "Documents the flagged writer could not write",
+         [({"kind": "flagged"}, writer["dropped_flagged"]), ({"kind": "block"}, writer["dropped_blocks"])]),
+        ("upi_flag_writer_backpressure_total", "counter", "Writes done inline because the queue was full",
+         [({}, writer["backpressure"])]),
+        ("upi_blocked_cache_size", "gauge", "Blocked senders held in memory",
+         [({}, cache["size"])]),
+        ("upi_blocked_cache_lookups_total", "counter", "Blocked-sender lookups by result",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("upi_role_checks_total", "counter", "Role checks by outcome (trusted claim, refreshed, rejected)",
+         [({"result": k}, auth[k]) for k in ("trusted", "refreshed", "rejected")]),
+        ("upi_user_cache_lookups_total", "counter", "User record lookups by result",
+         [({"result": "hit"}, auth["hits"]), ({"result": "miss"}, auth["misses"])]),
+    ]
+
+
+metrics.REGISTRY.register_collector(_component_metrics)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render_latest(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/profile", methods=["GET", "POST"])
+@role_required("admin")
+def sampling_profile():
+    """POST ?seconds=30&interval_ms=5 starts a profiling window; GET ?format=folded returns the stacks."""
+    if request.method == "POST":
+        try:
+            seconds = float(request.args.get("seconds", 30))
+            interval = float(request.args.get("interval_ms", metrics.PROFILE_INTERVAL * 1000)) / 1000
+        except ValueError:
+            return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+        if not (seconds > 0 and interval > 0):
+            return jsonify({"error": "seconds and interval_ms must be positive"}), 400
+        if not metrics.profiler.start(seconds, interval):
+            return jsonify({"error": "Profiler already running", **metrics.profiler.status()}), 409
+        return jsonify(metrics.profiler.status())
+    if request.args.get("format") == "folded":
+        return Response(metrics.profiler.folded(), mimetype="text/plain")
+    return jsonify(metrics.profiler.status())
+
+
 @app.route("/test-fraud-check")
 @login_required
 def test_fraud_check():
@@ -297,14 +650,11 @@ def test_fraud_check():
 def all_transactions():
     page = int(request.args.get("page", 1))
     per_page = 20
-    total = transactions_collection.count_documents({})
-
-    txns = (
-        transactions_collection
-        .find({})
-        .sort("time", -1)
-        .skip((page - 1) * per_page)
-        .limit(per_page)
+    total = count_cache.count(reporting_db["transactions"], {})
+
+    txns, next_cursor, prev_cursor = keyset_page(
+        reporting_db["transactions"], {}, per_page,
+        after=request.args.get("after"), before=request.args.get("before")
     )
 
     return render_template(
@@ -313,6 +663,8 @@ def all_transactions():
         page=page,
         per_page=per_page,
         total=total,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
         role=session.get("role")   # 👈 pass role explicitly
     )
 
@@ -322,6 +674,27 @@ def inject_user():
     return dict(session=session)
 
 
+# ------------------------
+# Startup timing
+# ------------------------
+@app.before_request
+def _start_first_request_timer():
+    if "first_request" not in metrics.STARTUP_SECONDS:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_first_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # Includes whatever was deferred to first use (model load, blocked-sender cache)
+        metrics.record_startup("first_request", time.perf_counter() - started)
+    return response
+
+
+metrics.record_startup("import", time.perf_counter() - _import_started)
+
+
 if __name__ == "__main__":
     logger.info("🚀 Starting UPI Fraud Detection Flask app...")
     app.run(debug=True)
@@ -0,0 +1,138 @@
+"""
+ASGI entry point: POST /api/check_fraud is served natively on the event
+loop, every other route by the Flask app unchanged.
+
+    uvicorn asgi:application --workers 4
+
+A check holds no thread while it waits: the blocked-sender lookup runs on
+PyMongo's asyncio client concurrently with the ML prediction, which runs in
+a small thread pool (NumPy releases the GIL for most of it). Rules, velocity
+windows, the write-behind writer and the metrics are the ones the Flask app
+uses, so both entry points produce the same verdicts and documents.
+"""
+import asyncio
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from limits import parse as parse_limit
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as flask_app
+import metrics
+from block_sender_db import blocked_cache
+from database import get_async_db
+from metrics import stage
+from ml_predictor import preload
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Threads running model predictions; more than the cores only adds contention
+MODEL_THREADS = int(os.environ.get("ASGI_MODEL_THREADS", os.cpu_count() or 4))
+# Threads serving the Flask routes (dashboard, batch API, admin)
+WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", 16))
+
+CHECK_LIMIT = parse_limit(flask_app.CHECK_FRAUD_LIMIT)
+
+model_pool = ThreadPoolExecutor(max_workers=MODEL_THREADS, thread_name_prefix="model")
+adb = get_async_db()
+
+
+# A Redis state backend is network I/O: keep its calls off the event loop
+SHARED_STATE = flask_app.state.shared
+
+
+def _rate_limited(request, data) -> bool:
+    # Same limiter, storage and client identity (RATE_LIMIT_KEY) as the Flask routes
+    limiter = flask_app.limiter
+    if not limiter.enabled:
+        return False
+    client = flask_app.rate_limit_key_for(request.headers.get("x-api-key"), data,
+                                          request.client.host if request.client else "unknown")
+    return not limiter.limiter.hit(CHECK_LIMIT, "check_fraud", client)
+
+
+async def _off_loop(fn, *args):
+    return await asyncio.to_thread(fn, *args) if SHARED_STATE else fn(*args)
+
+
+async def check_fraud(request):
+    start = time.perf_counter()
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        # Limited before the body is validated, like the Flask route; an API key may need a
+        # lookup in `api_keys`, so that also runs off the loop
+        if SHARED_STATE or "x-api-key" in request.headers:
+            limited = await asyncio.to_thread(_rate_limited, request, data)
+        else:
+            limited = _rate_limited(request, data)
+        if limited:
+            return JSONResponse({"error": f"Rate limit exceeded ({flask_app.CHECK_FRAUD_LIMIT})"}, status_code=429)
+        if data is None:
+            metrics.ERRORS.inc("parse")
+            return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+
+        with stage("parse"):
+            try:
+                txn = flask_app.parse_check(data)
+            except ValueError as e:
+                metrics.ERRORS.inc("parse")
+                return JSONResponse({"error": str(e)}, status_code=400)
+        sender, receiver, amount, _, dt = txn
+
+        with stage("velocity"):
+            velocity = await _off_loop(flask_app.velocity_tracker.record, sender, receiver, amount, dt)
+
+        # ML on the pool while the event loop serves the blocked lookup (and other requests)
+        loop = asyncio.get_running_loop()
+        ml_future = loop.run_in_executor(model_pool, flask_app.ml_verdict, data, velocity)
+        with stage("blocked_lookup"):
+            sender_blocked = await blocked_cache.contains_async(sender, adb["blocked_senders"])
+        ml_fraud = await ml_future
+
+        if flask_app.flag_writer.saturated():
+            # Writer queue full: its backpressure path writes inline, keep that off the loop
+            is_fraud, reasons = await asyncio.to_thread(
+                flask_app.finish_check, data, txn, velocity, ml_fraud, sender_blocked)
+        else:
+            is_fraud, reasons = flask_app.finish_check(data, txn, velocity, ml_fraud, sender_blocked)
+
+        with stage("retrain_trigger"):
+            await flask_app.retrain_scheduler.record_async(1 if is_fraud else 0, adb["counters"])
+
+        return JSONResponse({
+            "is_fraud": is_fraud,
+            "reasons": reasons if reasons else ["Legit transaction"]
+        })
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, "check_fraud_async")
+
+
+@asynccontextmanager
+async def lifespan(_):
+    # Load the model before the first request rather than inside it
+    try:
+        await asyncio.get_running_loop().run_in_executor(model_pool, preload)
+    except Exception as e:
+        logger.error(f"⚠️ Could not preload the model, loading on first check: {e}")
+    logger.info(f"🚀 ASGI app ready ({MODEL_THREADS} model threads, {WSGI_THREADS} WSGI threads)")
+    yield
+    flask_app.flag_writer.close()
+    model_pool.shutdown(wait=False)
+
+
+application = Starlette(
+    routes=[
+        Route("/api/check_fraud", check_fraud, methods=["POST"]),
+        Mount("/", app=WSGIMiddleware(flask_app.app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
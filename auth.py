@@ -0,0 +1,297 @@
+"""
+Role authorization without a user lookup per request.
+
+Login stores a role claim in the session: the role, the user's
+`role_version` at that moment and an expiry. Flask signs the session cookie
+with app.secret_key (SECRET_KEY, required), so the claim cannot be edited
+client-side. While the claim is fresh it is trusted without reading the
+user; once it expires the user record is re-read (through a small LRU) and
+the claim is re-issued, or the session is rejected if the role version
+moved on.
+
+API clients are identified by keys kept (as SHA-256 digests) in `api_keys`;
+ApiKeyStore.verify() is what the rate limiter trusts an X-API-Key header by.
+
+Changing a user's role or revoking their sessions bumps `role_version` and
+stamps `role_changed_at`. Every process polls for such changes each
+REVOCATION_POLL_INTERVAL seconds, drops the users' cached records and
+rejects older claims from then on, so a revoked or demoted admin loses
+access within that interval rather than when the claim expires:
+
+    python auth.py revoke alice
+    python auth.py set-role alice admin
+    python auth.py add-key payments-gateway     # prints a new API key
+    python auth.py revoke-key payments-gateway
+"""
+import hashlib
+import os
+import secrets
+import sys
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Seconds a role claim is trusted before the user record is checked again
+ROLE_CLAIM_TTL = int(os.environ.get("ROLE_CLAIM_TTL", 300))
+
+# In-process user records for claim refreshes
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL = 60
+
+# How often each process looks for revoked sessions and role changes (seconds)
+REVOCATION_POLL_INTERVAL = float(os.environ.get("REVOCATION_POLL_INTERVAL", 10))
+# Extra look-back for clock skew between the host that revoked and this one (seconds)
+REVOCATION_POLL_OVERLAP = 60
+
+USER_FIELDS = {"_id": 0, "username": 1, "role": 1, "role_version": 1}
+
+# Verified (and rejected) API keys are remembered this long (seconds) ...
+API_KEY_CACHE_TTL = 60
+# ... for at most this many keys
+API_KEY_CACHE_SIZE = 4096
+
+
+class UserCache:
+    """LRU of user records (without password hashes), each kept for `ttl` seconds."""
+
+    def __init__(self, collection, size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.collection = collection
+        self.size = size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._users.get(username)
+            if hit and now - hit[1] < self.ttl:
+                self._users.move_to_end(username)
+                self.hits += 1
+                return hit[0]
+            self.misses += 1
+
+        user = self.collection.find_one({"username": username}, USER_FIELDS)
+        with self._lock:
+            if user is None:
+                self._users.pop(username, None)
+            else:
+                self._users[username] = (user, now)
+                self._users.move_to_end(username)
+                while len(self._users) > self.size:
+                    self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, username):
+        with self._lock:
+            self._users.pop(username, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._users), "hits": self.hits, "misses": self.misses}
+
+
+class ApiKeyStore:
+    """
+    API keys checked against `api_keys` ({key_sha256, client, active}), with
+    results cached for API_KEY_CACHE_TTL seconds. Only the digest is stored,
+    so the collection does not hold usable keys.
+    """
+
+    def __init__(self, collection, ttl=API_KEY_CACHE_TTL, size=API_KEY_CACHE_SIZE):
+        self.collection = collection
+        self.ttl = ttl
+        self.size = size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+
+    @staticmethod
+    def digest(api_key) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    def verify(self, api_key):
+        """The client name `api_key` belongs to, or None if it is unknown or revoked."""
+        if not api_key:
+            return None
+        digest = self.digest(api_key)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._keys.get(digest)
+        if hit and now - hit[1] < self.ttl:
+            client = hit[0]
+        else:
+            try:
+                doc = self.collection.find_one({"key_sha256": digest, "active": True}, {"_id": 0, "client": 1})
+            except PyMongoError as e:
+                # Unverifiable keys count as no key: the caller falls back to the client address
+                logger.warning(f"⚠️ API key lookup failed: {e}")
+                return None
+            client = doc["client"] if doc else None
+            with self._lock:
+                self._keys[digest] = (client, now)
+                self._keys.move_to_end(digest)
+                while len(self._keys) > self.size:
+                    self._keys.popitem(last=False)
+        if client is None:
+            self.rejected += 1
+        else:
+            self.accepted += 1
+        return client
+
+    def create(self, client) -> str:
+        """Issue a new key for `client`; the key itself is only ever returned here."""
+        api_key = secrets.token_urlsafe(32)
+        self.collection.insert_one({"key_sha256": self.digest(api_key), "client": client, "active": True,
+                                    "created_at": datetime.utcnow()})
+        return api_key
+
+    def revoke(self, client) -> int:
+        """Deactivate every key of `client`; other processes notice within API_KEY_CACHE_TTL."""
+        result = self.collection.update_many({"client": client, "active": True}, {"$set": {"active": False}})
+        with self._lock:
+            self._keys.clear()
+        return result.modified_count
+
+    def stats(self) -> dict:
+        return {"cached": len(self._keys), "accepted": self.accepted, "rejected": self.rejected}
+
+
+class RoleAuthorizer:
+    """Issues and checks the session role claim; see the module docstring."""
+
+    def __init__(self, collection, ttl=ROLE_CLAIM_TTL, cache=None, poll_interval=REVOCATION_POLL_INTERVAL):
+        self.collection = collection
+        self.ttl = ttl
+        self.users = cache or UserCache(collection)
+        self.poll_interval = poll_interval
+        # Current role_version of users whose role changed recently, honoured before their claims expire
+        self._min_version = {}
+        self._last_poll = None
+        self._lock = threading.Lock()
+        self.trusted = 0
+        self.refreshed = 0
+        self.rejected = 0
+
+    def _claim(self, user) -> dict:
+        return {
+            "user": user["username"],
+            "role": user.get("role", "user"),
+            "ver": user.get("role_version", 0),
+            "exp": time.time() + self.ttl,
+        }
+
+    def login(self, session, user):
+        """Store the login state and a fresh role claim for `user` (a full users document)."""
+        session["logged_in"] = True
+        session["username"] = user["username"]
+        session["role"] = user.get("role", "user")
+        session["role_claim"] = self._claim(user)
+        self.users.invalidate(user["username"])
+
+    def poll_revocations(self, force=False):
+        """
+        Pick up role changes made by any process. Only changes newer than the
+        claim TTL matter: an older claim has expired and is re-checked anyway.
+        """
+        now = time.monotonic()
+        if not force and self._last_poll is not None and now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        since = datetime.utcnow() - timedelta(seconds=self.ttl + REVOCATION_POLL_OVERLAP)
+        try:
+            changed = list(self.collection.find({"role_changed_at": {"$gte": since}}, USER_FIELDS))
+        except PyMongoError as e:
+            logger.warning(f"⚠️ Revocation poll failed: {e}")
+            return
+        for user in changed:
+            username, version = user["username"], user.get("role_version", 0)
+            with self._lock:
+                if version <= self._min_version.get(username, -1):
+                    continue
+                self._min_version[username] = version
+            self.users.invalidate(username)
+
+    def role(self, session):
+        """The session user's role, or None if the session is no longer valid (caller clears it)."""
+        username = session.get("username")
+        if not username:
+            return None
+
+        self.poll_revocations()
+
+        claim = session.get("role_claim")
+        if claim and claim.get("user") == username:
+            with self._lock:
+                revoked = claim.get("ver", 0) < self._min_version.get(username, 0)
+            if not revoked and claim.get("exp", 0) > time.time():
+                self.trusted += 1
+                return claim["role"]
+        else:
+            # Sessions from before claims were issued are checked once and upgraded
+            claim = None
+
+        user = self.users.get(username)
+        if user is None or (claim and claim.get("ver", 0) != user.get("role_version", 0)):
+            self.rejected += 1
+            return None
+
+        self.refreshed += 1
+        session["role"] = user.get("role", "user")
+        session["role_claim"] = self._claim(user)
+        return session["role"]
+
+    def revoke(self, username, role=None):
+        """Invalidate every session of `username`, optionally changing their role."""
+        update = {"$inc": {"role_version": 1}, "$set": {"role_changed_at": datetime.utcnow()}}
+        if role is not None:
+            update["$set"]["role"] = role
+        user = self.collection.find_one_and_update(
+            {"username": username}, update, projection=USER_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        if user is None:
+            return False
+        with self._lock:
+            self._min_version[username] = user["role_version"]
+        self.users.invalidate(username)
+        logger.info(f"🔒 Revoked sessions for {username} (role_version {user['role_version']})")
+        return True
+
+    def stats(self) -> dict:
+        return dict(self.users.stats(), trusted=self.trusted, refreshed=self.refreshed, rejected=self.rejected)
+
+
+if __name__ == "__main__":
+    from database import get_db
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    usage = ("usage: python auth.py revoke <username> | set-role <username> <role>"
+             " | add-key <client> | revoke-key <client>")
+    if len(sys.argv) < 3 or sys.argv[1] not in ("revoke", "set-role", "add-key", "revoke-key"):
+        sys.exit(usage)
+
+    if sys.argv[1] == "add-key":
+        print(ApiKeyStore(get_db()["api_keys"]).create(sys.argv[2]))
+        sys.exit(0)
+    if sys.argv[1] == "revoke-key":
+        revoked = ApiKeyStore(get_db()["api_keys"]).revoke(sys.argv[2])
+        logger.info(f"🔒 Deactivated {revoked} API keys of {sys.argv[2]}")
+        sys.exit(0 if revoked else f"❌ No active API keys for {sys.argv[2]}")
+
+    authorizer = RoleAuthorizer(get_db()["users"])
+    role = sys.argv[3] if sys.argv[1] == "set-role" and len(sys.argv) > 3 else None
+    if sys.argv[1] == "set-role" and role is None:
+        sys.exit("usage: python auth.py set-role <username> <role>")
+    if not authorizer.revoke(sys.argv[2], role=role):
+        sys.exit(f"❌ No user named {sys.argv[2]}")
@@ -0,0 +1,415 @@
+"""
+Benchmarks for the fraud-check hot path.
+
+Seeds a Mongo stand-in with fake_data transactions, then measures:
+  - retrain_model: wall time and peak memory (full refit, then incremental)
+  - POST /api/check_fraud and /api/check_fraud/batch: p50/p99 latency and throughput
+  - predict_fraud_ml per row vs predict_fraud_ml_batch
+  - is_sender_blocked lookups
+  - cold start: `import app` and the first request, in a fresh interpreter
+
+Results are written as JSON (one file per run, named after the git commit)
+so runs can be compared with --compare.
+
+    python benchmarks/run_benchmarks.py --rows 10000
+    python benchmarks/run_benchmarks.py --rows 1000000 --mongo-uri mongodb://localhost:27018/
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/a.json benchmarks/results/b.json
+
+Without --mongo-uri the database is mongomock (in requirements.txt), which
+measures the application code but not real server round trips. A --mongo-uri
+must point at a disposable mongod: its upi_fraud_db is dropped first.
+--state-url (e.g. redis://localhost:6379/15) keeps rate limits, velocity
+windows and the retrain counter in that server instead of in memory.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+INSERT_CHUNK = 10000
+
+
+# ------------------------
+# Measurement helpers
+# ------------------------
+def latency_summary(samples, total_seconds=None, items=None) -> dict:
+    ms = np.asarray(samples) * 1000.0
+    summary = {
+        "count": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "max_ms": round(float(ms.max()), 4),
+    }
+    total = total_seconds if total_seconds is not None else float(np.sum(samples))
+    summary["per_second"] = round((items or len(ms)) / total, 1) if total > 0 else None
+    return summary
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is KiB on Linux, bytes on macOS; only used where /proc is missing
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class PeakMemory:
+    """Sample RSS every few milliseconds while the block runs; reports the peak above the start."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start = _rss_bytes()
+        self.peak = self.start
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+    @property
+    def peak_delta_mb(self):
+        return round((self.peak - self.start) / 2 ** 20, 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ------------------------
+# Environment setup
+# ------------------------
+def patch_mongomock():
+    """
+    pymongo 4.13's UpdateOne/ReplaceOne pass `sort` into the bulk builder, which
+    mongomock 4.3 does not accept: drop it (it is never set by this app).
+    """
+    from mongomock.collection import BulkOperationBuilder
+
+    for name in ("add_update", "add_replace"):
+        original = getattr(BulkOperationBuilder, name)
+        if getattr(original, "_drops_sort", False):
+            continue
+
+        def without_sort(self, *args, _original=original, sort=None, **kwargs):
+            return _original(self, *args, **kwargs)
+
+        without_sort._drops_sort = True
+        setattr(BulkOperationBuilder, name, without_sort)
+
+
+def use_mongo(uri=None, drop=True):
+    """
+    Point the shared client (database.py) at the benchmark database: one
+    mongomock store, or the given disposable server. Returns the database.
+    """
+    import database
+
+    if uri is None:
+        import mongomock
+        from mongomock.store import ServerStore
+
+        patch_mongomock()
+        store = ServerStore()
+        database.create_client = lambda uri=None, **overrides: mongomock.MongoClient(_store=store)
+    else:
+        database.MONGO_URI = uri
+    database.close_client()
+
+    db = database.get_db()
+    if uri is not None and drop:
+        db.client.drop_database(db.name)
+    return db
+
+
+_pools = None
+
+
+def seed(db, rows, rng_seed=0):
+    """Insert `rows` fake transactions; fraud ones are also copied to flagged_transactions (same _id)."""
+    global _pools
+    from fake_data import build_pools, iter_batches
+
+    t0 = time.perf_counter()
+    _pools = _pools or build_pools(0)
+    for df in iter_batches(rows, seed=rng_seed, pools=_pools, chunk_size=INSERT_CHUNK,
+                           burst_rate=0.01, pair_rate=0.005):
+        chunk = df.to_dict(orient="records")
+        db.transactions.insert_many(chunk)
+        fraud = [dict(t, fraud_reason="Seeded fraud") for t in chunk if t["is_fraud"]]
+        if fraud:
+            db.flagged_transactions.insert_many(fraud)
+    return {"rows": rows, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def sample_payloads(db, n):
+    docs = list(db.transactions.aggregate([{"$sample": {"size": n}}]))
+    return [{
+        "sender": d["sender"],
+        "receiver": d["receiver"],
+        "amount": d["amount"],
+        "device": d["device"],
+        "timestamp": str(d["time"]).replace(" ", "T"),
+    } for d in docs]
+
+
+# ------------------------
+# Benchmarks
+# ------------------------
+def bench_retrain(mode):
+    from retrain_model import retrain_model
+
+    with PeakMemory() as mem:
+        t0 = time.perf_counter()
+        version = retrain_model(mode=mode)
+        seconds = time.perf_counter() - t0
+    return {"mode": mode, "version": version, "seconds": round(seconds, 3), "peak_rss_delta_mb": mem.peak_delta_mb}
+
+
+def bench_api(client, payloads, batch_size):
+    single = []
+    t0 = time.perf_counter()
+    for p in payloads:
+        t = time.perf_counter()
+        resp = client.post("/api/check_fraud", json=p)
+        single.append(time.perf_counter() - t)
+        assert resp.status_code == 200, resp.data
+    single_total = time.perf_counter() - t0
+
+    batches = []
+    t0 = time.perf_counter()
+    for i in range(0, len(payloads), batch_size):
+        t = time.perf_counter()
+        resp = client.post("/api/check_fraud/batch", json={"transactions": payloads[i:i + batch_size]})
+        batches.append(time.perf_counter() - t)
+        assert resp.status_code == 200, resp.data
+    batch_total = time.perf_counter() - t0
+
+    return {
+        "check_fraud": latency_summary(single, single_total),
+        "check_fraud_batch": dict(latency_summary(batches, batch_total), batch_size=batch_size,
+                                  rows_per_second=round(len(payloads) / batch_total, 1)),
+    }
+
+
+def bench_ml(payloads, batch_sizes):
+    from ml_predictor import predict_fraud_ml, predict_fraud_ml_batch
+
+    per_row = []
+    for p in payloads:
+        t = time.perf_counter()
+        predict_fraud_ml(p)
+        per_row.append(time.perf_counter() - t)
+
+    results = {"per_row": latency_summary(per_row)}
+    for size in batch_sizes:
+        chunks = [payloads[i:i + size] for i in range(0, len(payloads), size)]
+        timings = []
+        for chunk in chunks:
+            t = time.perf_counter()
+            predict_fraud_ml_batch(chunk)
+            timings.append(time.perf_counter() - t)
+        results[f"batch_{size}"] = dict(latency_summary(timings), rows_per_second=round(len(payloads) / sum(timings), 1))
+    return results
+
+
+def bench_blocked(payloads, n_blocked):
+    from block_sender_db import block_senders, is_sender_blocked
+
+    senders = [p["sender"] for p in payloads]
+    block_senders({s: "benchmark" for s in senders[:n_blocked]})
+    lookups = senders + [f"unknown{i}@bench" for i in range(len(senders))]
+    random.Random(0).shuffle(lookups)
+
+    timings = []
+    for s in lookups:
+        t = time.perf_counter()
+        is_sender_blocked(s)
+        timings.append(time.perf_counter() - t)
+    return latency_summary(timings)
+
+
+STARTUP_PAYLOAD = {"sender": "probe@upi", "receiver": "shop@upi", "amount": 499.0,
+                   "device": "Android", "timestamp": "2025-10-04T12:00:00"}
+
+
+def startup_probe(uri):
+    """Run in a fresh interpreter by bench_startup: time `import app` and its first request."""
+    use_mongo(uri, drop=False)
+    t0 = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter() - t0
+
+    app_module.limiter.enabled = False
+    app_module.retrain_scheduler.threshold = float("inf")
+    t = time.perf_counter()
+    resp = app_module.app.test_client().post("/api/check_fraud", json=STARTUP_PAYLOAD)
+    first = time.perf_counter() - t
+    assert resp.status_code == 200, resp.data
+    app_module.flag_writer.close()
+
+    import metrics
+    print(json.dumps({"import_seconds": imported, "first_request_seconds": first,
+                      "model_load_seconds": metrics.STARTUP_SECONDS.get("model_load", 0.0)}))
+
+
+def bench_startup(uri, runs=3):
+    cmd = [sys.executable, os.path.abspath(__file__), "--startup-probe"] + (["--mongo-uri", uri] if uri else [])
+    samples = []
+    for _ in range(runs):
+        out = subprocess.check_output(cmd, env=os.environ, stderr=subprocess.DEVNULL)
+        samples.append(json.loads(out.decode().strip().splitlines()[-1]))
+    return {key: round(float(np.median([s[key] for s in samples])), 4) for key in samples[0]}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="upi-bench-")
+    os.environ.setdefault("MODEL_DIR", os.path.join(workdir, "models"))
+    os.environ.setdefault("FEATURE_CACHE_DIR", os.path.join(workdir, "feature_cache"))
+    # app refuses to start without a session secret
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+    os.chdir(workdir)
+    if args.state_url:
+        # Read by shared_state when app is imported, here and in the startup probes
+        os.environ["STATE_URL"] = args.state_url
+
+    db = use_mongo(args.mongo_uri)
+    results = {}
+
+    print(f"🧪 Seeding {args.rows} transactions...")
+    results["seed"] = seed(db, args.rows)
+
+    print("🧪 Retraining (full)...")
+    results["retrain_full"] = bench_retrain("full")
+    new_rows = max(100, args.rows // 10)
+    results["seed_incremental"] = seed(db, new_rows, rng_seed=1)
+    print(f"🧪 Retraining (incremental, {new_rows} new rows)...")
+    results["retrain_incremental"] = bench_retrain("incremental")
+
+    print("🧪 Cold start (import app + first request)...")
+    results["startup"] = bench_startup(args.mongo_uri)
+
+    import app as app_module
+    app_module.limiter.enabled = False
+    # Retrains are timed above; a background one mid-run would skew the API numbers
+    app_module.retrain_scheduler.threshold = float("inf")
+    payloads = sample_payloads(db, args.requests)
+
+    print(f"🧪 API: {len(payloads)} requests...")
+    results["api"] = bench_api(app_module.app.test_client(), payloads, args.batch_size)
+    app_module.flag_writer.close()
+
+    print("🧪 ML inference...")
+    results["ml"] = bench_ml(payloads, args.ml_batch_sizes)
+
+    print("🧪 Blocked-sender lookups...")
+    results["blocked_lookup"] = bench_blocked(payloads, n_blocked=len(payloads) // 10)
+
+    return {
+        "meta": {
+            "git_commit": _git_commit(),
+            "run_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend": "mongod" if args.mongo_uri else "mongomock",
+            "state": args.state_url or "memory://",
+            "rows": args.rows,
+            "requests": len(payloads),
+        },
+        "results": results,
+    }
+
+
+# ------------------------
+# Comparing runs
+# ------------------------
+def _flatten(d, prefix=""):
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            yield from _flatten(v, key + ".")
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            yield key, v
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = dict(_flatten(json.load(f)["results"]))
+    with open(new_path) as f:
+        new = dict(_flatten(json.load(f)["results"]))
+    print(f"{'metric':60} {'old':>12} {'new':>12} {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        change = f"{(b - a) / a * 100:+.1f}%" if a else ""
+        print(f"{key:60} {a:>12} {b:>12} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fraud-check hot path.")
+    parser.add_argument("--rows", type=int, default=10000, help="transactions to seed (10k to 10M)")
+    parser.add_argument("--requests", type=int, default=2000, help="API requests / inference rows to time")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per /api/check_fraud/batch call")
+    parser.add_argument("--ml-batch-sizes", type=int, nargs="+", default=[32, 128, 1000])
+    parser.add_argument("--mongo-uri", help="disposable mongod to use instead of mongomock")
+    parser.add_argument("--state-url", help="shared-state server (redis://...) instead of in-process counters")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe(args.mongo_uri)
+        return
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # run() switches to a scratch directory
+    output = os.path.abspath(args.output) if args.output else None
+    report = run(args)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{report['meta']['git_commit']}-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from datetime import datetime, timedelta
+import asyncio
+import os
+import threading
+import time
 import logging
 
+from database import get_db
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,  # Could also be DEBUG for more detail
@@ -14,20 +21,233 @@ logging.basicConfig(
 
 logger = logging.getLogger("UPIFraudDetection")
 
-# Connect to local MongoDB (change if using cloud MongoDB)
-client = MongoClient("mongodb://localhost:27017/")
-db = client["upi_fraud_db"]
+# Shared client from database.py (MONGO_URI etc. to point elsewhere)
+db = get_db()
 blocked_senders = db["blocked_senders"]
 
-def block_sender(upi_id: str, reason="fraudulent transaction"):
-    """Insert or update a blocked sender in MongoDB."""
-    blocked_senders.update_one(
-        {"upi_id": upi_id},
-        {"$set": {"reason": reason, "blocked_at": datetime.utcnow()}},
-        upsert=True
-    )
+# How often the in-memory cache polls Mongo for newly blocked senders (seconds)
+CACHE_REFRESH_INTERVAL = 30
+# How often the cache is rebuilt from scratch, which also picks up unblocked senders (seconds)
+CACHE_FULL_RELOAD_INTERVAL = 600
+# How far behind the watermark the delta poll starts (seconds). Blocks are stamped when they are
+# queued and land in Mongo a write-behind flush (plus retries) later, possibly from another worker
+# with a skewed clock, so a block can arrive with a `blocked_at` older than ones already seen.
+CACHE_REFRESH_OVERLAP = float(os.environ.get("BLOCKED_CACHE_REFRESH_OVERLAP", 120))
+
+CACHE_FIELDS = {"upi_id": 1, "blocked_at": 1, "_id": 0}
+
+
+class BlockedSenderCache:
+    """
+    In-process set of blocked UPI IDs.
+
+    The set is loaded from `blocked_senders` on first use, kept current by
+    write-through from block_sender/block_senders, and refreshed from Mongo by a
+    delta poll on `blocked_at` every CACHE_REFRESH_INTERVAL seconds. The poll's
+    watermark only advances from documents read back from Mongo, and each poll
+    re-reads the last CACHE_REFRESH_OVERLAP seconds before it, so blocks that
+    other workers queued earlier but wrote later are still picked up. A full
+    reload every CACHE_FULL_RELOAD_INTERVAL seconds drops senders unblocked elsewhere.
+    """
+
+    def __init__(self, collection, refresh_interval=CACHE_REFRESH_INTERVAL,
+                 full_reload_interval=CACHE_FULL_RELOAD_INTERVAL, refresh_overlap=CACHE_REFRESH_OVERLAP):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.refresh_overlap = timedelta(seconds=refresh_overlap)
+        self._ids = set()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._watermark = None
+        self._last_refresh = 0.0
+        self._last_full_reload = 0.0
+        self._async_lock = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def load(self):
+        """(Re)build the cache from the whole collection."""
+        self._apply_load(self.collection.find({}, CACHE_FIELDS))
+
+    def _apply_load(self, docs):
+        ids = set()
+        watermark = None
+        for doc in docs:
+            ids.add(doc["upi_id"])
+            blocked_at = doc.get("blocked_at")
+            if blocked_at and (watermark is None or blocked_at > watermark):
+                watermark = blocked_at
+
+        now = time.monotonic()
+        with self._lock:
+            self._ids = ids
+            self._watermark = watermark
+            self._loaded = True
+            self._last_refresh = now
+            self._last_full_reload = now
+            self.refreshes += 1
+        logger.info(f"Blocked-sender cache loaded with {len(ids)} senders.")
+
+    def _refresh_query(self):
+        if self._watermark is None:
+            return {}
+        return {"blocked_at": {"$gte": self._watermark - self.refresh_overlap}}
+
+    def refresh(self):
+        """Pull senders blocked since the last `blocked_at` read from Mongo, minus the overlap."""
+        self._apply_refresh(self.collection.find(self._refresh_query(), CACHE_FIELDS))
+
+    def _apply_refresh(self, docs):
+        new_ids = []
+        watermark = self._watermark
+        for doc in docs:
+            new_ids.append(doc["upi_id"])
+            blocked_at = doc.get("blocked_at")
+            if blocked_at and (watermark is None or blocked_at > watermark):
+                watermark = blocked_at
+
+        with self._lock:
+            self._ids.update(new_ids)
+            self._watermark = watermark
+            self._last_refresh = time.monotonic()
+            self.refreshes += 1
+
+    def _due(self):
+        """Which update is due: "load", "refresh" or None."""
+        if not self._loaded:
+            return "load"
+        now = time.monotonic()
+        if now - self._last_full_reload >= self.full_reload_interval:
+            return "load"
+        if now - self._last_refresh >= self.refresh_interval:
+            return "refresh"
+        return None
+
+    def _ensure_fresh(self):
+        due = self._due()
+        if due is None:
+            return
+        if not self._loaded:
+            self.load()
+            return
+        try:
+            self.load() if due == "load" else self.refresh()
+        except PyMongoError as e:
+            # Serve the last known set rather than failing the lookup
+            logger.warning(f"⚠️ Blocked-sender cache refresh failed: {e}")
+            self._last_refresh = time.monotonic()
+
+    async def ensure_fresh_async(self, collection):
+        """
+        _ensure_fresh for the event loop: `collection` is the same collection on
+        an AsyncMongoClient, and concurrent callers share one refresh.
+        """
+        if self._due() is None:
+            return
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            due = self._due()
+            if due is None:
+                return
+            try:
+                if due == "load":
+                    self._apply_load(await collection.find({}, CACHE_FIELDS).to_list(None))
+                else:
+                    self._apply_refresh(await collection.find(self._refresh_query(), CACHE_FIELDS).to_list(None))
+            except PyMongoError as e:
+                if not self._loaded:
+                    raise
+                logger.warning(f"⚠️ Blocked-sender cache refresh failed: {e}")
+                self._last_refresh = time.monotonic()
+
+    async def contains_async(self, upi_id: str, collection) -> bool:
+        await self.ensure_fresh_async(collection)
+        return self._lookup(upi_id)
+
+    def contains(self, upi_id: str) -> bool:
+        self._ensure_fresh()
+        return self._lookup(upi_id)
+
+    def _lookup(self, upi_id: str) -> bool:
+        if upi_id in self._ids:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def filter_blocked(self, upi_ids) -> set:
+        self._ensure_fresh()
+        upi_ids = set(upi_ids)
+        found = upi_ids & self._ids
+        self.hits += len(found)
+        self.misses += len(upi_ids) - len(found)
+        return found
+
+    def add(self, upi_id: str):
+        # The watermark is left alone: this block may not be in Mongo yet
+        with self._lock:
+            self._ids.add(upi_id)
+
+    def discard(self, upi_id: str):
+        with self._lock:
+            self._ids.discard(upi_id)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "refreshes": self.refreshes,
+        }
+
+
+blocked_cache = BlockedSenderCache(blocked_senders)
+
+
+def block_sender(upi_id: str, reason="fraudulent transaction", writer=None):
+    """
+    Insert or update a blocked sender in MongoDB. With a FlaggedWriter the
+    upsert is queued instead; the in-memory cache is updated either way.
+    """
+    now = datetime.utcnow()
+    if writer is not None:
+        writer.submit_block(upi_id, reason, now)
+    else:
+        blocked_senders.update_one(
+            {"upi_id": upi_id},
+            {"$set": {"reason": reason, "blocked_at": now}},
+            upsert=True
+        )
+    blocked_cache.add(upi_id)
     logger.info(f"Sender {upi_id} blocked.")
 
 def is_sender_blocked(upi_id: str) -> bool:
-    """Check if a sender is already blocked in MongoDB."""
-    return blocked_senders.find_one({"upi_id": upi_id}) is not None
+    """Check if a sender is already blocked, served from the in-memory cache."""
+    return blocked_cache.contains(upi_id)
+
+
+def get_blocked_senders(upi_ids) -> set:
+    """Return the subset of upi_ids that are blocked, served from the in-memory cache."""
+    return blocked_cache.filter_blocked(upi_ids)
+
+def block_senders(reasons_by_sender: dict, writer=None):
+    """Block several senders at once. reasons_by_sender maps upi_id -> reason."""
+    if not reasons_by_sender:
+        return
+    now = datetime.utcnow()
+    if writer is not None:
+        for upi_id, reason in reasons_by_sender.items():
+            writer.submit_block(upi_id, reason, now)
+    else:
+        blocked_senders.bulk_write([
+            UpdateOne({"upi_id": upi_id}, {"$set": {"reason": reason, "blocked_at": now}}, upsert=True)
+            for upi_id, reason in reasons_by_sender.items()
+        ], ordered=False)
+    for upi_id in reasons_by_sender:
+        blocked_cache.add(upi_id)
+    logger.info(f"{len(reasons_by_sender)} senders blocked.")
@@ -0,0 +1,191 @@
+import threading
+import time
+import logging
+from collections import Counter
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# How long the dashboard reuses chart data before re-reading fraud_stats (seconds)
+CACHE_TTL = 30
+
+KINDS = ("day", "hour", "device")
+
+# Flagged documents that count as fraud (see _is_counted)
+FRAUD_MATCH = {"$or": [{"is_fraud": {"$ne": False}}, {"fraud_reason": {"$exists": True}}]}
+
+
+def _txn_time(doc):
+    """Event time of a flagged document: `time` (offline jobs), `timestamp` (API), else `checked_at`."""
+    for field in ("time", "timestamp", "checked_at"):
+        value = doc.get(field)
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                continue
+    return None
+
+
+def _is_counted(doc):
+    # Offline jobs only write fraud (with fraud_reason); the API writes every check with is_fraud set
+    return bool(doc.get("fraud_reason")) or doc.get("is_fraud", True) is not False
+
+
+def bucket_counts(docs) -> Counter:
+    """Counter of (kind, key) -> fraud documents among `docs`, as stored in fraud_stats."""
+    counts = Counter()
+    for doc in docs:
+        if not _is_counted(doc):
+            continue
+        dt = _txn_time(doc)
+        if dt is not None:
+            counts[("day", dt.strftime("%Y-%m-%d"))] += 1
+            counts[("hour", str(dt.hour))] += 1
+        counts[("device", doc.get("device") or "Unknown")] += 1
+    return counts
+
+
+def breakdown_pipeline(match, fields=("device",)) -> list:
+    """
+    One aggregation counting the documents matching `match` by day, by hour
+    and by each of `fields` (missing values count as "Unknown"), as a single
+    {"day": [...], "hour": [...], <field>: [...]} document of {_id, count} rows.
+    """
+    return [
+        {"$match": match},
+        {"$project": dict(
+            {field: {"$ifNull": [f"${field}", "Unknown"]} for field in fields},
+            t={"$convert": {
+                "input": {"$ifNull": ["$time", {"$ifNull": ["$timestamp", "$checked_at"]}]},
+                "to": "date", "onError": None, "onNull": None,
+            }},
+        )},
+        {"$facet": dict(
+            day=[
+                {"$match": {"t": {"$ne": None}}},
+                {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$t"}}, "count": {"$sum": 1}}},
+            ],
+            hour=[
+                {"$match": {"t": {"$ne": None}}},
+                {"$group": {"_id": {"$toString": {"$hour": "$t"}}, "count": {"$sum": 1}}},
+            ],
+            **{field: [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}] for field in fields},
+        )},
+    ]
+
+
+class DashboardStats:
+    """
+    Fraud counts by day, hour and device, materialized in the `fraud_stats`
+    collection (one small document per bucket).
+
+    record_flagged() applies $inc upserts for each batch of flagged documents
+    as it is written, rebuild() recomputes everything with one server-side
+    $group pipeline, and chart_data() serves the dashboard from an in-process
+    copy refreshed every CACHE_TTL seconds, so rendering cost does not depend
+    on the size of `flagged_transactions`.
+    """
+
+    def __init__(self, stats_collection, flagged_collection, cache_ttl=CACHE_TTL):
+        self.stats = stats_collection
+        self.flagged = flagged_collection
+        self.cache_ttl = cache_ttl
+        self._cached = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    # ------------------------
+    # Incremental updates
+    # ------------------------
+    def record_flagged(self, docs):
+        counts = bucket_counts(docs)
+        if not counts:
+            return
+        self.stats.bulk_write([
+            UpdateOne({"_id": f"{kind}:{key}"}, {"$set": {"kind": kind, "key": key}, "$inc": {"count": n}}, upsert=True)
+            for (kind, key), n in counts.items()
+        ], ordered=False)
+
+    # ------------------------
+    # Full rebuild
+    # ------------------------
+    def rebuild(self):
+        """
+        Recompute every bucket from `flagged_transactions` in a single
+        aggregation, plus the counts stored with the months already moved to
+        the archive (retention.py), which are not read again.
+        """
+        from retention import archived_bucket_counts
+
+        result = next(self.flagged.aggregate(breakdown_pipeline(FRAUD_MATCH), allowDiskUse=True), {})
+        counts = Counter({(kind, row["_id"]): row["count"] for kind in KINDS for row in result.get(kind, [])})
+        counts.update(archived_bucket_counts(self.flagged.name))
+        docs = [
+            {"_id": f"{kind}:{key}", "kind": kind, "key": key, "count": n}
+            for (kind, key), n in counts.items()
+        ]
+        if docs:
+            # Built aside and renamed over in one step, so readers and record_flagged() never see a
+            # half-empty collection. A batch recorded while the aggregation runs may still be missed
+            # until the next rebuild.
+            staging = self.stats.database[f"{self.stats.name}_rebuild_{ObjectId()}"]
+            staging.insert_many(docs)
+            staging.rename(self.stats.name, dropTarget=True)
+        else:
+            self.stats.delete_many({})
+        self.invalidate()
+        logger.info(f"📊 Dashboard stats rebuilt: {len(docs)} buckets")
+
+    # ------------------------
+    # Reads
+    # ------------------------
+    def invalidate(self):
+        self._cached_at = 0.0
+
+    def chart_data(self) -> dict:
+        now = time.monotonic()
+        if self._cached is not None and now - self._cached_at < self.cache_ttl:
+            return self._cached
+
+        with self._lock:
+            if self._cached is not None and time.monotonic() - self._cached_at < self.cache_ttl:
+                return self._cached
+
+            rows = list(self.stats.find({}, {"kind": 1, "key": 1, "count": 1}))
+            if not rows and self.flagged.estimated_document_count() > 0:
+                # First run against existing data
+                self.rebuild()
+                rows = list(self.stats.find({}, {"kind": 1, "key": 1, "count": 1}))
+
+            by_kind = {kind: [] for kind in KINDS}
+            for row in rows:
+                if row.get("kind") in by_kind and row.get("count", 0) > 0:
+                    by_kind[row["kind"]].append((row["key"], row["count"]))
+
+            days = sorted(by_kind["day"])
+            hours = sorted(by_kind["hour"], key=lambda kv: int(kv[0]))
+            devices = sorted(by_kind["device"], key=lambda kv: -kv[1])
+
+            self._cached = {
+                'day_labels': [k for k, _ in days],
+                'day_data': [v for _, v in days],
+                'hour_labels': [k for k, _ in hours],
+                'hour_data': [v for _, v in hours],
+                'device_labels': [k for k, _ in devices],
+                'device_data': [v for _, v in devices],
+            }
+            self._cached_at = time.monotonic()
+            return self._cached
+
+
+if __name__ == "__main__":
+    from database import get_db
+
+    db = get_db()
+    DashboardStats(db["fraud_stats"], db["flagged_transactions"]).rebuild()
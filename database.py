@@ -0,0 +1,187 @@
+"""
+One MongoDB client per process, shared by every module.
+
+    from database import get_db
+    db = get_db()                                            # primary reads and writes
+    reporting = get_db(read_preference="secondaryPreferred")  # dashboard reads
+
+get_db() and get_collection() return handles that resolve the client on
+use, so importing a module opens no connections, and a process forked after
+import (gunicorn --preload, multiprocessing "fork") builds its own pool
+instead of inheriting the parent's sockets. Pool size, timeouts, write
+concern and read preferences come from the MONGO_* environment variables
+below.
+"""
+import os
+import threading
+import logging
+
+import pymongo
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+logger = logging.getLogger("UPIFraudDetection")
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.environ.get("MONGO_DB", "upi_fraud_db")
+
+# Connection pool per process
+MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 60000))
+
+# Fail fast instead of hanging a request thread when Mongo is unreachable
+CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000))
+SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 0)) or None   # 0 = no limit (retraining scans)
+
+# Write concern: "1", "majority", ... ; journal only when MONGO_JOURNAL=1
+WRITE_CONCERN = os.environ.get("MONGO_W", "1")
+WRITE_JOURNAL = os.environ.get("MONGO_JOURNAL", "0") == "1"
+
+# Default read preference, and the one the dashboard / reporting reads use
+READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+DASHBOARD_READ_PREFERENCE = os.environ.get("MONGO_DASHBOARD_READ_PREFERENCE", "secondaryPreferred")
+
+_client = None
+_client_pid = None
+_async_client = None
+_async_client_pid = None
+_lock = threading.Lock()
+
+
+def client_options(**overrides) -> dict:
+    """Keyword arguments for MongoClient built from the settings above."""
+    options = {
+        "maxPoolSize": MAX_POOL_SIZE,
+        "minPoolSize": MIN_POOL_SIZE,
+        "maxIdleTimeMS": MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": SOCKET_TIMEOUT_MS,
+        "w": int(WRITE_CONCERN) if WRITE_CONCERN.isdigit() else WRITE_CONCERN,
+        "readPreference": READ_PREFERENCE,
+        "connect": False,
+    }
+    if WRITE_JOURNAL:
+        options["journal"] = True
+    options.update(overrides)
+    return options
+
+
+def create_client(uri=None, **overrides):
+    """A new, unshared client (scripts pointed at another server, tools)."""
+    return pymongo.MongoClient(uri or MONGO_URI, **client_options(**overrides))
+
+
+def get_client():
+    """The process-wide client, created on first use and again after a fork."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # A client inherited across fork is dropped, not closed: its sockets belong to the parent
+            _client = create_client()
+            _client_pid = pid
+            logger.info(f"🔌 MongoDB client created for pid {pid} (maxPoolSize={MAX_POOL_SIZE})")
+    return _client
+
+
+def close_client():
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = _client_pid = None
+
+
+def get_async_client():
+    """
+    The process-wide AsyncMongoClient (PyMongo's asyncio API) for the ASGI
+    endpoints, with the same settings; bound to the event loop that first uses it.
+    """
+    global _async_client, _async_client_pid
+    pid = os.getpid()
+    if _async_client is None or _async_client_pid != pid:
+        from pymongo import AsyncMongoClient
+        _async_client = AsyncMongoClient(MONGO_URI, **client_options())
+        _async_client_pid = pid
+    return _async_client
+
+
+def get_async_db(name=None, read_preference=None):
+    return get_async_client().get_database(name or MONGO_DB, read_preference=_read_preference(read_preference))
+
+
+def _read_preference(name):
+    return make_read_preference(read_pref_mode_from_name(name), None) if name else None
+
+
+# ------------------------
+# Lazy handles
+# ------------------------
+class _Lazy:
+    """Resolves the real pymongo object against the current process's client on every use."""
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+        self._bound_to = None
+        self._target = None
+
+    def _get(self):
+        client = get_client()
+        if self._bound_to is not client:
+            self._target = self._resolve(client)
+            self._bound_to = client
+        return self._target
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._get(), name)
+
+
+class LazyCollection(_Lazy):
+    def __init__(self, db_name, name, read_preference=None):
+        super().__init__(lambda client: client.get_database(
+            db_name, read_preference=_read_preference(read_preference)
+        ).get_collection(name))
+        self.name = name
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+class LazyDatabase(_Lazy):
+    def __init__(self, name=None, read_preference=None):
+        self.name = name or MONGO_DB
+        self.read_preference_name = read_preference
+        super().__init__(lambda client: client.get_database(
+            self.name, read_preference=_read_preference(read_preference)
+        ))
+
+    def __getitem__(self, collection):
+        return LazyCollection(self.name, collection, self.read_preference_name)
+
+    def __getattr__(self, name):
+        # db.transactions -> collection, like pymongo's Database; methods resolve as usual
+        if not name.startswith("_"):
+            target = self._get()
+            attr = getattr(type(target), name, None)
+            if attr is None:
+                return self[name]
+            return getattr(target, name)
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f"LazyDatabase({self.name!r})"
+
+
+def get_db(name=None, read_preference=None) -> LazyDatabase:
+    """Database handle on the shared client; `read_preference` overrides the default (e.g. "secondaryPreferred")."""
+    return LazyDatabase(name, read_preference)
+
+
+def get_collection(name, db_name=None, read_preference=None) -> LazyCollection:
+    return LazyCollection(db_name or MONGO_DB, name, read_preference)
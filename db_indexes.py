@@ -0,0 +1,154 @@
+import sys
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# ------------------------
+# Declared indexes
+# ------------------------
+# Every index a query in the app, the writers or the offline jobs relies on,
+# next to the query that needs it. Names are left to MongoDB's defaults so
+# indexes built earlier by adding_data_to_db.py are recognised as the same.
+INDEXES = {
+    "users": [
+        # role_required / login / signup look users up by name on every request
+        IndexModel([("username", ASCENDING)], unique=True),
+        # Revocation poll (auth.py)
+        IndexModel([("role_changed_at", ASCENDING)], sparse=True),
+    ],
+    "api_keys": [
+        # Rate-limit identity: X-API-Key lookups by digest (auth.ApiKeyStore)
+        IndexModel([("key_sha256", ASCENDING)], unique=True),
+    ],
+    "transactions": [
+        # /all-transactions keyset pagination; also serves time-ordered scans (reflag, feature cache)
+        IndexModel([("time", DESCENDING), ("_id", DESCENDING)]),
+        # Idempotent ingestion (ingest_transactions.py)
+        IndexModel([("txn_id", ASCENDING)], unique=True,
+                   partialFilterExpression={"txn_id": {"$type": "string"}}),
+        IndexModel([("sender", ASCENDING)]),
+        IndexModel([("receiver", ASCENDING)]),
+    ],
+    "flagged_transactions": [
+        # Dashboard keyset pagination
+        IndexModel([("time", DESCENDING), ("_id", DESCENDING)]),
+        # Most recent checks first
+        IndexModel([("checked_at", DESCENDING)]),
+        # Dashboard search: anchored prefix regex on the lowercase copies of sender/receiver
+        IndexModel([("sender_lc", ASCENDING)]),
+        IndexModel([("receiver_lc", ASCENDING)]),
+        # Removing stale offline flags after a re-flag run
+        IndexModel([("source", ASCENDING), ("reflag_run", ASCENDING)]),
+    ],
+    "blocked_senders": [
+        IndexModel([("upi_id", ASCENDING)], unique=True),
+        # Blocked-sender cache delta refresh
+        IndexModel([("blocked_at", ASCENDING)]),
+    ],
+}
+
+
+def ensure_indexes(db, collections=None) -> dict:
+    """
+    Create the declared indexes that are missing; existing ones are left as
+    they are, so this is safe to run at every startup. An index that cannot be
+    built (e.g. duplicate usernames for the unique index) is logged and
+    skipped rather than stopping the app.
+    """
+    created = {}
+    for name, models in INDEXES.items():
+        if collections is not None and name not in collections:
+            continue
+        names = []
+        for model in models:
+            try:
+                names += db[name].create_indexes([model])
+            except OperationFailure as e:
+                logger.error(f"⚠️ Could not create index {model.document['key']} on {name}: {e}")
+        created[name] = names
+
+    # TTL indexes expiring the hot tier, when HOT_RETENTION_DAYS is set (retention.py)
+    from retention import ensure_ttl_indexes
+    for name, names in ensure_ttl_indexes(db, collections).items():
+        created.setdefault(name, []).extend(n for n in names if n not in created[name])
+    return created
+
+
+def ensure_collection_indexes(collection):
+    """ensure_indexes() for a single collection object."""
+    return ensure_indexes(collection.database, collections=[collection.name])
+
+
+# ------------------------
+# Query plan checks
+# ------------------------
+def _hot_queries(db):
+    """(name, cursor) for each query on a request or writer path, with representative arguments."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    keyset = {"$or": [{"time": {"$lt": now}}, {"time": now, "_id": {"$lt": ObjectId()}}]}
+    newest_first = [("time", DESCENDING), ("_id", DESCENDING)]
+    search = {"$or": [{"sender_lc": {"$regex": "^abc"}}, {"receiver_lc": {"$regex": "^abc"}}]}
+
+    return [
+        ("users by username", db.users.find({"username": "admin"}).limit(1)),
+        ("users revocation poll", db.users.find({"role_changed_at": {"$gte": now}})),
+        ("api key by digest", db.api_keys.find({"key_sha256": "x", "active": True}).limit(1)),
+        ("flagged first page", db.flagged_transactions.find({}).sort(newest_first).limit(11)),
+        ("flagged next page", db.flagged_transactions.find(keyset).sort(newest_first).limit(11)),
+        ("flagged prefix search", db.flagged_transactions.find(search).sort(newest_first).limit(11)),
+        ("flagged recent checks", db.flagged_transactions.find({"checked_at": {"$gte": now}})),
+        ("transactions first page", db.transactions.find({}).sort(newest_first).limit(11)),
+        ("transactions next page", db.transactions.find(keyset).sort(newest_first).limit(11)),
+        ("transactions by txn_id", db.transactions.find({"txn_id": "x"}).limit(1)),
+        ("blocked by upi_id", db.blocked_senders.find({"upi_id": "x"}).limit(1)),
+        ("blocked delta refresh", db.blocked_senders.find({"blocked_at": {"$gte": now}})),
+        ("archive month scan", db.transactions.find({"time": {"$gte": now, "$lt": now}}).sort([("time", 1), ("_id", 1)])),
+        ("stale offline flags", db.flagged_transactions.find({"source": "offline", "reflag_run": {"$ne": "x"}})),
+    ]
+
+
+def _plan_stages(node) -> list:
+    """All stage names in an explain() plan tree (classic and SBE layouts)."""
+    stages = []
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        for key, value in node.items():
+            if key in ("inputStage", "inputStages", "queryPlan", "shards", "winningPlan"):
+                stages += _plan_stages(value)
+    elif isinstance(node, list):
+        for item in node:
+            stages += _plan_stages(item)
+    return stages
+
+
+def check_query_plans(db) -> list:
+    """explain() every hot query; returns [(name, stages, ok)] where ok means no COLLSCAN."""
+    results = []
+    for name, cursor in _hot_queries(db):
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(plan)
+        results.append((name, stages, "COLLSCAN" not in stages))
+    return results
+
+
+if __name__ == "__main__":
+    # Apply the declared indexes, then fail (exit 1) if any hot query still scans a collection
+    from database import get_db
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    db = get_db()
+
+    for collection, names in ensure_indexes(db).items():
+        print(f"✅ {collection}: {', '.join(names)}")
+
+    failed = False
+    for name, stages, ok in check_query_plans(db):
+        print(f"{'✅' if ok else '❌'} {name}: {' <- '.join(stages)}")
+        failed |= not ok
+    sys.exit(1 if failed else 0)
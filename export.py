@@ -0,0 +1,262 @@
+"""
+Streaming export of flagged transactions.
+
+    python export.py flagged.csv.gz --since 2025-10-01 --until 2025-11-01
+    python export.py flagged.ndjson --reason "High transaction amount" --no-gzip
+    python export.py flagged.parquet --summary
+    GET /export?format=csv&since=2025-10-01&reason=Unknown%20device      (admin)
+
+Rows come from a projected cursor and are written CHUNK_SIZE at a time
+(gzip-compressed as they are written, by default), so memory stays flat
+however large the history. Parquet needs pyarrow and compresses its pages
+itself. Breakdowns by day, hour and device are computed by one server-side
+aggregation over the same filters.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import zlib
+import logging
+from datetime import datetime, timedelta
+
+from dashboard_stats import FRAUD_MATCH, breakdown_pipeline
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Exported columns, in order
+FIELDS = ("time", "sender", "receiver", "amount", "device", "is_fraud", "fraud_reasons", "checked_at", "source")
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Documents per cursor batch and per write
+CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 5000))
+
+# Flagged `time` values are datetimes; API documents written before adding_data_to_db.py converted
+# them may still be "YYYY-mm-dd HH:MM:SS" strings
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# ------------------------
+# Filters
+# ------------------------
+def parse_day(value, end=False):
+    """A date or datetime bound; a bare --until date includes that whole day."""
+    if value is None or isinstance(value, datetime):
+        return value
+    dt = datetime.fromisoformat(value)
+    if end and len(value) <= 10:
+        dt += timedelta(days=1)
+    return dt
+
+
+def time_filter(since=None, until=None) -> dict:
+    """`time` in [since, until), whether stored as a datetime or as a TIME_FORMAT string."""
+    as_dates, as_strings = {}, {}
+    if since:
+        as_dates["$gte"], as_strings["$gte"] = since, since.strftime(TIME_FORMAT)
+    if until:
+        as_dates["$lt"], as_strings["$lt"] = until, until.strftime(TIME_FORMAT)
+    # Both branches use the (time, _id) index
+    return {"$or": [{"time": as_dates}, {"time": as_strings}]}
+
+
+def build_query(since=None, until=None, reasons=None, fraud_only=True) -> dict:
+    """Filter on `time` in [since, until) and on any of `reasons` (exact reason strings)."""
+    clauses = [FRAUD_MATCH] if fraud_only else []
+    if since or until:
+        clauses.append(time_filter(since, until))
+    if reasons:
+        clauses.append({"$or": [{"fraud_reasons": {"$in": list(reasons)}},
+                                {"fraud_reason": {"$in": list(reasons)}}]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+# ------------------------
+# Rows
+# ------------------------
+def _row(doc) -> dict:
+    reasons = doc.get("fraud_reasons")
+    if reasons is None and doc.get("fraud_reason"):
+        reasons = doc["fraud_reason"].split("; ")
+    row = {field: doc.get(field) for field in FIELDS}
+    row["fraud_reasons"] = list(reasons or [])
+    for field in ("time", "checked_at"):
+        if isinstance(row[field], datetime):
+            row[field] = row[field].strftime(TIME_FORMAT) if field == "time" else row[field].isoformat()
+    if row["amount"] is not None:
+        row["amount"] = float(row["amount"])
+    return row
+
+
+def iter_chunks(collection, query, chunk_size=CHUNK_SIZE):
+    """Lists of export rows in (time, _id) order, read through a projected cursor."""
+    projection = dict.fromkeys(FIELDS, 1)
+    projection.update(fraud_reason=1, _id=0)
+    cursor = collection.find(query, projection).sort([("time", 1), ("_id", 1)]).batch_size(chunk_size)
+    chunk = []
+    for doc in cursor:
+        chunk.append(_row(doc))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ------------------------
+# Encoders: each turns chunks of rows into chunks of bytes
+# ------------------------
+def _encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    for chunk in chunks:
+        for row in chunk:
+            writer.writerow(dict(row, fraud_reasons="; ".join(row["fraud_reasons"])))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _encode_ndjson(chunks):
+    for chunk in chunks:
+        yield "".join(json.dumps(row, default=str) + "\n" for row in chunk).encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain()."""
+
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _encode_parquet(chunks, compression="gzip"):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("time", pa.string()), ("sender", pa.string()), ("receiver", pa.string()),
+        ("amount", pa.float64()), ("device", pa.string()), ("is_fraud", pa.bool_()),
+        ("fraud_reasons", pa.list_(pa.string())), ("checked_at", pa.string()), ("source", pa.string()),
+    ])
+    sink = _Sink()
+    # One row group per chunk, flushed to the output as soon as it is written
+    with pq.ParquetWriter(sink, schema, compression=compression or "none") as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _gzip(parts):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(collection, fmt="csv", query=None, compress=True, chunk_size=CHUNK_SIZE):
+    """The export as an iterator of bytes, for a file or a streamed HTTP response."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    chunks = iter_chunks(collection, query or {}, chunk_size)
+    if fmt == "parquet":
+        return _encode_parquet(chunks, compression="gzip" if compress else None)
+    parts = _encode_csv(chunks) if fmt == "csv" else _encode_ndjson(chunks)
+    return _gzip(parts) if compress else parts
+
+
+def filename(fmt, compress=True) -> str:
+    """Default file name; Parquet is compressed internally, so never gets .gz."""
+    name = f"flagged_transactions.{fmt}"
+    return name + ".gz" if compress and fmt != "parquet" else name
+
+
+def export_to_file(collection, path, fmt="csv", query=None, compress=True, chunk_size=CHUNK_SIZE) -> int:
+    """Write the export to `path` (atomically); returns the bytes written."""
+    tmp = f"{path}.tmp"
+    written = 0
+    with open(tmp, "wb") as f:
+        for part in stream_export(collection, fmt, query, compress, chunk_size):
+            f.write(part)
+            written += len(part)
+    os.replace(tmp, path)
+    return written
+
+
+# ------------------------
+# Breakdowns
+# ------------------------
+def breakdowns(collection, query=None, fields=("device",)) -> dict:
+    """{"day": {...}, "hour": {...}, <field>: {...}} counts for the filtered documents, from one aggregation."""
+    result = next(collection.aggregate(breakdown_pipeline(query or {}, fields), allowDiskUse=True), {})
+    out = {}
+    for kind, rows in result.items():
+        if kind == "hour":
+            rows = sorted(rows, key=lambda r: int(r["_id"]))
+        elif kind == "day":
+            rows = sorted(rows, key=lambda r: r["_id"])
+        else:
+            rows = sorted(rows, key=lambda r: -r["count"])
+        out[kind] = {str(r["_id"]): r["count"] for r in rows}
+    return out
+
+
+if __name__ == "__main__":
+    from database import get_db, DASHBOARD_READ_PREFERENCE
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Export flagged transactions as CSV, NDJSON or Parquet.")
+    parser.add_argument("output", nargs="?", help="file to write (default: flagged_transactions.<format>[.gz])")
+    parser.add_argument("--format", choices=list(FORMATS), help="default: from the output's extension, else csv")
+    parser.add_argument("--since", help="first day or datetime to include (ISO format)")
+    parser.add_argument("--until", help="last day to include, or exclusive datetime bound")
+    parser.add_argument("--reason", action="append", dest="reasons", help="only rows with this reason (repeatable)")
+    parser.add_argument("--all", action="store_true", help="include checks that were not flagged as fraud")
+    parser.add_argument("--no-gzip", action="store_true", help="write uncompressed")
+    parser.add_argument("--summary", action="store_true", help="also print the day/hour/device breakdowns")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        stem = (args.output or "").removesuffix(".gz")
+        fmt = next((f for f in FORMATS if stem.endswith(f".{f}")), "csv")
+    compress = not args.no_gzip
+    output = args.output or filename(fmt, compress)
+
+    flagged = get_db(read_preference=DASHBOARD_READ_PREFERENCE)["flagged_transactions"]
+    query = build_query(parse_day(args.since), parse_day(args.until, end=True), args.reasons, fraud_only=not args.all)
+    written = export_to_file(flagged, output, fmt, query, compress, args.chunk_size)
+    logger.info(f"✅ Exported flagged transactions to {output} ({written / 1e6:.1f} MB)")
+
+    if args.summary:
+        print(json.dumps(breakdowns(flagged, query), indent=2))
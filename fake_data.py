@@ -1,19 +1,36 @@
 from faker import Faker
 import pandas as pd
+import numpy as np
+import argparse
+import os
 import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
 fake = Faker()
 Faker.seed(0)
 random.seed(0)
 
+DEVICES = ['Android', 'iOS', 'Windows', 'Linux']
+COLUMNS = ["txn_id", "sender", "receiver", "amount", "time", "location", "device", "is_fraud"]
+
+# Bulk generator settings
+IDENTITY_POOL_SIZE = 100_000   # distinct Faker emails that senders/receivers are drawn from
+CITY_POOL_SIZE = 2_000
+SHARD_SIZE = 1_000_000         # rows per shard; each shard has its own seed, so output does not depend on --workers
+CHUNK_SIZE = 100_000           # rows generated and written at a time within a shard
+BURST_SIZE = 8                 # transactions in one injected velocity burst
+PAIR_REPEATS = 5               # transactions in one injected repeated sender/receiver pair
+
+
 def generate_transaction():
     sender = fake.email()
     receiver = fake.email()
     amount = round(random.uniform(10, 100000), 2)
     txn_time = fake.date_time_between(start_date='-30d', end_date='now')
     location = fake.city()
-    device = random.choice(['Android', 'iOS', 'Windows', 'Linux'])
+    device = random.choice(DEVICES)
 
     # Simple fraud logic:
     # Flag as fraud if amount > ₹50,000 between 12 AM - 5 AM
@@ -35,9 +52,228 @@ def generate_transaction():
 def generate_transactions(n=500):
     return [generate_transaction() for _ in range(n)]
 
+
+# ------------------------
+# Bulk generation
+# ------------------------
+def build_pools(seed=0, identities=IDENTITY_POOL_SIZE, cities=CITY_POOL_SIZE) -> dict:
+    """Pre-sample Faker identities once; rows then pick from them by index."""
+    f = Faker()
+    f.seed_instance(seed)
+    return {
+        "emails": np.array([f.email() for _ in range(identities)], dtype=object),
+        "cities": np.array([f.city() for _ in range(cities)], dtype=object),
+    }
+
+
+def _inject_patterns(rng, n, sender, receiver, offsets, span, burst_rate, pair_rate):
+    """
+    Rewrite a random subset of rows into fraud patterns the rules look for and
+    return their mask: velocity bursts (one sender within a minute, or one
+    receiver within five minutes) and repeated sender/receiver pairs within a day.
+    """
+    injected = np.zeros(n, dtype=bool)
+    n_bursts = int(n * burst_rate) // BURST_SIZE
+    n_pairs = int(n * pair_rate) // PAIR_REPEATS
+    total = n_bursts * BURST_SIZE + n_pairs * PAIR_REPEATS
+    if total == 0 or total > n:
+        return injected
+
+    rows = rng.choice(n, total, replace=False)
+    bursts = rows[:n_bursts * BURST_SIZE].reshape(n_bursts, BURST_SIZE)
+    pairs = rows[n_bursts * BURST_SIZE:].reshape(n_pairs, PAIR_REPEATS)
+
+    # Alternate sender bursts (60s) and receiver bursts (300s)
+    sender_bursts, receiver_bursts = bursts[0::2], bursts[1::2]
+    sender[sender_bursts] = sender[sender_bursts[:, :1]]
+    offsets[sender_bursts] = offsets[sender_bursts[:, :1]] + rng.integers(0, 60, sender_bursts.shape)
+    receiver[receiver_bursts] = receiver[receiver_bursts[:, :1]]
+    offsets[receiver_bursts] = offsets[receiver_bursts[:, :1]] + rng.integers(0, 300, receiver_bursts.shape)
+
+    sender[pairs] = sender[pairs[:, :1]]
+    receiver[pairs] = receiver[pairs[:, :1]]
+    offsets[pairs] = offsets[pairs[:, :1]] + rng.integers(0, 86400, pairs.shape)
+
+    np.minimum(offsets, span - 1, out=offsets)
+    injected[rows] = True
+    return injected
+
+
+def _uuid4_strings(rng, n) -> np.ndarray:
+    """n random version-4 UUID strings built from rng bytes, without a per-row uuid.UUID()."""
+    raw = rng.integers(0, 256, (n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hexed = np.frombuffer(raw.tobytes().hex().encode(), dtype="S1").reshape(n, 32)
+    out = np.full((n, 36), b"-", dtype="S1")
+    for dst, src in ((slice(0, 8), slice(0, 8)), (slice(9, 13), slice(8, 12)), (slice(14, 18), slice(12, 16)),
+                     (slice(19, 23), slice(16, 20)), (slice(24, 36), slice(20, 32))):
+        out[:, dst] = hexed[:, src]
+    return out.view("S36").ravel().astype("U36").astype(object)
+
+
+def generate_batch(rng, n, pools, start, end, burst_rate=0.0, pair_rate=0.0) -> pd.DataFrame:
+    """
+    Draw n transactions with NumPy in one go: same columns and the same
+    amount/night fraud rule as generate_transaction(), plus injected patterns
+    (labelled as fraud) at the given rates. `time` is a datetime64 column.
+    """
+    emails, cities = pools["emails"], pools["cities"]
+    span = max(1, int((end - start).total_seconds()))
+
+    sender = rng.integers(0, len(emails), n)
+    receiver = rng.integers(0, len(emails), n)
+    offsets = rng.integers(0, span, n)
+    injected = _inject_patterns(rng, n, sender, receiver, offsets, span, burst_rate, pair_rate)
+
+    amount = np.round(rng.uniform(10, 100000, n), 2)
+    times = np.datetime64(start, "s") + offsets.astype("timedelta64[s]")
+    hour = (times - times.astype("datetime64[D]")).astype("timedelta64[h]").astype(np.int64)
+    is_fraud = ((amount > 50000) & (hour < 5)) | injected
+
+    return pd.DataFrame({
+        "txn_id": _uuid4_strings(rng, n),
+        "sender": emails[sender],
+        "receiver": emails[receiver],
+        "amount": amount,
+        "time": times.astype("datetime64[ns]"),
+        "location": cities[rng.integers(0, len(cities), n)],
+        "device": np.array(DEVICES, dtype=object)[rng.integers(0, len(DEVICES), n)],
+        "is_fraud": is_fraud,
+    }, columns=COLUMNS)
+
+
+def iter_batches(rows, seed=0, pools=None, start=None, end=None, burst_rate=0.0, pair_rate=0.0,
+                 chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of up to chunk_size rows until `rows` have been produced (single process)."""
+    pools = pools or build_pools(seed)
+    end = end or datetime.now().replace(microsecond=0)
+    start = start or end - timedelta(days=30)
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < rows:
+        n = min(chunk_size, rows - done)
+        yield generate_batch(rng, n, pools, start, end, burst_rate, pair_rate)
+        done += n
+
+
+# ------------------------
+# Parallel shards
+# ------------------------
+_POOLS = None
+
+
+def _init_worker(pools):
+    global _POOLS
+    _POOLS = pools
+
+
+def _write_shard(job):
+    """Generate one shard and write it to its part file or to MongoDB. Returns rows written."""
+    rows, seed_seq, fmt, path, options = job
+    rng = np.random.default_rng(seed_seq)
+    start, end = options["start"], options["end"]
+
+    writer = collection = None
+    if fmt == "mongo":
+        from database import create_client
+        collection = create_client(options["mongo_uri"])[options["mongo_db"]]["transactions"]
+
+    done = 0
+    while done < rows:
+        n = min(CHUNK_SIZE, rows - done)
+        df = generate_batch(rng, n, _POOLS, start, end, options["burst_rate"], options["pair_rate"])
+        if fmt == "csv":
+            df.to_csv(path, mode="a", header=False, index=False, date_format="%Y-%m-%d %H:%M:%S")
+        elif fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+        else:
+            # ingested_at: what the hot-tier TTL expires on (retention.py)
+            collection.insert_many(df.assign(ingested_at=datetime.utcnow()).to_dict(orient="records"), ordered=False)
+        done += n
+
+    if writer is not None:
+        writer.close()
+    return done
+
+
+def generate_to(rows, fmt="csv", output="upi_transactions.csv", workers=None, seed=0,
+                burst_rate=0.0, pair_rate=0.0, days=30, end=None, mongo_uri=None,
+                mongo_db="upi_fraud_db", identities=IDENTITY_POOL_SIZE) -> int:
+    """
+    Generate `rows` transactions across worker processes. Shard i always gets
+    seed SeedSequence(seed).spawn(...)[i], so a given seed (and `end`, which
+    defaults to now) produces the same data whatever the worker count.
+
+    csv:     one file at `output` (shards are concatenated in order)
+    parquet: a dataset directory at `output` with one part file per shard
+    mongo:   inserted into <mongo_db>.transactions by the workers directly
+    """
+    pools = build_pools(seed, identities=identities)
+    end = end or datetime.now().replace(microsecond=0)
+    options = {
+        "start": end - timedelta(days=days), "end": end,
+        "burst_rate": burst_rate, "pair_rate": pair_rate,
+        "mongo_uri": mongo_uri, "mongo_db": mongo_db,
+    }
+
+    n_shards = max(1, -(-rows // SHARD_SIZE))
+    seeds = np.random.SeedSequence(seed).spawn(n_shards)
+    sizes = [min(SHARD_SIZE, rows - i * SHARD_SIZE) for i in range(n_shards)]
+
+    if fmt == "csv":
+        part_dir = output + ".parts"
+    elif fmt == "parquet":
+        part_dir = output
+    else:
+        part_dir = None
+    if part_dir:
+        shutil.rmtree(part_dir, ignore_errors=True)
+        os.makedirs(part_dir)
+    ext = "csv" if fmt == "csv" else "parquet"
+    paths = [os.path.join(part_dir, f"part-{i:05d}.{ext}") if part_dir else None for i in range(n_shards)]
+
+    jobs = list(zip(sizes, seeds, [fmt] * n_shards, paths, [options] * n_shards))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(pools,)) as pool:
+        written = sum(pool.map(_write_shard, jobs))
+
+    if fmt == "csv":
+        with open(output, "w", newline="") as out:
+            out.write(",".join(COLUMNS) + "\n")
+            for path in paths:
+                if os.path.exists(path):
+                    with open(path) as part:
+                        shutil.copyfileobj(part, out, 1 << 20)
+        shutil.rmtree(part_dir, ignore_errors=True)
+    return written
+
+
 # Save to CSV or use with Mongo later
 if __name__ == "__main__":
-    data = generate_transactions(500)
-    df = pd.DataFrame(data)
-    df.to_csv("upi_transactions.csv", index=False)
-    print("✅ 500 transactions generated and saved to 'upi_transactions.csv'")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic UPI transactions.")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--format", choices=["csv", "parquet", "mongo"], default="csv")
+    parser.add_argument("--output", default="upi_transactions.csv", help="CSV file or Parquet directory")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--days", type=int, default=30, help="transactions span the N days before --end")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="end of the time window (default: now)")
+    parser.add_argument("--burst-rate", type=float, default=0.0, help="share of rows turned into velocity bursts")
+    parser.add_argument("--pair-rate", type=float, default=0.0, help="share of rows turned into repeated pairs")
+    parser.add_argument("--identities", type=int, default=IDENTITY_POOL_SIZE, help="size of the Faker email pool")
+    parser.add_argument("--mongo-uri", help="server for --format mongo (default: MONGO_URI)")
+    parser.add_argument("--mongo-db", default="upi_fraud_db")
+    args = parser.parse_args()
+
+    written = generate_to(args.rows, fmt=args.format, output=args.output, workers=args.workers,
+                          seed=args.seed, burst_rate=args.burst_rate, pair_rate=args.pair_rate,
+                          days=args.days, end=args.end, mongo_uri=args.mongo_uri, mongo_db=args.mongo_db,
+                          identities=args.identities)
+    target = f"{args.mongo_db}.transactions" if args.format == "mongo" else f"'{args.output}'"
+    print(f"✅ {written} transactions generated and saved to {target}")
@@ -0,0 +1,194 @@
+import itertools
+import json
+import os
+import shutil
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+from velocity import VelocityTracker, VELOCITY_FEATURES
+
+logger = logging.getLogger("UPIFraudDetection")
+
+FEATURES = ["amount", "hour", "day_of_week", "device_enc"]
+
+# On-disk cache of training matrices, one sub-directory per cache name
+CACHE_DIR = os.environ.get("FEATURE_CACHE_DIR", "feature_cache")
+# Documents per cursor batch / per converted chunk
+BATCH_SIZE = int(os.environ.get("FEATURE_BATCH_SIZE", 10000))
+
+# Days of history a full training run reads; 0 reads everything, hot and archived
+TRAINING_WINDOW_DAYS = int(os.environ.get("TRAINING_WINDOW_DAYS", 0))
+
+X_FILE = "X.f32"
+Y_FILE = "y.i1"
+META_FILE = "meta.json"
+
+
+def _chunks(cursor, size):
+    chunk = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def window_start(days=TRAINING_WINDOW_DAYS):
+    """Start of a `days`-long training window ending now, or None for no bound."""
+    return datetime.utcnow() - timedelta(days=days) if days else None
+
+
+def build_feature_cache(transactions, flagged, name="full", query=None, vocabulary=None,
+                        velocity=False, batch_size=BATCH_SIZE, cache_dir=CACHE_DIR,
+                        since=None, archived=False) -> dict:
+    """
+    Stream `transactions` into a row-major float32 feature matrix and an int8
+    label vector on disk, one chunk at a time.
+
+    Only the fields the features need are projected from the cursor. Labels
+    come from one `$in` query on `flagged` per chunk. With `vocabulary` the
+    device encoding is fixed (unseen devices -> -1); otherwise a sorted,
+    LabelEncoder-compatible vocabulary is built during the scan. With
+    `velocity` the cursor is read in time order and VELOCITY_FEATURES are
+    appended from a streaming VelocityTracker.
+
+    With `since` only transactions from then on are read (a bounded training
+    window). With `archived`, the months moved to the Parquet archive
+    (retention.py) that fall inside the window are read first, and labels
+    also come from the archived flagged documents.
+
+    Returns the cache metadata (also written to meta.json).
+    """
+    features = FEATURES + (VELOCITY_FEATURES if velocity else [])
+    path = os.path.join(cache_dir, name)
+    tmp_path = path + ".building"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    projection = {"_id": 1, "time": 1, "amount": 1, "device": 1}
+    if velocity:
+        projection.update({"sender": 1, "receiver": 1})
+    if since is not None:
+        query = {"$and": [query, {"time": {"$gte": since}}]} if query else {"time": {"$gte": since}}
+    cursor = transactions.find(query or {}, projection).batch_size(batch_size)
+    cursor = cursor.sort("time", 1) if velocity else cursor.sort("_id", 1)
+    chunks = _chunks(cursor, batch_size)
+
+    archived_fraud = set()
+    if archived:
+        import retention
+
+        # Archived months are older than anything hot, so time order holds for velocity
+        archived_fraud = retention.archived_ids(flagged.name, since)
+        chunks = itertools.chain(
+            retention.iter_archived(transactions.name, since, columns=list(projection), chunk_size=batch_size),
+            chunks,
+        )
+
+    fixed_vocab = vocabulary is not None
+    device_codes = {d: i for i, d in enumerate(vocabulary)} if fixed_vocab else {}
+    tracker = VelocityTracker() if velocity else None
+
+    rows = 0
+    positives = 0
+    watermark = None
+    with open(os.path.join(tmp_path, X_FILE), "wb") as xf, open(os.path.join(tmp_path, Y_FILE), "wb") as yf:
+        for chunk in chunks:
+            n = len(chunk)
+            X = np.empty((n, len(features)), dtype=np.float32)
+
+            times = pd.to_datetime([d.get("time") for d in chunk], errors="coerce")
+            X[:, 0] = pd.to_numeric(pd.Series([d.get("amount", 0) for d in chunk]), errors="coerce").fillna(0).to_numpy()
+            X[:, 1] = times.hour
+            X[:, 2] = times.dayofweek
+
+            for i, doc in enumerate(chunk):
+                device = doc.get("device", "Unknown")
+                code = device_codes.get(device)
+                if code is None:
+                    if fixed_vocab:
+                        code = -1
+                    else:
+                        # Provisional code in order of appearance; remapped to sorted order at the end
+                        code = device_codes[device] = len(device_codes)
+                X[i, 3] = code
+
+            if tracker is not None:
+                for i, doc in enumerate(chunk):
+                    ts = times[i]
+                    if ts is pd.NaT:
+                        X[i, len(FEATURES):] = 0
+                        continue
+                    v = tracker.record(str(doc.get("sender", "")).lower(), str(doc.get("receiver", "")).lower(),
+                                       float(X[i, 0]), ts.to_pydatetime())
+                    X[i, len(FEATURES):] = [v[f] for f in VELOCITY_FEATURES]
+
+            ids = [d["_id"] for d in chunk]
+            fraud_ids = {d["_id"] for d in flagged.find({"_id": {"$in": ids}}, {"_id": 1})}
+            if archived_fraud:
+                fraud_ids.update(i for i in ids if i in archived_fraud)
+            y = np.fromiter((i in fraud_ids for i in ids), dtype=np.int8, count=n)
+
+            xf.write(X.tobytes())
+            yf.write(y.tobytes())
+            rows += n
+            positives += int(y.sum())
+            chunk_max = max(ids)
+            watermark = chunk_max if watermark is None or chunk_max > watermark else watermark
+
+    if not fixed_vocab:
+        # Remap provisional device codes to LabelEncoder's sorted order, chunk by chunk
+        vocabulary = sorted(device_codes)
+        remap = np.empty(len(device_codes), dtype=np.float32)
+        for device, code in device_codes.items():
+            remap[code] = vocabulary.index(device)
+        if rows:
+            X = np.memmap(os.path.join(tmp_path, X_FILE), dtype=np.float32, mode="r+", shape=(rows, len(features)))
+            for start in range(0, rows, batch_size):
+                block = X[start:start + batch_size, 3]
+                X[start:start + batch_size, 3] = remap[block.astype(np.int64)]
+            X.flush()
+            del X
+
+    meta = {
+        "rows": rows,
+        "positives": positives,
+        "features": features,
+        "vocabulary": list(vocabulary),
+        "watermark": str(watermark) if watermark is not None else None,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump(meta, f)
+
+    # Swap the finished cache into place
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    logger.info(f"🗂️ Feature cache '{name}' built: {rows} rows, {positives} fraud")
+    return meta
+
+
+def open_feature_cache(name="full", cache_dir=CACHE_DIR):
+    """Return (X, y, meta) with X and y memory-mapped read-only from the cache."""
+    path = os.path.join(cache_dir, name)
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    rows = meta["rows"]
+    if rows == 0:
+        return np.empty((0, len(meta["features"])), dtype=np.float32), np.empty(0, dtype=np.int8), meta
+    X = np.memmap(os.path.join(path, X_FILE), dtype=np.float32, mode="r", shape=(rows, len(meta["features"])))
+    y = np.memmap(os.path.join(path, Y_FILE), dtype=np.int8, mode="r", shape=(rows,))
+    return X, y, meta
+
+
+def device_encoder_for(meta) -> LabelEncoder:
+    """A fitted LabelEncoder equivalent to the cache's device vocabulary."""
+    le = LabelEncoder()
+    le.classes_ = np.array(meta["vocabulary"], dtype=object)
+    return le
@@ -0,0 +1,291 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from metrics import stage, ERRORS
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Flush when this many writes are pending ...
+FLUSH_SIZE = int(os.environ.get("FLAG_WRITER_FLUSH_SIZE", 500))
+# ... or when the oldest pending write is this old (seconds)
+FLUSH_INTERVAL = float(os.environ.get("FLAG_WRITER_FLUSH_INTERVAL", 1.0))
+# Bound on queued writes; beyond this callers wait, then write inline
+MAX_QUEUE = int(os.environ.get("FLAG_WRITER_MAX_QUEUE", 20000))
+# How long a caller waits for queue space before writing synchronously (seconds)
+PUT_TIMEOUT = float(os.environ.get("FLAG_WRITER_PUT_TIMEOUT", 0.05))
+# Attempts per write before its documents are dropped (and logged) ...
+WRITE_ATTEMPTS = int(os.environ.get("FLAG_WRITER_WRITE_ATTEMPTS", 4))
+# ... waiting this long before the first retry, doubling each time (seconds)
+RETRY_BACKOFF = float(os.environ.get("FLAG_WRITER_RETRY_BACKOFF", 0.5))
+
+DUPLICATE_KEY = 11000
+
+_STOP = object()
+
+
+class FlaggedWriter:
+    """
+    Write-behind for flagged transactions and sender blocks.
+
+    Request handlers enqueue documents and return; a background thread drains
+    the bounded queue and groups them into one insert_many for
+    `flagged_transactions` and one bulk_write of upserts for `blocked_senders`
+    per flush. When the queue is full the caller waits up to PUT_TIMEOUT and then
+    writes its document directly, so nothing is dropped under load. The insert
+    and the block upserts are written and retried (WRITE_ATTEMPTS, with
+    exponential backoff) independently, so one failing never loses the other;
+    what still fails is logged by _id / upi_id and counted as dropped. close()
+    drains everything still queued and is registered with atexit.
+    """
+
+    def __init__(self, flagged_collection, blocked_collection, flush_size=FLUSH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE, put_timeout=PUT_TIMEOUT,
+                 on_flagged=None, write_attempts=WRITE_ATTEMPTS, retry_backoff=RETRY_BACKOFF):
+        self.flagged_collection = flagged_collection
+        self.blocked_collection = blocked_collection
+        # Callbacks run, each on its own, with each batch of flagged documents once the flush is written
+        self.on_flagged = list(on_flagged or [])
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.write_attempts = max(1, write_attempts)
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        self.written_flagged = 0
+        self.written_blocks = 0
+        self.flushes = 0
+        self.failures = 0
+        self.retries = 0
+        self.dropped_flagged = 0
+        self.dropped_blocks = 0
+        self.backpressure = 0
+
+        atexit.register(self.close)
+
+    # ------------------------
+    # Producer side
+    # ------------------------
+    def _ensure_started(self):
+        # Threads do not survive fork, so (re)start the worker in each process
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="flagged-writer", daemon=True)
+            self._thread.start()
+
+    def _put(self, item):
+        if self._closed:
+            self._write([item])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            self.backpressure += 1
+            self._write([item])
+
+    def saturated(self) -> bool:
+        """True when a submit would have to wait for queue space (and maybe write inline)."""
+        return self._queue.full()
+
+    def submit_flagged(self, doc: dict):
+        self._put(("flagged", doc))
+
+    def submit_flagged_many(self, docs: list):
+        for doc in docs:
+            self._put(("flagged", doc))
+
+    def submit_block(self, upi_id: str, reason: str, blocked_at):
+        self._put(("block", (upi_id, reason, blocked_at)))
+
+    # ------------------------
+    # Consumer side
+    # ------------------------
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                # Also take anything a producer enqueued while close() was setting the stop marker
+                self._write(pending + self._drain())
+                return
+            if item is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(item)
+
+            if pending and (len(pending) >= self.flush_size or time.monotonic() >= deadline):
+                self._write(pending)
+                pending = []
+                deadline = None
+
+    def _write(self, items):
+        if not items:
+            return
+        docs = [payload for kind, payload in items if kind == "flagged"]
+        # Last reason wins when a sender is blocked more than once in a flush
+        blocks = {}
+        for kind, payload in items:
+            if kind == "block":
+                blocks[payload[0]] = payload
+
+        if docs:
+            with stage("flagged_insert"):
+                try:
+                    dropped = self._insert_flagged(docs)
+                except Exception as e:
+                    # Not a server error, so not worth retrying (e.g. a document BSON cannot encode)
+                    logger.error(f"⚠️ Flagged writer could not insert {len(docs)} docs: {e}")
+                    dropped = docs
+            if dropped:
+                self._dropped("flagged", [doc.get("_id") for doc in dropped])
+                self.dropped_flagged += len(dropped)
+                dropped_ids = {id(doc) for doc in dropped}
+                docs = [doc for doc in docs if id(doc) not in dropped_ids]
+            self.written_flagged += len(docs)
+        if blocks:
+            with stage("block_upsert"):
+                written = self._upsert_blocks(list(blocks.values()))
+            if written:
+                self.written_blocks += len(blocks)
+            else:
+                self._dropped("block", list(blocks))
+                self.dropped_blocks += len(blocks)
+        self.flushes += 1
+
+        # After both writes, so a failing callback (e.g. the dashboard counters) cannot hold up either
+        if docs:
+            for callback in self.on_flagged:
+                try:
+                    callback(docs)
+                except Exception as e:
+                    ERRORS.inc("flag_writer_callback")
+                    logger.error(f"⚠️ Flagged writer callback {getattr(callback, '__name__', callback)} "
+                                 f"failed for {len(docs)} docs: {e}")
+
+    def _retry_wait(self, attempt, what, error) -> bool:
+        """Sleep before the next attempt; False once attempts are used up."""
+        if attempt + 1 >= self.write_attempts:
+            return False
+        self.retries += 1
+        delay = self.retry_backoff * 2 ** attempt
+        logger.warning(f"⚠️ Flagged writer {what} failed (attempt {attempt + 1}/{self.write_attempts}), "
+                       f"retrying in {delay:.1f}s: {error}")
+        time.sleep(delay)
+        return True
+
+    def _insert_flagged(self, docs) -> list:
+        """Insert docs, retrying what failed; returns the documents that never made it."""
+        pending = docs
+        attempt = 0
+        while True:
+            try:
+                self.flagged_collection.insert_many(pending, ordered=False)
+                return []
+            except BulkWriteError as e:
+                # insert_many set each _id, so documents a failed attempt did write come back as
+                # duplicate keys on the next one: only the other errors are retried
+                failed = sorted({err["index"] for err in e.details.get("writeErrors", [])
+                                 if err.get("code") != DUPLICATE_KEY})
+                if e.details.get("writeConcernError") or e.details.get("writeConcernErrors"):
+                    # Written but not acknowledged by the write concern: re-send the whole attempt,
+                    # whatever did land comes back as a duplicate key
+                    failed = range(len(pending))
+                pending = [pending[i] for i in failed]
+                if not pending:
+                    return []
+                error = e
+            except PyMongoError as e:
+                error = e
+            if not self._retry_wait(attempt, f"insert of {len(pending)} docs", error):
+                return pending
+            attempt += 1
+
+    def _upsert_blocks(self, blocks) -> bool:
+        """Upsert blocks (idempotent, so simply re-sent on failure); False if every attempt failed."""
+        attempt = 0
+        while True:
+            try:
+                self.blocked_collection.bulk_write([
+                    UpdateOne({"upi_id": upi_id}, {"$set": {"reason": reason, "blocked_at": blocked_at}}, upsert=True)
+                    for upi_id, reason, blocked_at in blocks
+                ], ordered=False)
+                return True
+            except PyMongoError as e:
+                if not self._retry_wait(attempt, f"upsert of {len(blocks)} blocks", e):
+                    return False
+            except Exception as e:
+                # As for the insert: not a server error, so not worth retrying
+                logger.error(f"⚠️ Flagged writer could not upsert {len(blocks)} blocks: {e}")
+                return False
+            attempt += 1
+
+    def _dropped(self, kind, ids):
+        self.failures += 1
+        ERRORS.inc("flag_writer")
+        logger.error(f"⚠️ Flagged writer dropped {len(ids)} {kind} writes after "
+                     f"{self.write_attempts} attempts: {ids}")
+
+    def close(self, timeout=10.0):
+        """Stop accepting queued writes and drain what is pending."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Still writing: the queue (stop marker included) stays with the thread, which
+                # writes its in-flight batch and everything queued before it exits
+                logger.warning(f"⚠️ Flagged writer did not finish within {timeout}s; "
+                               f"{self._queue.qsize()} writes still queued")
+                return
+
+        # No writer thread (never started, or started in the parent process): write what is queued
+        self._write(self._drain())
+
+    def _drain(self) -> list:
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written_flagged": self.written_flagged,
+            "written_blocks": self.written_blocks,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "dropped_flagged": self.dropped_flagged,
+            "dropped_blocks": self.dropped_blocks,
+            "backpressure": self.backpressure,
+        }
@@ -0,0 +1,291 @@
+import json
+import operator
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# ----------------------------
+# Rule definitions
+# ----------------------------
+# Each rule matches when its conditions hold ("all" = AND, "any" = OR) against a
+# transaction row with the fields: sender, receiver, amount, device, hour,
+# day_of_week, sender_blocked, plus the velocity.VELOCITY_FEATURES counts. `reason` is formatted with the row, and `scopes`
+# says whether the online API, the offline re-flagging job (reflag.py), or both
+# use it; velocity rules run in both, offline against a time-ordered replay.
+# A match flags the transaction and, online, blocks the sender, unless the rule
+# says "blocks": false. Velocity rules do: they also fire for honest customers
+# (the sixth person paying a busy shop within five minutes, a fourth payment to
+# the same person in a day), so they flag for review without blocking anyone.
+# Rules can be overridden by a JSON file (FRAUD_RULES_FILE) or by documents in
+# the `fraud_rules` collection; they are read once and compiled into predicates.
+DEFAULT_RULES = [
+    {
+        "name": "blacklist",
+        "reason": "Blacklisted UPI ID",
+        "match": "any",
+        "scopes": ["online"],
+        "when": [
+            {"field": "sender", "op": "in", "value": ["scam@upi", "fraud123@okaxis", "spam@okhdfc"]},
+            {"field": "receiver", "op": "in", "value": ["scam@upi", "fraud123@okaxis", "spam@okhdfc"]},
+        ],
+    },
+    {
+        "name": "blocked_sender",
+        "reason": "Sender {sender} already blocked",
+        "scopes": ["online"],
+        "when": [{"field": "sender_blocked", "op": "eq", "value": True}],
+    },
+    {
+        "name": "high_amount",
+        "reason": "High transaction amount",
+        "scopes": ["online"],
+        "when": [{"field": "amount", "op": "gt", "value": 10000}],
+    },
+    {
+        "name": "suspicious_hours",
+        "reason": "Transaction during suspicious hours",
+        "scopes": ["online"],
+        "when": [{"field": "hour", "op": "lt", "value": 5}],
+    },
+    {
+        "name": "unknown_device",
+        "reason": "Unknown device",
+        "scopes": ["online"],
+        "when": [{"field": "device", "op": "not_in", "value": ["Android", "iOS", "Windows", "Linux"]}],
+    },
+    {
+        "name": "receiver_burst",
+        "reason": "More than 5 txns to same receiver in 5 minutes",
+        "blocks": False,
+        "when": [{"field": "receiver_count_5m", "op": "gt", "value": 5}],
+    },
+    {
+        "name": "sender_burst",
+        "reason": "High frequency by sender in 1 minute",
+        "blocks": False,
+        "when": [{"field": "sender_count_1m", "op": "gt", "value": 5}],
+    },
+    {
+        "name": "repeated_pair",
+        "reason": "Repeated sender-receiver pair in 1 day",
+        "blocks": False,
+        "when": [{"field": "pair_count_1d", "op": "gt", "value": 3}],
+    },
+    {
+        "name": "night_high_amount",
+        "reason": "High amount during night hours",
+        "scopes": ["offline"],
+        "when": [
+            {"field": "amount", "op": "gt", "value": 50000},
+            {"field": "hour", "op": "lt", "value": 5},
+        ],
+    },
+    {
+        "name": "night_desktop_device",
+        "reason": "Suspicious device used at night",
+        "scopes": ["offline"],
+        "when": [
+            {"field": "device", "op": "in", "value": ["Linux", "Windows"]},
+            {"field": "hour", "op": "lt", "value": 5},
+        ],
+    },
+]
+
+RULES_FILE = os.environ.get("FRAUD_RULES_FILE")
+
+_SCALAR_OPS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def load_rules(db=None, path=RULES_FILE) -> list:
+    """
+    Load rule definitions once: from a JSON file if given, else from the
+    `fraud_rules` collection if it has any enabled rules, else DEFAULT_RULES.
+    """
+    if path:
+        with open(path) as f:
+            rules = json.load(f)
+        logger.info(f"Loaded {len(rules)} fraud rules from {path}")
+        return rules
+
+    if db is not None:
+        try:
+            rules = list(db["fraud_rules"].find({"enabled": {"$ne": False}}, {"_id": 0}))
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load fraud rules from MongoDB: {e}")
+            rules = []
+        if rules:
+            logger.info(f"Loaded {len(rules)} fraud rules from MongoDB")
+            return rules
+
+    return DEFAULT_RULES
+
+
+def _compile_condition(cond):
+    """Turn one condition into (row predicate, column predicate)."""
+    field, op, value = cond["field"], cond["op"], cond.get("value")
+
+    if op in ("in", "not_in"):
+        values = frozenset(value)
+        values_arr = np.array(list(values), dtype=object)
+        negate = op == "not_in"
+
+        def col_pred(cols, n):
+            if field not in cols:
+                return np.zeros(n, dtype=bool)
+            hit = np.isin(np.asarray(cols[field], dtype=object), values_arr)
+            return ~hit if negate else hit
+
+        if negate:
+            return (lambda row: row.get(field) not in values), col_pred
+        return (lambda row: row.get(field) in values), col_pred
+
+    if op not in _SCALAR_OPS:
+        raise ValueError(f"Unknown rule operator: {op}")
+    fn = _SCALAR_OPS[op]
+
+    def row_pred(row):
+        v = row.get(field)
+        # A missing field never matches, rather than failing the comparison
+        return v is not None and fn(v, value)
+
+    def col_pred(cols, n):
+        if field not in cols:
+            return np.zeros(n, dtype=bool)
+        return fn(np.asarray(cols[field]), value)
+
+    return row_pred, col_pred
+
+
+class CompiledRule:
+    def __init__(self, definition):
+        self.name = definition["name"]
+        self.reason = definition["reason"]
+        self.match_any = definition.get("match", "all") == "any"
+        self.scopes = set(definition.get("scopes", ["online", "offline"]))
+        self.blocks = definition.get("blocks", True)
+        compiled = [_compile_condition(c) for c in definition["when"]]
+        self._row_preds = [c[0] for c in compiled]
+        self._col_preds = [c[1] for c in compiled]
+        self.fields = {c["field"] for c in definition["when"]}
+        self._needs_format = "{" in self.reason
+
+        # Timing
+        self.calls = 0
+        self.matches = 0
+        self.total_time = 0.0
+
+    def matches_row(self, row) -> bool:
+        # any()/all() stop at the first condition that decides the rule
+        if self.match_any:
+            return any(p(row) for p in self._row_preds)
+        return all(p(row) for p in self._row_preds)
+
+    def match_columns(self, cols, n):
+        """Return a boolean mask over n rows."""
+        if self.match_any:
+            mask = np.zeros(n, dtype=bool)
+            for p in self._col_preds:
+                mask |= p(cols, n)
+                if mask.all():
+                    break
+        else:
+            mask = np.ones(n, dtype=bool)
+            for p in self._col_preds:
+                mask &= p(cols, n)
+                if not mask.any():
+                    break
+        return mask
+
+    def format_reason(self, row) -> str:
+        return self.reason.format_map(row) if self._needs_format else self.reason
+
+
+class RuleEngine:
+    """
+    Evaluates compiled rules against a single transaction row or a columnar
+    batch (dict of equal-length lists / arrays). Rule definitions are compiled
+    once; evaluation never touches the database.
+    """
+
+    def __init__(self, definitions=None, scope="online"):
+        self.scope = scope
+        self._lock = threading.Lock()
+        self.rules = []
+        self.load(definitions if definitions is not None else DEFAULT_RULES)
+
+    def load(self, definitions):
+        rules = [CompiledRule(d) for d in definitions]
+        rules = [r for r in rules if self.scope in r.scopes]
+        with self._lock:
+            self.rules = rules
+            # Reasons of rules that flag without blocking (formatted reasons always block)
+            self._non_blocking = {r.reason for r in rules if not r.blocks and not r._needs_format}
+        logger.info(f"Rule engine ({self.scope}) compiled {len(rules)} rules")
+
+    @property
+    def fields(self) -> set:
+        return set().union(*(r.fields for r in self.rules)) if self.rules else set()
+
+    def evaluate(self, row: dict, first_match=False) -> list:
+        """Return the reasons matched by row. With first_match, stop after the first hit."""
+        reasons = []
+        for rule in self.rules:
+            start = time.perf_counter()
+            hit = rule.matches_row(row)
+            rule.total_time += time.perf_counter() - start
+            rule.calls += 1
+            if hit:
+                rule.matches += 1
+                reasons.append(rule.format_reason(row))
+                if first_match:
+                    break
+        return reasons
+
+    def evaluate_batch(self, cols: dict, n: int) -> list:
+        """Return a list of reason lists, one per row of the columnar batch."""
+        reasons = [[] for _ in range(n)]
+        if n == 0:
+            return reasons
+
+        for rule in self.rules:
+            start = time.perf_counter()
+            mask = rule.match_columns(cols, n)
+            rule.total_time += time.perf_counter() - start
+            rule.calls += n
+            hits = np.flatnonzero(mask)
+            rule.matches += len(hits)
+            for i in hits:
+                if rule._needs_format:
+                    row = {f: cols[f][i] for f in cols}
+                    reasons[i].append(rule.format_reason(row))
+                else:
+                    reasons[i].append(rule.reason)
+        return reasons
+
+    def blocks(self, reasons) -> bool:
+        """Whether any of `reasons` (from evaluate, plus e.g. the ML verdict) should block the sender."""
+        return any(reason not in self._non_blocking for reason in reasons)
+
+    def stats(self) -> list:
+        return [
+            {
+                "rule": r.name,
+                "calls": r.calls,
+                "matches": r.matches,
+                "total_ms": round(r.total_time * 1000, 3),
+                "avg_us": round(r.total_time / r.calls * 1e6, 3) if r.calls else 0.0,
+            }
+            for r in self.rules
+        ]
@@ -0,0 +1,49 @@
+# gunicorn.conf.py -- gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master and the ML model loaded there
+# before workers are forked, so every worker starts without importing or
+# unpickling anything and shares the model's memory copy-on-write.
+import gc
+import os
+import time
+import logging
+
+logger = logging.getLogger("UPIFraudDetection")
+
+wsgi_app = "app:app"
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+
+# GUNICORN_PRELOAD=0 imports the app in each worker instead (e.g. for --reload while developing)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before the first worker is forked
+    if not preload_app:
+        return
+    import ml_predictor
+    import database
+
+    try:
+        ml_predictor.preload()
+    except Exception as e:
+        # Workers fall back to loading the model on their first prediction
+        logger.error(f"⚠️ Could not preload the model in the master: {e}")
+
+    # Workers open their own pools; the master has no use for its connections
+    database.close_client()
+
+    # Objects allocated so far are never collected, so the GC in the workers
+    # does not write to (and copy) the pages they share with the master
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.booted_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    logger.info(f"🚀 Worker {worker.pid} ready in {(time.perf_counter() - worker.booted_at) * 1000:.0f} ms")
@@ -1,70 +1,58 @@
-from pymongo import MongoClient
-import pandas as pd
+import os
+import sys
+
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from database import get_db
+from export import FRAUD_MATCH, breakdowns, export_to_file
+
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["upi_fraud_db"]
+db = get_db()
 flagged = db["flagged_transactions"]
 
-# Load flagged transactions into DataFrame
-data = list(flagged.find({}))
-df = pd.DataFrame(data)
-
-# Convert time to datetime
-df["time"] = pd.to_datetime(df["time"])
-
-# Extract hour, date
-df["hour"] = df["time"].dt.hour
-df["date"] = df["time"].dt.date
+# Counts are aggregated by the server; no documents are loaded here
+counts = breakdowns(flagged, FRAUD_MATCH, fields=("device", "city"))
 
 # Show quick summary
-print("🔍 Total Flagged Records:", len(df))
-print(df.head(3))
+print("🔍 Total Flagged Records:", sum(counts["device"].values()))
+print(flagged.find_one(FRAUD_MATCH, {"_id": 0}))
+
+
+def bar_chart(series, title, xlabel, ylabel, color, path, figsize=(10, 4)):
+    plt.figure(figsize=figsize)
+    plt.bar(list(series.keys()), list(series.values()), color=color)
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.xticks(rotation=90)
+    plt.grid(True, axis='y', linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.show()
+
 
 # ==========================
 # 📊 1. Frequency of Fraud by Hour
 # ==========================
-plt.figure(figsize=(10, 4))
-df["hour"].value_counts().sort_index().plot(kind='bar', color='tomato')
-plt.title("Fraudulent Transactions by Hour")
-plt.xlabel("Hour of Day")
-plt.ylabel("Number of Transactions")
-plt.grid(True, axis='y', linestyle='--', alpha=0.7)
-plt.tight_layout()
-plt.savefig("fraud_by_hour.png")
-plt.show()
+bar_chart(counts["hour"], "Fraudulent Transactions by Hour", "Hour of Day", "Number of Transactions",
+          "tomato", "fraud_by_hour.png")
 
 # ==========================
 # 📊 2. Fraud by City (if 'city' field exists)
 # ==========================
-if "city" in df.columns:
-    plt.figure(figsize=(10, 4))
-    df["city"].value_counts().plot(kind='bar', color='steelblue')
-    plt.title("Fraudulent Transactions by City")
-    plt.xlabel("City")
-    plt.ylabel("Count")
-    plt.tight_layout()
-    plt.savefig("fraud_by_city.png")
-    plt.show()
+if set(counts["city"]) - {"Unknown"}:
+    bar_chart(counts["city"], "Fraudulent Transactions by City", "City", "Count", "steelblue", "fraud_by_city.png")
 
 # ==========================
 # 📊 3. Fraud by Device
 # ==========================
-if "device" in df.columns:
-    plt.figure(figsize=(8, 4))
-    df["device"].value_counts().plot(kind='bar', color='mediumseagreen')
-    plt.title("Fraudulent Transactions by Device")
-    plt.xlabel("Device")
-    plt.ylabel("Count")
-    plt.tight_layout()
-    plt.savefig("fraud_by_device.png")
-    plt.show()
+bar_chart(counts["device"], "Fraudulent Transactions by Device", "Device", "Count",
+          "mediumseagreen", "fraud_by_device.png", figsize=(8, 4))
 
 
 # ==========================
-# 💾 4. Export to CSV and Excel
+# 💾 4. Export (streamed, gzip-compressed)
 # ==========================
-df.to_csv("flagged_transactions.csv", index=False)
-df.to_excel("flagged_transactions.xlsx", index=False)
-print("✅ Exported to flagged_transactions.csv and .xlsx")
+export_to_file(flagged, "flagged_transactions.csv.gz", "csv", FRAUD_MATCH)
+print("✅ Exported to flagged_transactions.csv.gz (python export.py for other formats and filters)")
@@ -0,0 +1,246 @@
+"""
+Load a transactions CSV into MongoDB in chunks.
+
+    python ingest_transactions.py upi_transactions.csv
+    python ingest_transactions.py big.csv --workers 8 --chunk-size 50000
+    python ingest_transactions.py big.csv --upsert      # overwrite rows that changed
+
+Each chunk is type-converted (time -> datetime, amount -> float rounded to
+paise, is_fraud -> bool) and written by a thread pool with unordered
+insert_many. txn_id has a unique index, so re-running a load skips rows that
+are already there; --upsert replaces them instead. Progress is checkpointed
+next to the CSV, and an interrupted load resumes after the last chunk that
+was fully written.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+import pandas as pd
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from db_indexes import ensure_collection_indexes
+from database import get_db, create_client, MONGO_DB
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger("UPIFraudDetection")
+
+CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", 20000))
+WORKERS = int(os.environ.get("INGEST_WORKERS", 4))
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DUPLICATE_KEY = 11000
+
+CSV_DTYPES = {
+    "txn_id": "string",
+    "sender": "string",
+    "receiver": "string",
+    "location": "string",
+    "device": "string",
+    "amount": "string",
+    "time": "string",
+    "is_fraud": "string",
+}
+
+
+# ------------------------
+# Type conversion
+# ------------------------
+def convert_chunk(df: pd.DataFrame):
+    """
+    Return (documents, rejected) for one CSV chunk. Rows without a txn_id or
+    with an unparseable time/amount are rejected rather than stored half-typed.
+    """
+    # Mixed formats (with or without seconds, ISO "T") fall back to per-row parsing
+    times = pd.to_datetime(df["time"], format=TIME_FORMAT, errors="coerce")
+    if times.isna().any():
+        times = times.fillna(pd.to_datetime(df["time"], format="mixed", errors="coerce"))
+    amounts = pd.to_numeric(df["amount"], errors="coerce").round(2)
+    fraud = df["is_fraud"].str.strip().str.lower().isin(["true", "1", "yes"]) if "is_fraud" in df else None
+
+    valid = df["txn_id"].notna() & times.notna() & amounts.notna()
+    rejected = int((~valid).sum())
+
+    out = df.loc[valid].copy()
+    out["time"] = times[valid]
+    out["amount"] = amounts[valid].astype(float)
+    if fraud is not None:
+        out["is_fraud"] = fraud[valid].astype(bool)
+
+    # Drop empty optional fields instead of storing NaN
+    records = out.astype(object).where(out.notna(), None).to_dict(orient="records")
+    docs = [{k: v for k, v in r.items() if v is not None} for r in records]
+    return docs, rejected
+
+
+# ------------------------
+# Writes
+# ------------------------
+def write_chunk(collection, docs, upsert=False) -> dict:
+    """Write one chunk; duplicate txn_ids count as already loaded."""
+    if not docs:
+        return {"inserted": 0, "duplicates": 0}
+    # When the row reached Mongo, whatever its `time`: the hot-tier TTL expires on this (retention.py)
+    ingested_at = datetime.utcnow()
+    for doc in docs:
+        doc["ingested_at"] = ingested_at
+    if upsert:
+        result = collection.bulk_write(
+            [ReplaceOne({"txn_id": d["txn_id"]}, d, upsert=True) for d in docs], ordered=False
+        )
+        return {"inserted": result.upserted_count + result.modified_count, "duplicates": 0}
+
+    try:
+        result = collection.insert_many(docs, ordered=False)
+        return {"inserted": len(result.inserted_ids), "duplicates": 0}
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        other = [err for err in errors if err.get("code") != DUPLICATE_KEY]
+        if other:
+            raise
+        return {"inserted": e.details.get("nInserted", 0), "duplicates": len(errors)}
+
+
+def ensure_txn_id_index(collection):
+    # Declared in db_indexes; without it re-runs would duplicate rows
+    ensure_collection_indexes(collection)
+    if "txn_id_1" not in collection.index_information():
+        raise SystemExit("❌ Could not create the unique txn_id index (duplicate txn_ids already stored?)")
+
+
+# ------------------------
+# Checkpoint
+# ------------------------
+class Checkpoint:
+    """
+    Chunks fully written for one CSV, keyed by the file's size and mtime so a
+    changed file starts over. Saved atomically after every chunk.
+    """
+
+    def __init__(self, path, csv_path, chunk_size):
+        self.path = path
+        stat = os.stat(csv_path)
+        self.identity = {"file": os.path.abspath(csv_path), "size": stat.st_size,
+                         "mtime_ns": stat.st_mtime_ns, "chunk_size": chunk_size}
+        self.done = set()
+        self.totals = {"inserted": 0, "duplicates": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        if saved.get("identity") == self.identity:
+            self.done = set(range(saved.get("watermark", 0))) | set(saved.get("done", []))
+            self.totals.update(saved.get("totals", {}))
+            logger.info(f"⏩ Resuming: {len(self.done)} chunks already loaded")
+        else:
+            logger.info("ℹ️ CSV or chunk size changed since the last checkpoint, starting over")
+
+    @property
+    def first_pending(self) -> int:
+        """Chunks below this index are all done and need not be read again."""
+        n = 0
+        while n in self.done:
+            n += 1
+        return n
+
+    def mark(self, index, stats):
+        with self._lock:
+            self.done.add(index)
+            for key, value in stats.items():
+                self.totals[key] += value
+            # Chunks below the watermark are implied by it
+            watermark = self.first_pending
+            payload = {
+                "identity": self.identity,
+                "watermark": watermark,
+                "done": sorted(i for i in self.done if i > watermark),
+                "totals": self.totals,
+            }
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# ------------------------
+# Ingestion
+# ------------------------
+def ingest_csv(csv_path, collection, chunk_size=CHUNK_SIZE, workers=WORKERS, upsert=False,
+               checkpoint_path=None) -> dict:
+    """
+    Stream `csv_path` into `collection`. Parsing happens on this thread while
+    up to `workers` chunks are written concurrently; at most 2 * workers
+    chunks are held in memory.
+    """
+    ensure_txn_id_index(collection)
+    checkpoint = Checkpoint(checkpoint_path or csv_path + ".ingest.json", csv_path, chunk_size)
+
+    # Resume after the last contiguous completed chunk; pandas skips those lines without parsing them
+    start = checkpoint.first_pending
+    skip = range(1, start * chunk_size + 1) if start else None
+    reader = pd.read_csv(csv_path, dtype=CSV_DTYPES, chunksize=chunk_size, skiprows=skip)
+
+    def _load(index, frame):
+        docs, rejected = convert_chunk(frame)
+        stats = write_chunk(collection, docs, upsert=upsert)
+        stats["rejected"] = rejected
+        checkpoint.mark(index, stats)
+        return index, stats
+
+    t0 = time.perf_counter()
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        for offset, frame in enumerate(reader):
+            index = start + offset
+            if index in checkpoint.done:
+                continue
+            if len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+            pending.add(pool.submit(_load, index, frame))
+        for future in pending:
+            future.result()
+
+    totals = dict(checkpoint.totals, seconds=round(time.perf_counter() - t0, 2))
+    checkpoint.clear()
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a transactions CSV into MongoDB.")
+    parser.add_argument("csv", nargs="?", default="upi_transactions.csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--upsert", action="store_true", help="replace rows whose txn_id is already stored")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <csv>.ingest.json)")
+    parser.add_argument("--mongo-uri", help="server to load into (default: MONGO_URI)")
+    args = parser.parse_args()
+
+    db = create_client(args.mongo_uri)[MONGO_DB] if args.mongo_uri else get_db()
+    collection = db["transactions"]
+    totals = ingest_csv(args.csv, collection, chunk_size=args.chunk_size, workers=args.workers,
+                        upsert=args.upsert, checkpoint_path=args.checkpoint)
+    logger.info(f"✅ Ingested '{args.csv}': {totals['inserted']} written, {totals['duplicates']} already present, "
+                f"{totals['rejected']} rejected in {totals['seconds']}s")
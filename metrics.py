@@ -0,0 +1,267 @@
+import bisect
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Latency buckets in seconds, from tens of microseconds (cache hits, rules) up to seconds
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Sampling profiler limits
+PROFILE_MAX_SECONDS = 300
+PROFILE_INTERVAL = 0.005
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = bound if bound == "+Inf" else repr(float(bound))
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class Registry:
+    """
+    Metrics of this process in the Prometheus text format. Collectors are
+    callables returning (name, type, help, [(labels_dict, value), ...]) for
+    figures that other components already track (rule timings, queue depth).
+    Each gunicorn worker has its own registry; scrape every worker or sum.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.error(f"⚠️ Metrics collector failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "upi_stage_seconds", "Time spent in each stage of a fraud check", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "upi_request_seconds", "Fraud-check request latency", ["endpoint"])
+BATCH_ROWS = REGISTRY.histogram(
+    "upi_batch_rows", "Transactions per batch fraud-check request", [],
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000))
+CHECKS = REGISTRY.counter(
+    "upi_checks_total", "Transactions checked, by verdict", ["endpoint", "verdict"])
+ML_FRAUD = REGISTRY.counter(
+    "upi_ml_fraud_total", "Transactions the ML model classified as fraud")
+ERRORS = REGISTRY.counter(
+    "upi_errors_total", "Failures caught on the fraud-check path, by stage", ["stage"])
+
+
+@contextmanager
+def stage(name):
+    """Time a block into upi_stage_seconds{stage=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
+
+
+def timed(endpoint):
+    """Decorator timing a view into upi_request_seconds{endpoint=...}."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+        return wrapper
+    return decorator
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
+
+
+# Seconds taken by each startup phase of this process (import, model load, first request)
+STARTUP_SECONDS = {}
+
+
+def record_startup(phase, seconds):
+    """Record a startup phase once per process; later calls for the same phase are ignored."""
+    if phase not in STARTUP_SECONDS:
+        STARTUP_SECONDS[phase] = seconds
+        logger.info(f"⏱️ Startup {phase}: {seconds * 1000:.0f} ms")
+
+
+REGISTRY.register_collector(lambda: [
+    ("upi_startup_seconds", "gauge", "Duration of each startup phase in this process",
+     [({"phase": phase}, seconds) for phase, seconds in list(STARTUP_SECONDS.items())]),
+])
+
+
+# ------------------------
+# Sampling profiler
+# ------------------------
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack every `interval` seconds for a fixed
+    window and counts identical stacks. The result is in the collapsed
+    ("folded") format read by flamegraph.pl and speedscope. Off unless
+    started; only one window runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stacks = _Tally()
+        self.samples = 0
+        self.started_at = None
+        self.ends_at = None
+        self.interval = PROFILE_INTERVAL
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, interval=PROFILE_INTERVAL) -> bool:
+        seconds = min(float(seconds), PROFILE_MAX_SECONDS)
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = _Tally()
+            self.samples = 0
+            self.interval = max(float(interval), 0.001)
+            self.started_at = time.time()
+            self.ends_at = self.started_at + seconds
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"🔬 Sampling profiler started for {seconds:.0f}s every {self.interval * 1000:.1f}ms")
+        return True
+
+    def stop(self):
+        self.ends_at = time.time()
+
+    def _run(self):
+        own = threading.get_ident()
+        while time.time() < self.ends_at:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        logger.info(f"🔬 Sampling profiler finished: {self.samples} samples")
+
+    def folded(self) -> str:
+        stacks = self._stacks.copy()
+        return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "interval_ms": round(self.interval * 1000, 3),
+            "started_at": self.started_at,
+            "ends_at": self.ends_at,
+            "distinct_stacks": len(self._stacks),
+        }
+
+
+profiler = SamplingProfiler()
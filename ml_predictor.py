@@ -1,42 +1,215 @@
-import joblib
-import pandas as pd
+import os
+import numpy as np
+import threading
+import time
+import warnings
+import logging
 from datetime import datetime
 
-# Load trained model
-model = joblib.load("fraud_model.pkl")
-device_encoder = joblib.load("device_encoder.pkl")
+import model_store
+from metrics import record_startup
+from native_forest import try_flatten
 
+logger = logging.getLogger("UPIFraudDetection")
 
-def predict_fraud_ml(transaction: dict) -> bool:
+FEATURES = ["amount", "hour", "day_of_week", "device_enc"]
+
+# How often predictors check whether a newer model version has been published (seconds)
+RELOAD_CHECK_INTERVAL = 5.0
+
+# Predict with the flattened forest (native_forest.py) instead of sklearn when it matches exactly
+NATIVE_INFERENCE = os.environ.get("NATIVE_INFERENCE", "1") == "1"
+# Above this many rows sklearn's compiled tree walk beats the NumPy one
+NATIVE_MAX_ROWS = int(os.environ.get("NATIVE_MAX_ROWS", 128))
+
+# Versions published with a native artifact are memory-mapped (model_store.load_native): no
+# unpickling, and one copy in the page cache for all workers. Older versions are unpickled,
+# which pulls in sklearn (and pandas, scipy). Either way the model is loaded on the first
+# prediction; MODEL_PRELOAD=1 loads it at import, and gunicorn.conf.py calls preload() in the
+# master so forked workers share it copy-on-write.
+MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "0") == "1"
+
+
+class LoadedModel:
+    """
+    One published model version; predictors swap whole instances, never mutate one.
+
+    Built either from the sklearn model and encoder, or from the manifest and
+    the memory-mapped forest alone, in which case the sklearn model is only
+    unpickled if a batch larger than NATIVE_MAX_ROWS needs it.
+    """
+
+    def __init__(self, manifest, model=None, device_encoder=None, native=None, model_dir=None):
+        self.version = manifest["version"]
+        self.manifest = manifest
+        self.model_dir = model_dir or model_store.MODEL_DIR
+        self._model = model
+        self._model_lock = threading.Lock()
+        # Device vocabulary as a dict, so unknown devices map to -1 without exceptions
+        devices = device_encoder.classes_ if device_encoder is not None else manifest["devices"]
+        self.device_index = {d: i for i, d in enumerate(devices)}
+        # Columns the model was fitted on; includes velocity features when trained with them
+        self.features = list(manifest.get("features") or getattr(model, "feature_names_in_", FEATURES))
+        if native is None and model is not None and NATIVE_INFERENCE:
+            # No saved artifact: flatten now, parity-checked against sklearn
+            native = try_flatten(model)
+        self.native = native
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model, _ = model_store.load_pickles(self.manifest, self.model_dir)
+                    logger.info(f"🧠 Unpickled sklearn model {self.version} for large batches")
+        return self._model
+
+    def predict(self, X):
+        if self.native is not None and len(X) <= NATIVE_MAX_ROWS:
+            return self.native.predict(X)
+        # Models may be fitted on DataFrames (legacy) or bare matrices (feature cache);
+        # either way X is a matrix in self.features order
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message=".*feature names.*")
+            return self.model.predict(X)
+
+
+def _load_live() -> LoadedModel:
+    manifest = model_store.current_manifest()
+    if NATIVE_INFERENCE and manifest is not None:
+        try:
+            native = model_store.load_native(manifest)
+        except (OSError, ValueError) as e:
+            logger.error(f"⚠️ Native artifact of {manifest['version']} unusable, unpickling instead: {e}")
+            native = None
+        if native is not None:
+            return LoadedModel(manifest, native=native)
+    return LoadedModel(*model_store.load_current())
+
+
+_current = None
+_pointer_mtime = None
+_last_check = 0.0
+_reload_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+
+def preload() -> LoadedModel:
+    """Load the published model now unless it is already loaded."""
+    global _current, _pointer_mtime, _last_check
+    if _current is not None:
+        return _current
+    with _load_lock:
+        if _current is None:
+            start = time.perf_counter()
+            # Read the pointer first, so a version published during the load is picked up later
+            _pointer_mtime = model_store.pointer_mtime()
+            _current = _load_live()
+            _last_check = time.monotonic()
+            record_startup("model_load", time.perf_counter() - start)
+    return _current
+
+
+def _reload():
+    global _current
+    try:
+        loaded = _load_live()
+    except Exception as e:
+        logger.error(f"⚠️ Could not load published model: {e}")
+        return
+    # Single reference assignment: in-flight predictions keep the old instance
+    _current = loaded
+    logger.info(f"🔁 Switched to model version {loaded.version}")
+
+
+def current_model() -> LoadedModel:
+    """Return the live model, swapping in a newly published version in the background."""
+    global _last_check, _pointer_mtime
+
+    if _current is None:
+        return preload()
+
+    now = time.monotonic()
+    if now - _last_check >= RELOAD_CHECK_INTERVAL and _reload_lock.acquire(blocking=False):
+        try:
+            _last_check = now
+            mtime = model_store.pointer_mtime()
+            if mtime != _pointer_mtime:
+                _pointer_mtime = mtime
+                threading.Thread(target=_reload, name="model-reload", daemon=True).start()
+        finally:
+            _reload_lock.release()
+    return _current
+
+
+def predict_fraud_ml(transaction: dict, extra_features: dict = None) -> bool:
     """
     Predict if a transaction is fraudulent using ML model.
 
     transaction: dict with keys: sender, receiver, amount, device, timestamp
+    extra_features: optional precomputed features (e.g. velocity counts), used
+        when the model was trained with them
     Returns: True if fraud, False otherwise
     """
+    loaded = current_model()
+
     # Convert timestamp to datetime
     dt = datetime.fromisoformat(transaction.get("timestamp", datetime.utcnow().isoformat()))
     hour = dt.hour
     day_of_week = dt.weekday()
 
-    # Device encoding
-    device = transaction.get("device", "Unknown")
-    try:
-        device_enc = device_encoder.transform([device])[0]
-    except ValueError:
-        # Unknown device not seen during training
-        device_enc = -1
+    # Device encoding; devices not seen during training map to -1
+    device_enc = loaded.device_index.get(transaction.get("device", "Unknown"), -1)
 
     # Amount
     amount = float(transaction.get("amount", 0))
 
     # Prepare features
-    df = pd.DataFrame([{
+    row = {
         "amount": amount,
         "hour": hour,
         "day_of_week": day_of_week,
         "device_enc": device_enc
-    }])
+    }
+    if extra_features:
+        row.update(extra_features)
+    X = np.array([[row.get(f, 0) for f in loaded.features]], dtype=np.float64)
 
-    pred = model.predict(df)[0]
+    pred = loaded.predict(X)[0]
     return bool(pred)
+
+
+def predict_fraud_ml_batch(transactions: list, extra_features: list = None) -> list:
+    """
+    Predict a whole batch of transactions with a single model call.
+
+    transactions: list of dicts with the same keys as predict_fraud_ml
+    extra_features: optional list of feature dicts aligned with transactions
+    Returns: list of bools, in input order
+    """
+    n = len(transactions)
+    if n == 0:
+        return []
+
+    loaded = current_model()
+    now = datetime.utcnow().isoformat()
+
+    X = np.zeros((n, len(loaded.features)), dtype=np.float64)
+    for i, txn in enumerate(transactions):
+        dt = datetime.fromisoformat(txn.get("timestamp", now))
+        X[i, 0] = float(txn.get("amount", 0))
+        X[i, 1] = dt.hour
+        X[i, 2] = dt.weekday()
+        X[i, 3] = loaded.device_index.get(txn.get("device", "Unknown"), -1)
+
+    if extra_features:
+        for j, feature in enumerate(loaded.features[len(FEATURES):], start=len(FEATURES)):
+            X[:, j] = [f.get(feature, 0) for f in extra_features]
+
+    preds = loaded.predict(X)
+
+    return [bool(p) for p in preds]
+
+
+if MODEL_PRELOAD:
+    preload()
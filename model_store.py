@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import logging
+from datetime import datetime, timezone
+
+import joblib
+
+from native_forest import FlatForest, try_flatten, file_sha256
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Versioned artifacts live here; current.json points at the live version
+MODEL_DIR = os.environ.get("MODEL_DIR", "models")
+POINTER_FILE = "current.json"
+
+# Written by train_fraud_model.py; used when no versioned model has been published yet
+LEGACY_MODEL_PATH = "fraud_model.pkl"
+LEGACY_ENCODER_PATH = "device_encoder.pkl"
+
+# How many old versions to keep on disk
+KEEP_VERSIONS = 5
+
+# Manifest layout; 2 adds checksums, the device vocabulary and the memory-mappable forest
+ARTIFACT_FORMAT = 2
+
+# Check file checksums against the manifest when loading
+VERIFY_CHECKSUMS = os.environ.get("MODEL_VERIFY_CHECKSUMS", "1") == "1"
+
+
+def _pointer_path(model_dir=MODEL_DIR):
+    return os.path.join(model_dir, POINTER_FILE)
+
+
+def _atomic_write_json(path, payload):
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def publish_model(model, encoder, model_dir=MODEL_DIR, extra=None) -> str:
+    """
+    Save a model/encoder pair as a new version and point current.json at it.
+    Files are fully written before the pointer is swapped with os.replace, so
+    readers only ever see a complete version.
+
+    Besides the pickles (needed to grow the forest incrementally), a forest
+    that flattens exactly is saved as node arrays in forest-<version>/, which
+    predictors memory-map instead of unpickling (see load_native).
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    model_file = f"fraud_model-{version}.pkl"
+    encoder_file = f"device_encoder-{version}.pkl"
+
+    checksums = {}
+    for obj, name in ((model, model_file), (encoder, encoder_file)):
+        tmp = os.path.join(model_dir, f".tmp-{name}")
+        joblib.dump(obj, tmp)
+        checksums[name] = file_sha256(tmp)
+        os.replace(tmp, os.path.join(model_dir, name))
+
+    manifest = {
+        "version": version,
+        "format": ARTIFACT_FORMAT,
+        "model": model_file,
+        "encoder": encoder_file,
+        "devices": [str(d) for d in encoder.classes_],
+        "checksums": checksums,
+        "published_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if extra:
+        manifest.update(extra)
+    manifest.setdefault("features", [str(f) for f in getattr(model, "feature_names_in_", [])] or None)
+
+    flat = try_flatten(model)
+    if flat is not None:
+        forest_dir = f"forest-{version}"
+        tmp = os.path.join(model_dir, f".tmp-{forest_dir}")
+        native = flat.save(tmp)
+        os.replace(tmp, os.path.join(model_dir, forest_dir))
+        manifest["native"] = dict(native, dir=forest_dir)
+        checksums.update({f"{forest_dir}/{a['file']}": a["sha256"] for a in native["arrays"].values()})
+    # One digest over every file of the version
+    manifest["checksum"] = _combined_checksum(checksums)
+    _atomic_write_json(_pointer_path(model_dir), manifest)
+    logger.info(f"📦 Published model version {version}")
+
+    _prune(model_dir, keep=KEEP_VERSIONS)
+    return version
+
+
+def _combined_checksum(checksums) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(checksums):
+        digest.update(f"{name}:{checksums[name]}\n".encode())
+    return digest.hexdigest()
+
+
+def _prune(model_dir, keep):
+    versions = sorted(
+        f[len("fraud_model-"):-len(".pkl")]
+        for f in os.listdir(model_dir)
+        if f.startswith("fraud_model-") and f.endswith(".pkl")
+    )
+    for version in versions[:-keep]:
+        for prefix in ("fraud_model-", "device_encoder-"):
+            try:
+                os.remove(os.path.join(model_dir, f"{prefix}{version}.pkl"))
+            except FileNotFoundError:
+                pass
+        # Workers still mapping an old forest keep their pages until they switch
+        shutil.rmtree(os.path.join(model_dir, f"forest-{version}"), ignore_errors=True)
+
+
+def current_manifest(model_dir=MODEL_DIR):
+    """Return the live manifest, or None if nothing has been published."""
+    try:
+        with open(_pointer_path(model_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def pointer_mtime(model_dir=MODEL_DIR):
+    try:
+        return os.stat(_pointer_path(model_dir)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_current(model_dir=MODEL_DIR):
+    """
+    Load (manifest, model, encoder) for the live version, falling back to the
+    legacy pickles. The manifest carries the version and the feature list.
+    """
+    manifest = current_manifest(model_dir)
+    if manifest is None:
+        return {"version": "legacy"}, joblib.load(LEGACY_MODEL_PATH), joblib.load(LEGACY_ENCODER_PATH)
+    model, encoder = load_pickles(manifest, model_dir)
+    return manifest, model, encoder
+
+
+def _load_checked(manifest, model_dir, name):
+    path = os.path.join(model_dir, name)
+    expected = manifest.get("checksums", {}).get(name)
+    if VERIFY_CHECKSUMS and expected and file_sha256(path) != expected:
+        raise ValueError(f"checksum mismatch for {path}")
+    return joblib.load(path)
+
+
+def load_pickles(manifest, model_dir=MODEL_DIR):
+    """(model, encoder) of a published version, checked against the manifest's checksums."""
+    return _load_checked(manifest, model_dir, manifest["model"]), _load_checked(manifest, model_dir, manifest["encoder"])
+
+
+def load_native(manifest, model_dir=MODEL_DIR):
+    """
+    The version's forest as a FlatForest over memory-mapped node arrays, or
+    None when the version has no native artifact (older format, or a model
+    that does not flatten exactly). Needs neither sklearn nor unpickling.
+    """
+    native = (manifest or {}).get("native")
+    if not native or "devices" not in manifest:
+        return None
+    return FlatForest.load(os.path.join(model_dir, native["dir"]), native, verify=VERIFY_CHECKSUMS)
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Rows used by the load-time parity check against sklearn
+PARITY_SAMPLES = 2048
+
+# Node arrays saved by FlatForest.save, one .npy file each
+ARRAYS = ("feature", "threshold", "left", "right", "missing_left", "value", "roots", "is_leaf")
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FlatForest:
+    """
+    A fitted RandomForestClassifier flattened into contiguous node arrays.
+
+    All trees share one set of arrays (feature, threshold, left/right child,
+    missing-value direction, per-node class probabilities); `roots` holds the
+    index of each tree's first node. Prediction walks every tree for every row
+    together with NumPy, one level per step and dropping paths that reached a
+    leaf, without DataFrames or sklearn's per-call validation. Results match RandomForestClassifier.predict: X is
+    cast to float32 like sklearn does, leaf values are normalized per tree, and
+    the per-tree probabilities are summed in tree order before the argmax.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, depth, classes, is_leaf=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.classes = classes
+        self.is_leaf = left == np.arange(len(left)) if is_leaf is None else is_leaf
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        depth = 0
+        for est in model.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            roots.append(offset)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            # Leaves point at themselves, which is how is_leaf is recovered
+            own = np.arange(offset, offset + n, dtype=np.int32)
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.int32))
+            mgl = getattr(tree, "missing_go_to_left", None)
+            missing.append(np.zeros(n, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+
+            # Same normalization as DecisionTreeClassifier.predict_proba
+            v = tree.value[:, 0, :].astype(np.float64)
+            norm = v.sum(axis=1, keepdims=True)
+            norm[norm == 0.0] = 1.0
+            values.append(v / norm)
+
+            offset += n
+            depth = max(depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            missing_left=np.concatenate(missing),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            depth=depth,
+            classes=np.asarray(model.classes_),
+        )
+
+    def save(self, directory) -> dict:
+        """
+        Write the node arrays as .npy files into `directory` and return their
+        description (file, dtype, shape, sha256) for the model manifest.
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {}
+        for name in ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            array = np.ascontiguousarray(getattr(self, name))
+            np.save(path, array)
+            arrays[name] = {"file": f"{name}.npy", "dtype": str(array.dtype),
+                            "shape": list(array.shape), "sha256": file_sha256(path)}
+        return {"arrays": arrays, "depth": self.depth, "classes": self.classes.tolist()}
+
+    @classmethod
+    def load(cls, directory, spec, verify=True):
+        """
+        Open arrays written by save() as read-only memory maps: pages come from
+        the OS page cache, so every process on the host shares one copy.
+        Raises ValueError when a file does not match its manifest entry.
+        """
+        arrays = {}
+        for name in ARRAYS:
+            entry = spec["arrays"][name]
+            path = os.path.join(directory, entry["file"])
+            if verify and file_sha256(path) != entry["sha256"]:
+                raise ValueError(f"checksum mismatch for {path}")
+            array = np.load(path, mmap_mode="r")
+            if str(array.dtype) != entry["dtype"] or list(array.shape) != entry["shape"]:
+                raise ValueError(f"{path} is {array.dtype}{array.shape}, manifest says {entry['dtype']}{entry['shape']}")
+            arrays[name] = array
+        return cls(depth=spec["depth"], classes=np.asarray(spec["classes"]), **arrays)
+
+    def leaves(self, X):
+        """Leaf node index for every (row, tree): shape (n_rows, n_trees)."""
+        X = np.asarray(X, dtype=np.float32)
+        n, n_trees = X.shape[0], len(self.roots)
+        nodes = np.tile(self.roots, n)
+        rows = np.repeat(np.arange(n), n_trees)
+        # (row, tree) pairs still inside the tree; shrinks as paths reach their leaves
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while len(active):
+            cur = nodes[active]
+            x = X[rows[active], self.feature[cur]].astype(np.float64)
+            go_left = np.where(np.isnan(x), self.missing_left[cur], x <= self.threshold[cur])
+            cur = np.where(go_left, self.left[cur], self.right[cur])
+            nodes[active] = cur
+            active = active[~self.is_leaf[cur]]
+        return nodes.reshape(n, n_trees)
+
+    def predict_proba(self, X):
+        leaves = self.leaves(X)
+        proba = np.zeros((leaves.shape[0], self.value.shape[1]), dtype=np.float64)
+        for t in range(leaves.shape[1]):
+            proba += self.value[leaves[:, t]]
+        return proba / leaves.shape[1]
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def parity_sample(flat: FlatForest, n_features, n=PARITY_SAMPLES, seed=0):
+    """
+    Rows that sit on and around the forest's split thresholds, where a
+    float32/float64 or <= / < mismatch would show up first.
+    """
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, n_features), dtype=np.float64)
+    for f in range(n_features):
+        thr = flat.threshold[~flat.is_leaf & (flat.feature == f)]
+        thr = thr[np.isfinite(thr)]
+        if len(thr) == 0:
+            X[:, f] = rng.normal(size=n)
+            continue
+        picks = thr[rng.integers(0, len(thr), size=n)]
+        jitter = rng.choice([0.0, -1e-3, 1e-3, -1.0, 1.0], size=n)
+        X[:, f] = picks + jitter
+    if flat.missing_left.any():
+        # Model was fitted with missing values: exercise the NaN branches too
+        X[rng.random(X.shape) < 0.05] = np.nan
+    return X
+
+
+def verify_parity(model, flat: FlatForest, X=None) -> int:
+    """Return how many rows of X (or of a threshold-based sample) disagree with sklearn."""
+    if X is None:
+        X = parity_sample(flat, model.n_features_in_)
+    import warnings
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*feature names.*")
+        expected = model.predict(X)
+    return int(np.sum(flat.predict(X) != expected))
+
+
+def try_flatten(model):
+    """Flatten a forest and check it against sklearn; None if unsupported or not exact."""
+    if not hasattr(model, "estimators_") or not all(hasattr(e, "tree_") for e in model.estimators_):
+        return None
+    try:
+        flat = FlatForest.from_sklearn(model)
+        mismatches = verify_parity(model, flat)
+    except Exception as e:
+        logger.warning(f"⚠️ Native forest export failed, using sklearn: {e}")
+        return None
+    if mismatches:
+        logger.warning(f"⚠️ Native forest disagrees with sklearn on {mismatches} rows, using sklearn.")
+        return None
+    return flat
+
+
+if __name__ == "__main__":
+    # Parity check of the live model against sklearn, on threshold-based rows
+    # and on the training feature cache when one exists
+    import model_store
+    from feature_cache import open_feature_cache
+
+    manifest, model, _ = model_store.load_current()
+    flat = FlatForest.from_sklearn(model)
+    print(f"Model {manifest['version']}: {len(flat.roots)} trees, {len(flat.feature)} nodes, depth {flat.depth}")
+    print(f"Threshold sample mismatches: {verify_parity(model, flat)}")
+    try:
+        X, _, _ = open_feature_cache("full")
+        print(f"Feature cache mismatches: {verify_parity(model, flat, np.asarray(X))} / {len(X)}")
+    except FileNotFoundError:
+        print("No feature cache found, skipped.")
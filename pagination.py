@@ -0,0 +1,113 @@
+import base64
+import re
+import threading
+import time
+
+from bson import json_util
+
+# Listings are ordered newest first on (time, _id); _id breaks ties between equal times
+SORT_FIELDS = ("time", "_id")
+
+# Counts for filtered listings are capped and cached; the exact figure is not worth a scan
+COUNT_LIMIT = 10000
+COUNT_TTL = 60
+
+
+def encode_cursor(doc, fields=SORT_FIELDS) -> str:
+    """Opaque, URL-safe token for a document's position in the listing."""
+    raw = json_util.dumps([doc.get(f) for f in fields])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, fields=SORT_FIELDS):
+    """The values encoded in `token`, or None if it is not a cursor (tampered, truncated)."""
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        # binascii.Error, UnicodeDecodeError and JSONDecodeError are all ValueErrors
+        return None
+    return values if isinstance(values, list) and len(values) == len(fields) else None
+
+
+def _keyset_filter(values, fields, op):
+    """(f1, f2) strictly beyond (v1, v2) in the direction of op ($lt / $gt)."""
+    (f1, f2), (v1, v2) = fields, values
+    return {"$or": [{f1: {op: v1}}, {f1: v1, f2: {op: v2}}]}
+
+
+def keyset_page(collection, query, per_page, after=None, before=None, fields=SORT_FIELDS, projection=None):
+    """
+    Fetch one page ordered by `fields` descending, starting strictly after the
+    `after` cursor or ending strictly before the `before` cursor. Cost depends
+    only on per_page, not on how deep the page is, given an index on `fields`.
+
+    Returns (docs, next_cursor, prev_cursor); a cursor is None when there is no
+    page in that direction. A cursor that does not decode is ignored, which
+    serves the first page.
+    """
+    f1, f2 = fields
+    before = decode_cursor(before, fields) if before else None
+    after = decode_cursor(after, fields) if after else None
+    if before:
+        # Walk backwards (ascending) from the cursor, then flip the page
+        cond = _keyset_filter(before, fields, "$gt")
+        docs = list(collection.find({"$and": [query, cond]}, projection)
+                    .sort([(f1, 1), (f2, 1)]).limit(per_page + 1))
+        has_prev = len(docs) > per_page
+        docs = docs[:per_page][::-1]
+        next_cursor = encode_cursor(docs[-1], fields) if docs else None
+        prev_cursor = encode_cursor(docs[0], fields) if has_prev else None
+        return docs, next_cursor, prev_cursor
+
+    find_query = query
+    if after:
+        find_query = {"$and": [query, _keyset_filter(after, fields, "$lt")]}
+    docs = list(collection.find(find_query, projection)
+                .sort([(f1, -1), (f2, -1)]).limit(per_page + 1))
+    has_next = len(docs) > per_page
+    docs = docs[:per_page]
+    next_cursor = encode_cursor(docs[-1], fields) if has_next else None
+    prev_cursor = encode_cursor(docs[0], fields) if after and docs else None
+    return docs, next_cursor, prev_cursor
+
+
+def prefix_search(query_upi, fields=("sender_lc", "receiver_lc")):
+    """
+    Case-insensitive prefix match on the lowercase copies of sender/receiver.
+    An anchored, case-sensitive regex can use the index on each field.
+    """
+    pattern = "^" + re.escape(query_upi.strip().lower())
+    return {"$or": [{f: {"$regex": pattern}} for f in fields]}
+
+
+class CountCache:
+    """
+    Listing totals without a count per page view: the collection's metadata
+    count when unfiltered, otherwise a capped count_documents cached for
+    COUNT_TTL seconds per query.
+    """
+
+    def __init__(self, ttl=COUNT_TTL, limit=COUNT_LIMIT):
+        self.ttl = ttl
+        self.limit = limit
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def count(self, collection, query):
+        if not query:
+            return collection.estimated_document_count()
+
+        key = (collection.full_name, json_util.dumps(query, sort_keys=True))
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit and now - hit[1] < self.ttl:
+                return hit[0]
+
+        total = collection.count_documents(query, limit=self.limit)
+        with self._lock:
+            if len(self._cache) > 1000:
+                self._cache.clear()
+            self._cache[key] = (total, now)
+        return total
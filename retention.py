@@ -0,0 +1,373 @@
+"""
+Retention: a hot tier in MongoDB and monthly Parquet partitions on disk.
+
+    python retention.py archive        # move whole months older than HOT_RETENTION_DAYS to ARCHIVE_DIR
+    python retention.py status         # archived months and hot-tier bounds
+
+`transactions` and `flagged_transactions` keep the last HOT_RETENTION_DAYS
+in Mongo. Older months are written to
+ARCHIVE_DIR/<collection>/month=YYYY-MM/part-<run>.parquet (compressed,
+with every document kept whole as extended JSON next to typed columns),
+recorded in the month's _manifest.json and only then deleted from Mongo.
+TTL indexes drop whatever the archive job has still not reached
+TTL_GRACE_DAYS after that, so the hot tier stays bounded even if it stops.
+They expire on when a document was written (`ingested_at`, `checked_at`),
+not on its `time`: a backfill of old transactions stays until it has been
+archived instead of being deleted on arrival.
+
+Readers pick partitions by time: training reads the months inside its
+window (iter_archived), the dashboard reuses the counts stored with each
+archived month of flagged documents (archived_bucket_counts).
+HOT_RETENTION_DAYS=0 (the default) keeps everything hot: no TTL, no
+archiving.
+"""
+import argparse
+import json
+import os
+import tempfile
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from bson import json_util
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from dashboard_stats import bucket_counts
+from export import time_filter
+from native_forest import file_sha256
+
+logger = logging.getLogger("UPIFraudDetection")
+
+# Days kept in MongoDB; 0 keeps everything and disables TTL and archiving
+HOT_RETENTION_DAYS = int(os.environ.get("HOT_RETENTION_DAYS", 0))
+# A month is archived once its last day is HOT_RETENTION_DAYS old, when its first day is up to
+# a month older; TTL waits that month plus TTL_GRACE_DAYS after the write, and a document is never
+# written before its `time` (future-dated API checks aside), so the archive job gets to it first
+TTL_GRACE_DAYS = int(os.environ.get("TTL_GRACE_DAYS", 7))
+MONTH_DAYS = 31
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+ARCHIVE_COMPRESSION = os.environ.get("ARCHIVE_COMPRESSION", "zstd")
+# Documents per cursor batch and per Parquet row group
+CHUNK_SIZE = int(os.environ.get("ARCHIVE_CHUNK_SIZE", 10000))
+
+ARCHIVED_COLLECTIONS = ("transactions", "flagged_transactions")
+
+# Write-time fields each collection's TTL indexes expire on: set by ingest_transactions.py / fake_data.py,
+# and by the API and reflag.py. Documents without one (written before it existed) are only ever archived.
+TTL_FIELDS = {
+    "transactions": ("ingested_at",),
+    "flagged_transactions": ("checked_at",),
+}
+
+MANIFEST = "_manifest.json"
+
+
+def ttl_seconds(retention_days=None):
+    days = HOT_RETENTION_DAYS if retention_days is None else retention_days
+    return (days + MONTH_DAYS + TTL_GRACE_DAYS) * 86400 if days else None
+
+
+# ------------------------
+# TTL indexes
+# ------------------------
+def ensure_ttl_indexes(db, collections=None, retention_days=None) -> dict:
+    """
+    Make each TTL_FIELDS index expire documents after ttl_seconds(). An
+    existing single-field index on the field is converted or adjusted with
+    collMod, since MongoDB refuses a second index on the same key. TTL
+    indexes on any other field (earlier versions expired on `time`) are
+    dropped.
+    """
+    seconds = ttl_seconds(retention_days)
+    if seconds is None:
+        return {}
+    applied = {}
+    for name, fields in TTL_FIELDS.items():
+        if collections is not None and name not in collections:
+            continue
+        indexes = db[name].index_information()
+        for index, info in indexes.items():
+            if "expireAfterSeconds" in info and info["key"][0][0] not in fields:
+                try:
+                    db[name].drop_index(index)
+                    logger.info(f"🗑️ Dropped TTL index {name}.{index}: TTLs now expire on {', '.join(fields)}")
+                except OperationFailure as e:
+                    logger.error(f"⚠️ Could not drop TTL index {name}.{index}: {e}")
+        for field in fields:
+            existing = next((index for index, info in indexes.items()
+                             if len(info["key"]) == 1 and info["key"][0][0] == field), None)
+            try:
+                if existing is None:
+                    existing = db[name].create_index([(field, ASCENDING)], expireAfterSeconds=seconds)
+                elif indexes[existing].get("expireAfterSeconds") != seconds:
+                    db.command({"collMod": name, "index": {"name": existing, "expireAfterSeconds": seconds}})
+            except OperationFailure as e:
+                logger.error(f"⚠️ Could not set a TTL on {name}.{field}: {e}")
+                continue
+            applied.setdefault(name, []).append(existing)
+    return applied
+
+
+# ------------------------
+# Partitions
+# ------------------------
+def _month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _partition_dir(name, month, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, name, f"month={month:%Y-%m}")
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(path, manifest):
+    fd, tmp = tempfile.mkstemp(dir=path, prefix=".tmp-", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def archived_months(name, since=None, until=None, archive_dir=ARCHIVE_DIR) -> list:
+    """(month, directory, manifest) of the archived months overlapping [since, until), oldest first."""
+    root = os.path.join(archive_dir, name)
+    if not os.path.isdir(root):
+        return []
+    months = []
+    for entry in sorted(os.listdir(root)):
+        if not entry.startswith("month="):
+            continue
+        month = datetime.strptime(entry[len("month="):], "%Y-%m")
+        if (since and _next_month(month) <= since) or (until and month >= until):
+            continue
+        manifest = _read_manifest(os.path.join(root, entry))
+        if manifest:
+            months.append((month, os.path.join(root, entry), manifest))
+    return months
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("_id", pa.string()), ("time", pa.timestamp("us")), ("sender", pa.string()),
+        ("receiver", pa.string()), ("amount", pa.float64()), ("device", pa.string()),
+        ("is_fraud", pa.bool_()), ("doc", pa.string()),
+    ])
+
+
+def _archive_row(doc) -> dict:
+    try:
+        amount = float(doc.get("amount"))
+    except (TypeError, ValueError):
+        amount = None
+    is_fraud = doc.get("is_fraud")
+    return {
+        "_id": json_util.dumps(doc["_id"]),
+        "time": _as_datetime(doc.get("time")),
+        "sender": None if doc.get("sender") is None else str(doc["sender"]),
+        "receiver": None if doc.get("receiver") is None else str(doc["receiver"]),
+        "amount": amount,
+        "device": None if doc.get("device") is None else str(doc["device"]),
+        "is_fraud": is_fraud if isinstance(is_fraud, bool) else None,
+        "doc": json_util.dumps(doc),
+    }
+
+
+# ------------------------
+# Archiving
+# ------------------------
+def archive_month(db, name, month, archive_dir=ARCHIVE_DIR, chunk_size=CHUNK_SIZE) -> int:
+    """
+    Copy one month of `name` into a new part file of its partition, record
+    it in the manifest, then delete exactly the documents the file holds.
+    Returns the number of documents archived. Re-running for a month only
+    picks up documents that arrived since (late writes, offline jobs).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    collection = db[name]
+    query = time_filter(month, _next_month(month))
+    path = _partition_dir(name, month, archive_dir)
+    os.makedirs(path, exist_ok=True)
+
+    run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    part = f"part-{run}.parquet"
+    tmp = os.path.join(path, f".tmp-{part}")
+    schema = _schema()
+    rows = 0
+    counts = Counter()
+
+    def _write(writer, chunk):
+        writer.write_table(pa.Table.from_pylist([_archive_row(d) for d in chunk], schema=schema))
+        if name == "flagged_transactions":
+            counts.update(bucket_counts(chunk))
+        return len(chunk)
+
+    cursor = collection.find(query).sort([("time", 1), ("_id", 1)]).batch_size(chunk_size)
+    with pq.ParquetWriter(tmp, schema, compression=ARCHIVE_COMPRESSION) as writer:
+        chunk = []
+        for doc in cursor:
+            chunk.append(doc)
+            if len(chunk) >= chunk_size:
+                rows += _write(writer, chunk)
+                chunk = []
+        if chunk:
+            rows += _write(writer, chunk)
+
+    if rows == 0:
+        os.remove(tmp)
+        return 0
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(path, part))
+
+    manifest = _read_manifest(path) or {"collection": name, "month": f"{month:%Y-%m}", "rows": 0, "parts": [],
+                                        "buckets": {}}
+    manifest["parts"].append({"file": part, "rows": rows, "sha256": file_sha256(os.path.join(path, part)),
+                              "archived_at": datetime.now(timezone.utc).isoformat()})
+    manifest["rows"] += rows
+    buckets = Counter(manifest["buckets"])
+    buckets.update({f"{kind}:{key}": n for (kind, key), n in counts.items()})
+    manifest["buckets"] = dict(buckets)
+    _write_manifest(path, manifest)
+
+    # The part file is durable and listed: remove what it holds, read back from the file itself
+    deleted = 0
+    parquet = pq.ParquetFile(os.path.join(path, part))
+    for i in range(parquet.num_row_groups):
+        ids = [json_util.loads(v) for v in parquet.read_row_group(i, columns=["_id"]).column(0).to_pylist()]
+        deleted += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+    logger.info(f"🗄️ Archived {rows} {name} documents for {month:%Y-%m} ({deleted} removed from Mongo)")
+    return rows
+
+
+def _oldest_month(collection):
+    oldest = None
+    for kind in ("date", "string"):
+        doc = collection.find_one({"time": {"$type": kind}}, {"time": 1}, sort=[("time", ASCENDING)])
+        dt = _as_datetime(doc["time"]) if doc else None
+        if dt is not None and (oldest is None or dt < oldest):
+            oldest = dt
+    return _month_start(oldest) if oldest else None
+
+
+def archive_expired(db, retention_days=None, collections=ARCHIVED_COLLECTIONS, now=None,
+                    archive_dir=ARCHIVE_DIR) -> dict:
+    """Archive every whole month that ended more than `retention_days` ago. Returns {"<collection>/<month>": rows}."""
+    days = HOT_RETENTION_DAYS if retention_days is None else retention_days
+    if not days:
+        logger.info("ℹ️ HOT_RETENTION_DAYS is 0: everything stays in MongoDB.")
+        return {}
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    archived = {}
+    for name in collections:
+        month = _oldest_month(db[name])
+        while month is not None and _next_month(month) <= cutoff:
+            rows = archive_month(db, name, month, archive_dir)
+            if rows:
+                archived[f"{name}/{month:%Y-%m}"] = rows
+            month = _next_month(month)
+    return archived
+
+
+# ------------------------
+# Partition-aware reads
+# ------------------------
+def iter_archived(name, since=None, until=None, columns=None, chunk_size=CHUNK_SIZE, archive_dir=ARCHIVE_DIR):
+    """
+    Chunks (lists of dicts, `_id` decoded) of archived documents with `time`
+    in [since, until). Only the months overlapping the window are opened,
+    and only `columns` (default: the typed ones) are read.
+    """
+    import pyarrow.parquet as pq
+
+    columns = list(columns or [f for f in _schema().names if f != "doc"])
+    read = sorted(set(columns) | {"_id", "time"})
+    for month, path, manifest in archived_months(name, since, until, archive_dir):
+        # Months entirely inside the window need no per-row time check
+        whole = (since is None or month >= since) and (until is None or _next_month(month) <= until)
+        for part in manifest["parts"]:
+            parquet = pq.ParquetFile(os.path.join(path, part["file"]))
+            for batch in parquet.iter_batches(batch_size=chunk_size, columns=read):
+                rows = batch.to_pylist()
+                if not whole:
+                    rows = [r for r in rows if r["time"] is not None
+                            and (since is None or r["time"] >= since) and (until is None or r["time"] < until)]
+                for row in rows:
+                    row["_id"] = json_util.loads(row["_id"])
+                if rows:
+                    yield rows
+
+
+def archived_ids(name, since=None, until=None, archive_dir=ARCHIVE_DIR) -> set:
+    """`_id`s of the archived documents in [since, until)."""
+    return {row["_id"] for chunk in iter_archived(name, since, until, columns=["_id"], archive_dir=archive_dir)
+            for row in chunk}
+
+
+def archived_bucket_counts(name="flagged_transactions", archive_dir=ARCHIVE_DIR) -> Counter:
+    """fraud_stats bucket counts of every archived month, from the manifests alone."""
+    counts = Counter()
+    for _, _, manifest in archived_months(name, archive_dir=archive_dir):
+        for bucket, n in manifest.get("buckets", {}).items():
+            kind, key = bucket.split(":", 1)
+            counts[(kind, key)] += n
+    return counts
+
+
+def status(db, archive_dir=ARCHIVE_DIR) -> dict:
+    out = {}
+    for name in ARCHIVED_COLLECTIONS:
+        oldest = _oldest_month(db[name])
+        out[name] = {
+            "hot_documents": db[name].estimated_document_count(),
+            "hot_from": f"{oldest:%Y-%m}" if oldest else None,
+            "archived": {f"{month:%Y-%m}": manifest["rows"]
+                         for month, _, manifest in archived_months(name, archive_dir=archive_dir)},
+        }
+    return out
+
+
+if __name__ == "__main__":
+    from database import get_db
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Archive old months of transactions to Parquet.")
+    parser.add_argument("command", choices=["archive", "status"])
+    parser.add_argument("--retention-days", type=int, help=f"days kept in MongoDB (default: {HOT_RETENTION_DAYS})")
+    args = parser.parse_args()
+
+    db = get_db()
+    if args.command == "archive":
+        archived = archive_expired(db, retention_days=args.retention_days)
+        for partition, rows in archived.items():
+            print(f"✅ {partition}: {rows} documents")
+    else:
+        print(json.dumps(status(db), indent=2))
@@ -1,12 +1,13 @@
 # retrain_model.py
-import pandas as pd
-from pymongo import MongoClient
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
-import joblib
-from datetime import datetime
+from bson import ObjectId
 import logging
+import os
+
+from feature_cache import build_feature_cache, open_feature_cache, device_encoder_for, window_start, TRAINING_WINDOW_DAYS
+import model_store
+from database import get_db
 
 # Setup logging
 logging.basicConfig(
@@ -19,46 +20,94 @@ logging.basicConfig(
 
 logger = logging.getLogger("UPIFraudDetection")
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client["upi_fraud_db"]
+db = get_db()
+
+# Train with the sliding-window velocity counts as extra features
+USE_VELOCITY_FEATURES = os.environ.get("USE_VELOCITY_FEATURES", "0") == "1"
+
+# "incremental" trains only on documents newer than the live model's watermark
+# and adds trees to it; "full" refits on the training window (TRAINING_WINDOW_DAYS)
+RETRAIN_MODE = os.environ.get("RETRAIN_MODE", "incremental")
 
-MODEL_PATH = "fraud_model.pkl"
-ENCODER_PATH = "device_encoder.pkl"
+N_ESTIMATORS = 100          # trees in a full refit
+TREES_PER_INCREMENT = 10    # trees added by each incremental update
+MAX_TREES = 300             # beyond this, fall back to a full refit to compact the forest
+MIN_NEW_SAMPLES = 50        # fewer new documents than this: keep the current model
 
 
-def retrain_model():
-    logger.info("🔄 Retraining ML model with latest transactions...")
+def _fit_and_publish(model, X, y, le_device, features, meta, extra):
+    model.fit(X, y)
+    extra = dict(extra, features=features, n_samples=len(y), watermark=meta["watermark"])
+    return model_store.publish_model(model, le_device, extra=extra)
 
-    transactions = pd.DataFrame(list(db.transactions.find()))
-    flagged = pd.DataFrame(list(db.flagged_transactions.find()))
 
-    if transactions.empty:
+def _full_retrain(window_days=TRAINING_WINDOW_DAYS):
+    # Stream the window (hot collection and archived months) into the on-disk feature cache,
+    # then train from the memory map
+    meta = build_feature_cache(db.transactions, db.flagged_transactions, name="full",
+                               velocity=USE_VELOCITY_FEATURES, since=window_start(window_days), archived=True)
+    if meta["rows"] == 0:
         logger.info("⚠️ No transactions found.")
         return
 
-    # Merge with fraud labels
-    transactions["is_fraud"] = transactions["_id"].isin(flagged["_id"]).astype(int)
+    X, y, meta = open_feature_cache("full")
+
+    # Train on every row: nothing is evaluated here, and the published watermark covers them all,
+    # so rows left out would never be seen by an incremental update either
+    model = RandomForestClassifier(n_estimators=N_ESTIMATORS, random_state=42)
+    version = _fit_and_publish(model, X, y, device_encoder_for(meta),
+                               meta["features"], meta, {"mode": "full", "window_days": window_days or None})
+    logger.info(f"✅ Model retrained and saved as version {version}!")
+    return version
+
+
+def _incremental_retrain(manifest):
+    """
+    Grow the live forest with trees fitted on documents newer than its
+    watermark. Returns None when a full refit is needed instead.
+    """
+    model, le_device = model_store.load_pickles(manifest)
+    version = manifest["version"]
+    features = manifest.get("features") or list(getattr(model, "feature_names_in_", []))
+
+    if len(model.estimators_) + TREES_PER_INCREMENT > MAX_TREES:
+        logger.info(f"ℹ️ Forest has {len(model.estimators_)} trees, compacting with a full refit.")
+        return None
+
+    meta = build_feature_cache(db.transactions, db.flagged_transactions, name="incremental",
+                               query={"_id": {"$gt": ObjectId(manifest["watermark"])}},
+                               vocabulary=list(le_device.classes_), velocity=USE_VELOCITY_FEATURES)
+    if meta["rows"] < MIN_NEW_SAMPLES:
+        logger.info(f"ℹ️ Only {meta['rows']} new transactions since {version}, keeping current model.")
+        return version
+
+    if meta["features"] != features:
+        logger.info("ℹ️ Feature set changed, falling back to a full refit.")
+        return None
 
-    # Feature engineering
-    transactions["time"] = pd.to_datetime(transactions.get("time", datetime.utcnow()), errors="coerce")
-    transactions["hour"] = transactions["time"].dt.hour
-    transactions["day_of_week"] = transactions["time"].dt.dayofweek
+    X, y, meta = open_feature_cache("incremental")
+    if set(np.unique(y)) != set(model.classes_):
+        # New trees must see the same classes as the existing ones
+        logger.info("ℹ️ New data does not cover every class, falling back to a full refit.")
+        return None
 
-    transactions["device"] = transactions.get("device", "Unknown")
-    le_device = LabelEncoder()
-    transactions["device_enc"] = le_device.fit_transform(transactions["device"])
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + TREES_PER_INCREMENT)
+    version = _fit_and_publish(model, X, y, le_device, features, meta,
+                               {"mode": "incremental", "base_version": version})
+    logger.info(f"✅ Added {TREES_PER_INCREMENT} trees from {meta['rows']} new transactions, saved as version {version}!")
+    return version
 
-    X = transactions[["amount", "hour", "day_of_week", "device_enc"]]
-    y = transactions["is_fraud"]
 
-    # Train-test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+def retrain_model(mode=None, window_days=None):
+    """Retrain and publish; a full refit reads the last `window_days` (default TRAINING_WINDOW_DAYS, 0 = all)."""
+    mode = mode or RETRAIN_MODE
+    window_days = TRAINING_WINDOW_DAYS if window_days is None else window_days
+    logger.info(f"🔄 Retraining ML model with latest transactions ({mode})...")
 
-    # Train model
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
+    manifest = model_store.current_manifest()
+    if mode == "incremental" and manifest and manifest.get("watermark"):
+        version = _incremental_retrain(manifest)
+        if version is not None:
+            return version
 
-    # Save model & encoder
-    joblib.dump(model, MODEL_PATH)
-    joblib.dump(le_device, ENCODER_PATH)
-    logger.info("✅ Model retrained and saved!")
+    return _full_retrain(window_days)
@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger("UPIFraudDetection")
+
+COUNTER_ID = "flagged_since_retrain"
+
+# With a shared-state backend, flagged counts are buffered per worker and added
+# to the shared counter in one increment once BATCH are pending, or on the first
+# record after FLUSH_SECONDS
+COUNTER_BATCH = int(os.environ.get("RETRAIN_COUNTER_BATCH", 10))
+COUNTER_FLUSH_SECONDS = 1.0
+
+
+def _run_retrain():
+    # Imported here so the web process never loads sklearn for retraining
+    from retrain_model import retrain_model
+    return retrain_model()
+
+
+class RetrainScheduler:
+    """
+    Counts flagged transactions in a shared MongoDB counter and, once it
+    reaches `threshold`, runs retrain_model() in a separate process.
+
+    The counter is incremented with $inc and claimed with a conditional
+    find_one_and_update, so with several gunicorn workers exactly one of them
+    starts each retrain. The new model is published as a versioned artifact
+    and every worker's predictor swaps to it on its own (see ml_predictor).
+
+    Given a shared `state` (shared_state.RedisState) the counter lives there
+    instead, incremented in batches of `batch` and claimed with WATCH/MULTI.
+    """
+
+    def __init__(self, counters_collection, threshold, counter_id=COUNTER_ID, state=None, batch=COUNTER_BATCH):
+        self.counters = counters_collection
+        self.threshold = threshold
+        self.counter_id = counter_id
+        self.state = state
+        self.batch = batch
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+        self._pending_lock = threading.Lock()
+        self._executor = None
+        self._future = None
+        self._lock = threading.Lock()
+
+    def record(self, new_flagged: int):
+        """Add newly flagged transactions and trigger a retrain when the threshold is reached."""
+        if new_flagged <= 0:
+            return
+        if self.state is not None:
+            self._record_state(new_flagged)
+            return
+
+        doc = self.counters.find_one_and_update(*self._increment(new_flagged), upsert=True,
+                                                return_document=ReturnDocument.AFTER)
+        if doc["count"] < self.threshold:
+            return
+
+        # Only the worker whose update still sees count >= threshold wins the reset
+        claimed = self.counters.find_one_and_update(*self._claim())
+        self._on_claim(claimed["count"] if claimed else None)
+
+    async def record_async(self, new_flagged: int, counters):
+        """record() for the event loop; `counters` is the same collection on an AsyncMongoClient."""
+        if new_flagged <= 0:
+            return
+        if self.state is not None:
+            await asyncio.to_thread(self._record_state, new_flagged)
+            return
+        doc = await counters.find_one_and_update(*self._increment(new_flagged), upsert=True,
+                                                 return_document=ReturnDocument.AFTER)
+        if doc["count"] >= self.threshold:
+            claimed = await counters.find_one_and_update(*self._claim())
+            self._on_claim(claimed["count"] if claimed else None)
+
+    def _record_state(self, n):
+        with self._pending_lock:
+            self._pending += n
+            now = time.monotonic()
+            if self._pending < self.batch and now - self._flushed_at < COUNTER_FLUSH_SECONDS:
+                return
+            n, self._pending = self._pending, 0
+            self._flushed_at = now
+
+        key = self._state_key()
+        [[count]] = self.state.transact([([(key, n, None)], [key])])
+        if count >= self.threshold:
+            self._on_claim(self.state.claim(key, self.threshold))
+
+    def _state_key(self):
+        return f"counter:{self.counter_id}"
+
+    def _increment(self, n):
+        return {"_id": self.counter_id}, {"$inc": {"count": n}}
+
+    def _claim(self):
+        return {"_id": self.counter_id, "count": {"$gte": self.threshold}}, {"$set": {"count": 0}}
+
+    def _on_claim(self, claimed_count):
+        if claimed_count:
+            logger.info(f"🔄 Retraining ML model after {claimed_count} flagged transactions...")
+            self.trigger()
+
+    def trigger(self):
+        """Start a retrain in the background unless one is already running in this process."""
+        with self._lock:
+            if self._future is not None and not self._future.done():
+                logger.info("ℹ️ Retrain already running, skipping.")
+                return self._future
+
+            if self._executor is None:
+                # spawn: never fork a process that has request and writer threads running
+                self._executor = ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn")
+                )
+            self._future = self._executor.submit(_run_retrain)
+            self._future.add_done_callback(self._on_done)
+            return self._future
+
+    @staticmethod
+    def _on_done(future):
+        try:
+            future.result()
+            logger.info("✅ Background retrain finished.")
+        except Exception as e:
+            logger.error(f"⚠️ Retraining failed: {e}")
+
+    def status(self) -> dict:
+        if self.state is not None:
+            count = self.state.get_many([self._state_key()])[0] + self._pending
+        else:
+            count = (self.counters.find_one({"_id": self.counter_id}) or {}).get("count", 0)
+        return {
+            "count": count,
+            "threshold": self.threshold,
+            "running": self._future is not None and not self._future.done(),
+        }
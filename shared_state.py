@@ -0,0 +1,188 @@
+"""
+Counters shared by every worker: rate limits, velocity windows and the
+retrain trigger.
+
+    from shared_state import get_state
+    state = get_state()     # STATE_URL: memory:// (default) or redis://host:6379/0
+
+MemoryState keeps the counters in this process, so each worker counts on
+its own. RedisState keeps them in Redis (or any server speaking its
+protocol, e.g. Valkey or KeyDB), so every worker on every host sees one
+count. Both apply a batch of increments atomically and return the values
+read after it in the same call: one round trip on Redis.
+"""
+import math
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger("UPIFraudDetection")
+
+STATE_URL = os.environ.get("STATE_URL", "memory://")
+
+# Expired keys are swept from MemoryState after this many operations
+SWEEP_EVERY = 10000
+
+_state = None
+_lock = threading.Lock()
+
+
+class MemoryState:
+    """Counters in a dict, with per-key expiry; shared by the threads of one process."""
+
+    shared = False
+
+    def __init__(self):
+        self._values = {}
+        self._expires = {}
+        self._ops = 0
+        self._lock = threading.Lock()
+
+    @property
+    def storage_uri(self):
+        return "memory://"
+
+    def transact(self, steps):
+        """
+        Apply steps atomically, in order. Each step is (increments, reads):
+        increments are (key, amount, ttl_seconds or None), reads are keys.
+        Returns the values of each step's reads taken after its increments.
+        """
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            for increments, reads in steps:
+                for key, amount, ttl in increments:
+                    value = self._get(key, now) + amount
+                    self._values[key] = value
+                    if ttl:
+                        self._expires[key] = now + ttl
+                results.append([self._get(key, now) for key in reads])
+            self._ops += 1
+            if self._ops % SWEEP_EVERY == 0:
+                self._sweep(now)
+        return results
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return [self._get(key, now) for key in keys]
+
+    def claim(self, key, threshold):
+        """Reset `key` to 0 if it has reached `threshold`; returns the claimed count or None."""
+        with self._lock:
+            value = self._get(key, time.monotonic())
+            if value < threshold:
+                return None
+            self._values[key] = 0
+            return value
+
+    def _get(self, key, now):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= now:
+            self._values.pop(key, None)
+            del self._expires[key]
+        return self._values.get(key, 0)
+
+    def _sweep(self, now):
+        for key in [k for k, expires in self._expires.items() if expires <= now]:
+            self._values.pop(key, None)
+            del self._expires[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "keys": len(self._values)}
+
+
+class RedisState:
+    """
+    Counters in Redis. A transact() call is one MULTI/EXEC pipeline, so its
+    increments are atomic with respect to every other worker and cost one
+    round trip however many keys they touch.
+    """
+
+    shared = True
+
+    def __init__(self, url, client=None):
+        self.url = url
+        if client is None:
+            import redis  # only needed when STATE_URL points at a server
+            client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+        self.client = client
+
+    @property
+    def storage_uri(self):
+        return self.url
+
+    def transact(self, steps):
+        pipe = self.client.pipeline(transaction=True)
+        read_positions = []
+        n = 0
+        for increments, reads in steps:
+            for key, amount, ttl in increments:
+                if isinstance(amount, int):
+                    pipe.incrby(key, amount)
+                else:
+                    pipe.incrbyfloat(key, amount)
+                n += 1
+                if ttl:
+                    pipe.expire(key, math.ceil(ttl))
+                    n += 1
+            if reads:
+                pipe.mget(reads)
+                read_positions.append(n)
+                n += 1
+            else:
+                read_positions.append(None)
+        replies = pipe.execute()
+        return [[] if pos is None else [_number(v) for v in replies[pos]] for pos in read_positions]
+
+    def get_many(self, keys):
+        return [_number(v) for v in self.client.mget(keys)] if keys else []
+
+    def claim(self, key, threshold):
+        # WATCH/MULTI: retried if another worker changes the key in between
+        def attempt(pipe):
+            value = _number(pipe.get(key))
+            if value < threshold:
+                return None
+            pipe.multi()
+            pipe.set(key, 0)
+            return value
+
+        return self.client.transaction(attempt, key, value_from_callable=True)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "keys": self.client.dbsize()}
+
+
+def _number(value):
+    if value is None:
+        return 0
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def create_state(url=None):
+    url = url or STATE_URL
+    if url.startswith("memory://"):
+        return MemoryState()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url)
+    raise ValueError(f"Unsupported STATE_URL: {url}")
+
+
+def get_state():
+    """
+    The process-wide state backend, created on first use. Safe to keep across
+    a fork: redis-py opens new connections in the child, and a MemoryState
+    simply starts from the parent's counts.
+    """
+    global _state
+    if _state is None:
+        with _lock:
+            if _state is None:
+                _state = create_state()
+                logger.info(f"🔢 Shared state backend: {type(_state).__name__}")
+    return _state
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root; the benchmark harness sets up the Mongo stand-in
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """app.py imported against a mongomock database, with models and caches in a temporary directory."""
+    pytest.importorskip("mongomock")
+    from run_benchmarks import use_mongo
+
+    workdir = tmp_path_factory.mktemp("app")
+    os.environ.setdefault("SECRET_KEY", "tests-only")
+    os.environ.setdefault("ENSURE_INDEXES", "0")
+    os.environ.setdefault("MODEL_DIR", str(workdir / "models"))
+    os.environ.setdefault("FEATURE_CACHE_DIR", str(workdir / "feature_cache"))
+    use_mongo()
+    import app
+
+    yield app
+    app.flag_writer.close()
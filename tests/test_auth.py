@@ -0,0 +1,98 @@
+import pytest
+
+import time
+
+from auth import ApiKeyStore, RoleAuthorizer
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def keys():
+    return ApiKeyStore(mongomock.MongoClient().db.api_keys)
+
+
+@pytest.fixture
+def users():
+    collection = mongomock.MongoClient().db.users
+    collection.insert_one({"username": "alice", "role": "admin", "role_version": 0})
+    return collection
+
+
+def expire(session):
+    session["role_claim"]["exp"] = time.time() - 1
+
+
+def test_only_issued_keys_verify(keys):
+    api_key = keys.create("gateway")
+
+    assert keys.verify(api_key) == "gateway"
+    assert keys.verify("made-up") is None
+    assert keys.verify("") is None
+    # Only the digest is stored
+    assert keys.collection.find_one({}, {"_id": 0, "key_sha256": 1}) == {"key_sha256": keys.digest(api_key)}
+
+
+def test_revoked_keys_stop_verifying(keys):
+    api_key = keys.create("gateway")
+    other = keys.create("other")
+    assert keys.verify(api_key) == "gateway"
+
+    assert keys.revoke("gateway") == 1
+    assert keys.verify(api_key) is None
+    assert keys.verify(other) == "other"
+
+
+def test_claim_is_trusted_until_it_expires(users):
+    authorizer = RoleAuthorizer(users, ttl=300)
+    session = {}
+    authorizer.login(session, users.find_one({"username": "alice"}))
+    # A role edited in the database without a revocation is only picked up once the claim expires
+    users.update_one({"username": "alice"}, {"$set": {"role": "user"}})
+
+    assert authorizer.role(session) == "admin"
+    assert authorizer.stats()["trusted"] == 1
+
+    expire(session)
+    assert authorizer.role(session) == "user"
+    assert authorizer.stats()["refreshed"] == 1
+    assert session["role_claim"]["exp"] > time.time()
+    assert authorizer.role(session) == "user"
+    assert authorizer.stats()["trusted"] == 2
+
+
+def test_revocation_reaches_other_workers_on_their_next_poll(users):
+    revoking, other = RoleAuthorizer(users), RoleAuthorizer(users, poll_interval=3600)
+    session = {}
+    other.login(session, users.find_one({"username": "alice"}))
+    assert other.role(session) == "admin"
+
+    assert revoking.revoke("alice", role="user")
+    # Between polls the other worker still trusts the unexpired claim ...
+    assert other.role(session) == "admin"
+    # ... and rejects it once its poll sees the new role_version, before the claim expires
+    other.poll_revocations(force=True)
+    assert other.role(session) is None
+    assert other.stats()["rejected"] == 1
+
+    other.login(session, users.find_one({"username": "alice"}))
+    assert other.role(session) == "user"
+
+
+def test_expired_claim_with_old_version_is_logged_out(users):
+    authorizer = RoleAuthorizer(users)
+    session = {}
+    authorizer.login(session, users.find_one({"username": "alice"}))
+    # Bumped without role_changed_at, so no poll sees it: the expiry re-check must
+    users.update_one({"username": "alice"}, {"$inc": {"role_version": 1}})
+
+    expire(session)
+    assert authorizer.role(session) is None
+    assert authorizer.stats()["rejected"] == 1
+
+    # Deleted users are logged out the same way
+    authorizer.login(session, users.find_one({"username": "alice"}))
+    users.delete_one({"username": "alice"})
+    authorizer.users.invalidate("alice")
+    expire(session)
+    assert authorizer.role(session) is None
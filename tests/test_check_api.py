@@ -0,0 +1,99 @@
+import pytest
+
+MALFORMED = [
+    b"{not json",
+    b"[1, 2]",
+    b'"text"',
+    b'{"sender": 5, "receiver": "b@upi", "amount": 10}',
+    b'{"sender": "a@upi", "receiver": ["b@upi"], "amount": 10}',
+    b'{"sender": "a@upi", "receiver": "b@upi", "amount": [1]}',
+    b'{"sender": "a@upi", "receiver": "b@upi", "amount": "ten"}',
+    b'{"sender": "a@upi", "receiver": "b@upi", "amount": true}',
+    b'{"sender": "a@upi", "receiver": "b@upi", "amount": 10, "device": {"os": "iOS"}}',
+    b'{"sender": "a@upi", "receiver": "b@upi", "amount": 10, "timestamp": 1700000000}',
+]
+
+
+@pytest.fixture
+def flask_client(app_module):
+    app_module.limiter.enabled = False
+    yield app_module.app.test_client()
+    app_module.limiter.enabled = True
+
+
+@pytest.mark.parametrize("body", MALFORMED)
+def test_flask_check_rejects_malformed_bodies(flask_client, body):
+    response = flask_client.post("/api/check_fraud", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+@pytest.mark.parametrize("body", MALFORMED)
+def test_async_check_rejects_malformed_bodies(app_module, body):
+    from starlette.testclient import TestClient
+    import asgi
+
+    app_module.limiter.enabled = False
+    try:
+        with TestClient(asgi.application) as client:
+            response = client.post("/api/check_fraud", content=body, headers={"content-type": "application/json"})
+    finally:
+        app_module.limiter.enabled = True
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_parse_check_types(app_module):
+    sender, receiver, amount, device, dt = app_module.parse_check(
+        {"sender": "A@UPI", "receiver": "b@upi", "amount": "12.5", "timestamp": "2025-05-01T03:00:00"})
+    assert (sender, receiver, amount, device, dt.hour) == ("a@upi", "b@upi", 12.5, "Unknown", 3)
+
+
+def test_batch_rejects_only_malformed_entries(flask_client):
+    good = {"sender": "a@upi", "receiver": "b@upi", "amount": 10, "device": "iOS",
+            "timestamp": "2025-05-01T12:00:00"}
+    batch = [good, dict(good, sender=5), dict(good, device=["iOS"]), dict(good, amount={}), "text", good]
+
+    response = flask_client.post("/api/check_fraud/batch", json=batch)
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert len(results) == len(batch)
+    assert [("error" in r) for r in results] == [False, True, True, True, True, False]
+
+
+def test_velocity_reasons_flag_without_blocking(app_module, flask_client):
+    from block_sender_db import is_sender_blocked
+
+    for i in range(8):
+        response = flask_client.post("/api/check_fraud", json={
+            "sender": f"cust{i}@upi", "receiver": "bigstore@upi", "amount": 100, "device": "iOS",
+            "timestamp": "2025-05-01T12:00:00",
+        })
+        assert response.status_code == 200
+    reasons = response.get_json()["reasons"]
+    assert "More than 5 txns to same receiver in 5 minutes" in reasons
+    assert not is_sender_blocked("cust7@upi")
+
+    response = flask_client.post("/api/check_fraud", json={
+        "sender": "cust7@upi", "receiver": "grocer@upi", "amount": 100, "device": "iOS",
+        "timestamp": "2025-05-01T12:01:00",
+    })
+    assert not any("already blocked" in r for r in response.get_json()["reasons"])
+
+    # Rules that do block still do
+    response = flask_client.post("/api/check_fraud", json={
+        "sender": "thief@upi", "receiver": "scam@upi", "amount": 100, "device": "iOS",
+        "timestamp": "2025-05-01T12:02:00",
+    })
+    assert "Blacklisted UPI ID" in response.get_json()["reasons"]
+    assert is_sender_blocked("thief@upi")
+
+
+@pytest.mark.parametrize("query", ["seconds=abc", "interval_ms=fast", "seconds=0", "seconds=nan"])
+def test_profile_rejects_bad_parameters(app_module, flask_client, query):
+    with flask_client.session_transaction() as sess:
+        app_module.authorizer.login(sess, {"username": "root", "role": "admin"})
+
+    response = flask_client.post(f"/api/profile?{query}")
+    assert response.status_code == 400
+    assert not app_module.metrics.profiler.running
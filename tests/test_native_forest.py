@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from native_forest import FlatForest, parity_sample, verify_parity
+
+
+@pytest.fixture(scope="module")
+def model():
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(600, 5))
+    # Integer-valued columns put many rows exactly on split thresholds
+    X[:, 3] = rng.integers(0, 24, size=600)
+    X[:, 4] = rng.integers(0, 4, size=600)
+    y = ((X[:, 0] > 0.3) | (X[:, 3] < 5)) & (X[:, 4] != 2)
+    # Missing values at fit time give the trees learned NaN directions
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return RandomForestClassifier(n_estimators=15, max_depth=8, random_state=0).fit(X, y)
+
+
+def _rows(model, flat):
+    X = parity_sample(flat, model.n_features_in_)
+    # Every split threshold exactly, in its own row (NaN-only splits have an infinite one)
+    splits = ~flat.is_leaf & np.isfinite(flat.threshold)
+    exact = np.zeros((int(splits.sum()), model.n_features_in_))
+    exact[np.arange(len(exact)), flat.feature[splits]] = flat.threshold[splits]
+    nans = np.full((4, model.n_features_in_), np.nan)
+    return np.vstack([X, exact, nans])
+
+
+def test_predict_matches_sklearn(model):
+    flat = FlatForest.from_sklearn(model)
+    assert flat.missing_left.any()
+    X = _rows(model, flat)
+    assert np.isnan(X).any()
+    np.testing.assert_array_equal(flat.predict(X), model.predict(X))
+    np.testing.assert_allclose(flat.predict_proba(X), model.predict_proba(X))
+    assert verify_parity(model, flat) == 0
+
+
+def test_save_load_round_trip(model, tmp_path):
+    flat = FlatForest.from_sklearn(model)
+    spec = flat.save(tmp_path)
+    loaded = FlatForest.load(tmp_path, spec)
+
+    assert isinstance(loaded.feature, np.memmap)
+    assert not loaded.threshold.flags.writeable
+    X = _rows(model, flat)
+    np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+
+
+def test_load_rejects_changed_arrays(model, tmp_path):
+    flat = FlatForest.from_sklearn(model)
+    spec = flat.save(tmp_path)
+    np.save(tmp_path / "threshold.npy", np.asarray(flat.threshold) + 1.0)
+
+    with pytest.raises(ValueError, match="checksum"):
+        FlatForest.load(tmp_path, spec)
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from shared_state import MemoryState, RedisState
+from velocity import SharedVelocityTracker, VelocityTracker
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_state():
+    return RedisState("redis://fake", client=fakeredis.FakeRedis())
+
+
+def _transactions(n=400, seed=3):
+    """Bursty traffic over a few senders/receivers, in time order and ending now."""
+    rng = np.random.default_rng(seed)
+    start = datetime.now() - timedelta(minutes=20)
+    offsets = np.sort(rng.integers(0, 20 * 60, n))
+    senders = [f"s{i}@upi" for i in rng.integers(0, 6, n)]
+    receivers = [f"r{i}@upi" for i in rng.integers(0, 4, n)]
+    amounts = np.round(rng.uniform(10, 20000, n), 2)
+    return [(s, r, float(a), start + timedelta(seconds=int(o)))
+            for s, r, a, o in zip(senders, receivers, amounts, offsets)]
+
+
+def test_transact_and_claim_match(redis_state):
+    memory = MemoryState()
+    steps = [
+        ([("a", 1, None), ("b", 2.5, 60)], ["a", "b"]),
+        ([("a", 2, None)], ["a", "missing"]),
+        ([], ["b"]),
+    ]
+    assert redis_state.transact(steps) == memory.transact(steps) == [[1, 2.5], [3, 0], [2.5]]
+    assert redis_state.get_many(["a", "b"]) == memory.get_many(["a", "b"])
+
+    for state in (memory, redis_state):
+        assert state.claim("a", 5) is None
+        assert state.claim("a", 3) == 3
+        assert state.get_many(["a"]) == [0]
+
+
+def test_shared_velocity_matches_in_memory(redis_state):
+    transactions = _transactions()
+    memory = VelocityTracker()
+    shared = SharedVelocityTracker(redis_state)
+
+    expected = [memory.record(*txn) for txn in transactions[:300]]
+    got = [shared.record(*txn) for txn in transactions[:150]] + shared.record_many(transactions[150:300])
+    assert got == expected
+
+    sender, receiver, _, dt = transactions[-1]
+    assert shared.features(sender, receiver, dt) == memory.features(sender, receiver, dt)
+
+
+def test_shared_velocity_matches_across_memory_state():
+    """SharedVelocityTracker gives the same features on either backend."""
+    transactions = _transactions(n=100, seed=5)
+    memory = VelocityTracker()
+    shared = SharedVelocityTracker(MemoryState())
+    assert shared.record_many(transactions) == [memory.record(*txn) for txn in transactions]
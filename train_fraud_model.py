@@ -1,60 +1,44 @@
-import pandas as pd
-from pymongo import MongoClient
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import classification_report
 import joblib
-from datetime import datetime
+import os
 
-# ----------------------------
-# MongoDB connection
-# ----------------------------
-client = MongoClient("mongodb://localhost:27017/")
-db = client["upi_fraud_db"]
-
-# ----------------------------
-# Load data
-# ----------------------------
-transactions = pd.DataFrame(list(db.transactions.find()))
-flagged = pd.DataFrame(list(db.flagged_transactions.find()))
+from feature_cache import build_feature_cache, open_feature_cache, device_encoder_for, window_start
+import model_store
+from database import get_db
 
-if transactions.empty:
-    raise Exception("No transactions found in MongoDB!")
+# Train with the sliding-window velocity counts as extra features
+USE_VELOCITY_FEATURES = os.environ.get("USE_VELOCITY_FEATURES", "0") == "1"
 
 # ----------------------------
-# Merge with fraud labels
+# MongoDB connection
 # ----------------------------
-# Create a column 'is_fraud' (1 = fraud, 0 = legit)
-transactions["is_fraud"] = transactions["_id"].isin(flagged["_id"]).astype(int)
+db = get_db()
 
 # ----------------------------
-# Feature engineering
+# Load data & feature engineering
 # ----------------------------
-def extract_features(df):
-    # Convert timestamp to datetime
-    df["time"] = pd.to_datetime(df.get("time", datetime.utcnow()), errors="coerce")
-    df["hour"] = df["time"].dt.hour
-    df["day_of_week"] = df["time"].dt.dayofweek
+# Streams `transactions` chunk by chunk (only the fields the features need)
+# into a float32 matrix on disk, labelled 1 = fraud when the _id is also in
+# `flagged_transactions`. Training reads it back as a memory map, so memory
+# stays bounded by the chunk size rather than the collection size.
+# TRAINING_WINDOW_DAYS bounds the history read; archived months inside the
+# window are read from their Parquet partitions (retention.py).
+meta = build_feature_cache(db.transactions, db.flagged_transactions, name="full",
+                           velocity=USE_VELOCITY_FEATURES, since=window_start(), archived=True)
 
-    # Encode device
-    df["device"] = df.get("device", "Unknown")
-    le_device = LabelEncoder()
-    df["device_enc"] = le_device.fit_transform(df["device"])
-
-    # Amount (ensure numeric)
-    df["amount"] = pd.to_numeric(df.get("amount", 0), errors="coerce").fillna(0)
-
-    # Example: could add sender history features later
-    return df[["amount", "hour", "day_of_week", "device_enc"]], le_device
+if meta["rows"] == 0:
+    raise Exception("No transactions found in MongoDB!")
 
-X, le_device = extract_features(transactions)
-y = transactions["is_fraud"]
+X, y, meta = open_feature_cache("full")
+le_device = device_encoder_for(meta)
 
 # ----------------------------
 # Train-test split
 # ----------------------------
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+# The cache is in _id (or time) order: hold out the newest 20%
+n_train = int(len(y) * 0.8)
+X_train, X_test, y_train, y_test = X[:n_train], X[n_train:], y[:n_train], y[n_train:]
 
 # ----------------------------
 # Train model
@@ -68,9 +52,26 @@ model.fit(X_train, y_train)
 y_pred = model.predict(X_test)
 print(classification_report(y_test, y_pred))
 
+# ----------------------------
+# Refit on every row
+# ----------------------------
+# The published watermark covers the whole cache and incremental updates only
+# read newer documents, so the held-out rows must be trained on too
+model = RandomForestClassifier(n_estimators=100, random_state=42)
+model.fit(X, y)
+
 # ----------------------------
 # Save model and encoder
 # ----------------------------
 joblib.dump(model, "fraud_model.pkl")
 joblib.dump(le_device, "device_encoder.pkl")
+
+# Also publish as a versioned model with a watermark, so retrain_model can
+# continue incrementally from here instead of refitting the whole history
+model_store.publish_model(model, le_device, extra={
+    "features": meta["features"],
+    "n_samples": len(y),
+    "mode": "full",
+    "watermark": meta["watermark"],
+})
 print("✅ Model and encoder saved!")
@@ -0,0 +1,208 @@
+import threading
+from collections import OrderedDict
+
+# ----------------------------
+# Sliding windows
+# ----------------------------
+# name -> (window length in seconds, number of buckets). Each window is a ring of
+# fixed-width buckets, so memory per key is constant and a read is O(1): totals
+# are kept as running sums and expired buckets are subtracted as time advances.
+WINDOWS = {
+    "1m": (60, 12),      # 5s buckets
+    "5m": (300, 30),     # 10s buckets
+    "1d": (86400, 24),   # 1h buckets
+}
+
+# Which keys are tracked for each transaction
+SCOPES = ("sender", "receiver", "pair")
+
+# Upper bound on tracked keys (per scope); least recently seen keys are evicted
+MAX_KEYS = 200_000
+
+VELOCITY_FEATURES = [
+    f"{scope}_{stat}_{window}"
+    for scope in SCOPES
+    for window in WINDOWS
+    for stat in ("count", "amount")
+]
+
+
+class _RingWindow:
+    __slots__ = ("width", "n", "counts", "sums", "head", "count", "total")
+
+    def __init__(self, length, buckets):
+        self.width = length / buckets
+        self.n = buckets
+        self.counts = [0] * buckets
+        self.sums = [0.0] * buckets
+        self.head = None  # index of the newest bucket seen
+        self.count = 0
+        self.total = 0.0
+
+    def _advance(self, idx):
+        if self.head is None:
+            self.head = idx
+            return
+        if idx <= self.head:
+            return
+        if idx - self.head >= self.n:
+            # Whole window expired
+            self.counts = [0] * self.n
+            self.sums = [0.0] * self.n
+            self.count = 0
+            self.total = 0.0
+        else:
+            for i in range(self.head + 1, idx + 1):
+                slot = i % self.n
+                self.count -= self.counts[slot]
+                self.total -= self.sums[slot]
+                self.counts[slot] = 0
+                self.sums[slot] = 0.0
+        self.head = idx
+
+    def add(self, ts, amount):
+        idx = int(ts // self.width)
+        self._advance(idx)
+        if idx <= self.head - self.n:
+            return  # older than the window, nothing to count
+        slot = idx % self.n
+        self.counts[slot] += 1
+        self.sums[slot] += amount
+        self.count += 1
+        self.total += amount
+
+    def read(self, ts):
+        self._advance(int(ts // self.width))
+        return self.count, self.total
+
+
+class VelocityTracker:
+    """
+    Per-sender, per-receiver and per-(sender, receiver) transaction counts and
+    amount sums over the WINDOWS, kept in memory with bounded size. Time is the
+    transaction's own timestamp, so the same tracker can replay history offline.
+    """
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._keys = {scope: OrderedDict() for scope in SCOPES}
+        self._lock = threading.Lock()
+
+    def _windows(self, scope, key, create):
+        keys = self._keys[scope]
+        windows = keys.get(key)
+        if windows is None:
+            if not create:
+                return None
+            windows = {name: _RingWindow(*spec) for name, spec in WINDOWS.items()}
+            keys[key] = windows
+            if len(keys) > self.max_keys:
+                keys.popitem(last=False)
+        else:
+            keys.move_to_end(key)
+        return windows
+
+    @staticmethod
+    def _scope_keys(sender, receiver):
+        return {"sender": sender, "receiver": receiver, "pair": (sender, receiver)}
+
+    def record(self, sender, receiver, amount, dt) -> dict:
+        """Count one transaction and return the velocity features including it."""
+        ts = dt.timestamp()
+        features = {}
+        with self._lock:
+            for scope, key in self._scope_keys(sender, receiver).items():
+                for name, window in self._windows(scope, key, create=True).items():
+                    window.add(ts, amount)
+                    count, total = window.read(ts)
+                    features[f"{scope}_count_{name}"] = count
+                    features[f"{scope}_amount_{name}"] = round(total, 2)
+        return features
+
+    def record_many(self, transactions) -> list:
+        """record() for (sender, receiver, amount, dt) tuples, in order."""
+        return [self.record(*txn) for txn in transactions]
+
+    def features(self, sender, receiver, dt) -> dict:
+        """Read the current velocity features without counting a transaction."""
+        ts = dt.timestamp()
+        features = dict.fromkeys(VELOCITY_FEATURES, 0)
+        with self._lock:
+            for scope, key in self._scope_keys(sender, receiver).items():
+                windows = self._windows(scope, key, create=False)
+                if windows is None:
+                    continue
+                for name, window in windows.items():
+                    count, total = window.read(ts)
+                    features[f"{scope}_count_{name}"] = count
+                    features[f"{scope}_amount_{name}"] = round(total, 2)
+        return features
+
+    def stats(self) -> dict:
+        return {f"{scope}_keys": len(keys) for scope, keys in self._keys.items()}
+
+
+
+class SharedVelocityTracker:
+    """
+    The same features as VelocityTracker, kept in a shared_state backend so
+    every worker counts every transaction. Each window bucket is a pair of
+    counters (count, amount) that expires once it falls out of the window;
+    recording a transaction increments its bucket in every window and reads
+    the window's buckets back in one atomic transact() call.
+    """
+
+    def __init__(self, state, prefix="vel"):
+        self.state = state
+        self.prefix = prefix
+
+    def _bucket_key(self, scope, key, name, idx, stat):
+        return f"{self.prefix}:{name}:{scope}:{key}:{idx}:{stat}"
+
+    def _step(self, sender, receiver, amount, dt, count):
+        """(increments, reads) for one transaction; no increments when count is False."""
+        ts = dt.timestamp()
+        increments, reads = [], []
+        for scope, key in VelocityTracker._scope_keys(sender, receiver).items():
+            if scope == "pair":
+                key = "|".join(key)
+            for name, (length, buckets) in WINDOWS.items():
+                width = length / buckets
+                idx = int(ts // width)
+                if count:
+                    ttl = length + width
+                    increments.append((self._bucket_key(scope, key, name, idx, "c"), 1, ttl))
+                    increments.append((self._bucket_key(scope, key, name, idx, "a"), float(amount), ttl))
+                for i in range(idx - buckets + 1, idx + 1):
+                    reads.append(self._bucket_key(scope, key, name, i, "c"))
+                    reads.append(self._bucket_key(scope, key, name, i, "a"))
+        return increments, reads
+
+    @staticmethod
+    def _features(values) -> dict:
+        features = {}
+        pos = 0
+        for scope in SCOPES:
+            for name, (_, buckets) in WINDOWS.items():
+                window = values[pos:pos + 2 * buckets]
+                pos += 2 * buckets
+                features[f"{scope}_count_{name}"] = int(sum(window[0::2]))
+                features[f"{scope}_amount_{name}"] = round(sum(window[1::2]), 2)
+        return features
+
+    def record(self, sender, receiver, amount, dt) -> dict:
+        """Count one transaction and return the velocity features including it."""
+        return self.record_many([(sender, receiver, amount, dt)])[0]
+
+    def record_many(self, transactions) -> list:
+        """record() for (sender, receiver, amount, dt) tuples in order, in one round trip."""
+        steps = [self._step(*txn, count=True) for txn in transactions]
+        return [self._features(values) for values in self.state.transact(steps)]
+
+    def features(self, sender, receiver, dt) -> dict:
+        """Read the current velocity features without counting a transaction."""
+        _, reads = self._step(sender, receiver, 0.0, dt, count=False)
+        return self._features(self.state.get_many(reads))
+
+    def stats(self) -> dict:
+        return self.state.stats()